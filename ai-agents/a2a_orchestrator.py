@@ -1,20 +1,35 @@
 import os
 import json
 import asyncio
+import itertools
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import google.generativeai as genai
+
+from llm_backend import create_backend
+from model_router import ModelRouter
+from prompt_templates import PromptRegistry
+from fast_json import EncodingMetricsMiddleware, MeteredORJSONResponse, PreSerialized, encoding_stats
+from workflow_dag import WorkflowDAG
+from job_queue import REQUEST_PRIORITY_OFFSETS, Job, JobScheduler, QueueFull, job_priority
+from workflow_history import WorkflowHistory
+from history_store import SQLiteHistoryStore
+from ws_hub import ConnectionHub
+from ws_heartbeat import HeartbeatWheel
+from event_broker import create_broker
+from agent_pool import AgentBusy, AgentPool
 
 # Initialize FastAPI
 app = FastAPI(
     title="A2A Orchestrator - Multi-Agent Workflow Engine",
     description="Orchestrates agent-to-agent communication for complex AI operations",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=MeteredORJSONResponse
 )
 
 # Add CORS
@@ -25,18 +40,42 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(EncodingMetricsMiddleware)
 
 # Initialize Gemini
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+# LLM_BACKEND=fake runs without a key against a local stand-in
+llm_backend = create_backend(GEMINI_API_KEY)
+if llm_backend:
+    # Picks a Gemini tier per request class from latency SLOs and observed health
+    model_router = ModelRouter(backend=llm_backend)
 else:
-    model = None
+    model_router = None
     print("Warning: GEMINI_API_KEY not set, using simplified agent responses")
 
-# WebSocket connections
-active_connections: Dict[str, WebSocket] = {}
+# Fixed instructions live in the template prefix; only the variables change per request
+prompts = PromptRegistry()
+SUMMARY_PROMPT = prompts.register(
+    "workflow_summary",
+    prefix="""
+Summarize the workflow execution below in one clear sentence.
+Focus on the key outcomes and benefits. Keep it under 100 characters.
+""",
+    body="""
+Workflow: {workflow_name}
+Results: {results}...
+"""
+)
+
+# WebSocket connections, each with a bounded send queue
+connections = ConnectionHub(queue_size=int(os.environ.get("WS_SEND_QUEUE_SIZE", 256)))
+# Events are shared with the other replicas through a pub/sub broker (EVENT_BROKER_URL)
+broker = create_broker(connections.publish)
+# Shopper-facing store events every client gets without subscribing (the widget shows these)
+DEFAULT_EVENT_TYPES = ["price_drop", "low_stock"]
+# Protocol-level ping/pong is left to uvicorn; see the __main__ block
+WS_PING_INTERVAL_SECONDS = float(os.environ.get("WS_PING_INTERVAL_SECONDS", 20))
+WS_PING_TIMEOUT_SECONDS = float(os.environ.get("WS_PING_TIMEOUT_SECONDS", 20))
 
 # Agent simulation classes
 class SimpleAgent:
@@ -187,69 +226,106 @@ class SimpleAgent:
             "expected_engagement_lift": random.uniform(0.15, 0.45)
         }
 
-# Initialize agents with enhanced capabilities
+# Agent roles: name -> (role, capabilities)
+AGENT_ROLES = {
+    "pricing_agent": ("pricing", ["dynamic_pricing", "competitor_analysis", "discount_optimization"]),
+    "inventory_agent": ("inventory", ["stock_management", "demand_forecasting", "supply_optimization"]),
+    "customer_agent": ("customer", ["profile_analysis", "behavior_prediction", "segmentation"]),
+    "fraud_agent": ("fraud", ["risk_assessment", "transaction_monitoring", "pattern_detection"]),
+    "personalization_agent": ("personalization", ["content_curation", "recommendation_engine", "experience_optimization"])
+}
+
+def agent_setting(name: str, setting: str, default):
+    """Per-agent override (e.g. AGENT_WORKERS_FRAUD_AGENT), else the shared AGENT_<SETTING>"""
+    value = os.environ.get(f"AGENT_{setting}_{name.upper()}", os.environ.get(f"AGENT_{setting}"))
+    return type(default)(value) if value is not None else default
+
+# Each agent is a pool of workers behind a bounded mailbox, one SimpleAgent per worker
 agents = {
-    "pricing_agent": SimpleAgent(
-        "pricing_agent", 
-        "pricing", 
-        ["dynamic_pricing", "competitor_analysis", "discount_optimization"]
-    ),
-    "inventory_agent": SimpleAgent(
-        "inventory_agent", 
-        "inventory", 
-        ["stock_management", "demand_forecasting", "supply_optimization"]
-    ),
-    "customer_agent": SimpleAgent(
-        "customer_agent", 
-        "customer", 
-        ["profile_analysis", "behavior_prediction", "segmentation"]
-    ),
-    "fraud_agent": SimpleAgent(
-        "fraud_agent", 
-        "fraud", 
-        ["risk_assessment", "transaction_monitoring", "pattern_detection"]
-    ),
-    "personalization_agent": SimpleAgent(
-        "personalization_agent", 
-        "personalization", 
-        ["content_curation", "recommendation_engine", "experience_optimization"]
+    name: AgentPool(
+        lambda name=name, role=role, capabilities=capabilities: SimpleAgent(name, role, capabilities),
+        workers=agent_setting(name, "WORKERS", 4),
+        mailbox_size=agent_setting(name, "MAILBOX_SIZE", 64),
+        admission=agent_setting(name, "ADMISSION", "queue"),
+        admission_timeout=agent_setting(name, "ADMISSION_TIMEOUT_SECONDS", 2.0)
     )
+    for name, (role, capabilities) in AGENT_ROLES.items()
 }
 
+@app.on_event("startup")
+async def start_agents():
+    for pool in agents.values():
+        pool.start()
+
+@app.on_event("shutdown")
+async def stop_agents():
+    for pool in agents.values():
+        await pool.stop()
+
 # Workflow tracking
-workflow_history = []
+# Recent runs in memory; every run is also persisted to SQLite unless WORKFLOW_HISTORY_DB is empty
+WORKFLOW_HISTORY_DB = os.environ.get("WORKFLOW_HISTORY_DB", "/tmp/a2a_workflow_history.db")
+history_store = SQLiteHistoryStore(
+    WORKFLOW_HISTORY_DB,
+    max_rows=int(os.environ.get("WORKFLOW_HISTORY_MAX_ROWS", 1000000)),
+    retention_days=float(os.environ.get("WORKFLOW_HISTORY_RETENTION_DAYS", 30))
+) if WORKFLOW_HISTORY_DB else None
+workflow_history = WorkflowHistory(
+    max_records=int(os.environ.get("WORKFLOW_HISTORY_MAX_RECORDS", 10000)),
+    store=history_store
+)
 workflow_templates = {
     "customer_optimization": {
         "name": "Customer Experience Optimization",
         "description": "Comprehensive customer analysis and experience enhancement",
         "agents": ["customer_agent", "personalization_agent", "pricing_agent"],
-        "steps": ["analyze_customer", "generate_recommendations", "optimize_pricing"]
+        "steps": ["analyze_customer", "generate_recommendations", "optimize_pricing"],
+        "depends_on": {
+            "personalization_agent": ["customer_agent"],
+            "pricing_agent": ["customer_agent", "personalization_agent"]
+        }
     },
     "fraud_detection": {
         "name": "Fraud Detection and Prevention",
         "description": "Multi-layer fraud analysis and risk assessment",
+        "priority": "high",
         "agents": ["fraud_agent", "customer_agent"],
         "steps": ["assess_risk", "analyze_behavior", "make_decision"]
     },
     "inventory_optimization": {
         "name": "Inventory Management Optimization",
         "description": "Smart inventory management and demand forecasting",
+        "priority": "low",
         "agents": ["inventory_agent", "pricing_agent"],
-        "steps": ["analyze_stock", "forecast_demand", "optimize_pricing"]
+        "steps": ["analyze_stock", "forecast_demand", "optimize_pricing"],
+        "depends_on": {
+            "pricing_agent": ["inventory_agent"]
+        }
     },
     "price_adjustment": {
         "name": "Dynamic Price Adjustment",
         "description": "Real-time pricing optimization based on market conditions",
         "agents": ["pricing_agent", "inventory_agent", "customer_agent"],
-        "steps": ["analyze_market", "assess_inventory", "segment_customers", "set_prices"]
+        "steps": ["analyze_market", "assess_inventory", "segment_customers", "set_prices"],
+        "depends_on": {
+            "pricing_agent": ["inventory_agent", "customer_agent"]
+        }
     }
 }
 
+# Steps without `depends_on` entries have no dependencies and start immediately
+WORKFLOW_STEP_TIMEOUT_SECONDS = float(os.environ.get("WORKFLOW_STEP_TIMEOUT_SECONDS", 10))
+workflow_dags = {
+    name: WorkflowDAG.compile(name, template, agents, WORKFLOW_STEP_TIMEOUT_SECONDS)
+    for name, template in workflow_templates.items()
+}
+
 # Request models
 class WorkflowRequest(BaseModel):
     user_id: Optional[str] = None
     parameters: Dict = {}
-    priority: str = "normal"
+    priority: Literal["high", "normal", "low"] = "normal"
+    request_id: Optional[str] = None   # echoed on the run's events so callers can correlate them
 
 class AgentMessage(BaseModel):
     from_agent: str
@@ -258,24 +334,29 @@ class AgentMessage(BaseModel):
     payload: Dict
     correlation_id: str
 
+# Agents and templates are fixed at startup: encode them once
+ROOT_PAYLOAD = PreSerialized({
+    "service": "A2A Orchestrator",
+    "status": "operational",
+    "version": "1.0.0",
+    "active_agents": list(agents.keys()),
+    "available_workflows": list(workflow_templates.keys())
+})
+WORKFLOW_TEMPLATES_JSON = PreSerialized(workflow_templates)
+WORKFLOW_PLANS_JSON = PreSerialized({name: dag.describe() for name, dag in workflow_dags.items()})
+
 @app.get("/")
-async def root():
-    return {
-        "service": "A2A Orchestrator",
-        "status": "operational",
-        "version": "1.0.0",
-        "active_agents": list(agents.keys()),
-        "available_workflows": list(workflow_templates.keys())
-    }
+async def root(request: Request):
+    return ROOT_PAYLOAD.response(request)
 
 @app.get("/status")
 async def get_status():
     """Get comprehensive system status"""
-    return {
+    return MeteredORJSONResponse({
         "system_status": "operational",
         "active_agents": len(agents),
-        "active_connections": len(active_connections),
-        "total_workflows_executed": len(workflow_history),
+        "active_connections": len(connections),
+        "total_workflows_executed": workflow_history.total,
         "agents": {
             name: {
                 "status": "active",
@@ -287,18 +368,19 @@ async def get_status():
             }
             for name, agent in agents.items()
         },
-        "workflow_templates": workflow_templates,
-        "ai_model_available": bool(model)
-    }
+        "workflow_templates": WORKFLOW_TEMPLATES_JSON.fragment,
+        "ai_model_available": bool(model_router)
+    })
 
 @app.get("/workflows")
 async def list_workflows():
     """List available workflow templates"""
-    return {
-        "templates": workflow_templates,
+    return MeteredORJSONResponse({
+        "templates": WORKFLOW_TEMPLATES_JSON.fragment,
+        "execution_plans": WORKFLOW_PLANS_JSON.fragment,
         "custom_workflows_supported": True,
-        "execution_history": len(workflow_history)
-    }
+        "execution_history": workflow_history.total
+    })
 
 @app.post("/workflow/{workflow_name}")
 async def execute_workflow(workflow_name: str, request: WorkflowRequest = WorkflowRequest()):
@@ -307,48 +389,60 @@ async def execute_workflow(workflow_name: str, request: WorkflowRequest = Workfl
     if workflow_name not in workflow_templates:
         raise HTTPException(status_code=404, detail=f"Workflow '{workflow_name}' not found")
     
-    template = workflow_templates[workflow_name]
     workflow_id = f"{workflow_name}_{datetime.now().timestamp()}"
+    try:
+        return await run_workflow(workflow_name, workflow_id, request)
+    except AgentBusy as e:
+        raise HTTPException(status_code=503, detail=f"Workflow execution failed: {e}", headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Workflow execution failed: {str(e)}")
+
+async def run_workflow(workflow_name: str, workflow_id: str, request: WorkflowRequest) -> Dict:
+    """Run a workflow's steps as their dependencies complete, streaming progress"""
+    
+    template = workflow_templates[workflow_name]
+    dag = workflow_dags[workflow_name]
+    total_steps = len(dag.steps)
     results = []
+    started = time.perf_counter()
+    workflow_history.started(workflow_id)
+    
+    async def run_step(step, dependency_results: Dict[str, Dict]) -> Dict:
+        step_context = {
+            "workflow_id": workflow_id,
+            "step": step.index + 1,
+            "total_steps": total_steps,
+            "user_id": request.user_id,
+            "parameters": request.parameters,
+            "previous_results": list(dependency_results.values())
+        }
+        return await agents[step.agent].process(f"{workflow_name}_step_{step.index + 1}", step_context)
+    
+    async def on_step(step, result: Dict, seconds: float):
+        results.append(result)
+        # Broadcast progress to WebSocket clients as each step finishes
+        await broadcast_update({
+            "type": "workflow_progress",
+            "workflow_id": workflow_id,
+            "workflow_name": workflow_name,
+            "user_id": request.user_id,
+            "request_id": request.request_id,
+            "agent": step.agent,
+            "step": step.index + 1,
+            "completed_steps": len(results),
+            "total_steps": total_steps,
+            "status": "completed",
+            "step_duration": round(seconds, 3),
+            "result": result,
+            "timestamp": datetime.now().isoformat()
+        })
     
     try:
-        # Execute workflow based on template
-        for i, agent_name in enumerate(template["agents"]):
-            if agent_name not in agents:
-                continue
-                
-            agent = agents[agent_name]
-            step_context = {
-                "workflow_id": workflow_id,
-                "step": i + 1,
-                "total_steps": len(template["agents"]),
-                "user_id": request.user_id,
-                "parameters": request.parameters,
-                "previous_results": results
-            }
-            
-            # Execute agent processing
-            result = await agent.process(f"{workflow_name}_step_{i+1}", step_context)
-            results.append(result)
-            
-            # Broadcast progress to WebSocket clients
-            await broadcast_update({
-                "type": "workflow_progress",
-                "workflow_id": workflow_id,
-                "workflow_name": workflow_name,
-                "agent": agent_name,
-                "step": i + 1,
-                "total_steps": len(template["agents"]),
-                "status": "completed",
-                "result": result,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            # Small delay between agents for realism
-            await asyncio.sleep(0.2)
+        await dag.run(run_step, on_step)
         
         # Generate workflow summary
         summary = await generate_workflow_summary(workflow_name, results)
+        duration = round(time.perf_counter() - started, 3)
         
         # Store in history
         workflow_record = {
@@ -361,7 +455,7 @@ async def execute_workflow(workflow_name: str, request: WorkflowRequest = Workfl
             "results": results,
             "summary": summary,
             "status": "completed",
-            "duration": len(template["agents"]) * 0.2  # Approximate duration
+            "duration": duration
         }
         
         workflow_history.append(workflow_record)
@@ -370,6 +464,8 @@ async def execute_workflow(workflow_name: str, request: WorkflowRequest = Workfl
         await broadcast_update({
             "type": "workflow_completed",
             "workflow_id": workflow_id,
+            "user_id": request.user_id,
+            "request_id": request.request_id,
             "summary": summary,
             "total_agents": len(results),
             "timestamp": datetime.now().isoformat()
@@ -382,7 +478,8 @@ async def execute_workflow(workflow_name: str, request: WorkflowRequest = Workfl
             "agents_involved": len(results),
             "summary": summary,
             "results": results,
-            "execution_time": len(template["agents"]) * 0.2
+            "execution_time": duration,
+            "critical_path_steps": dag.depth
         }
         
     except Exception as e:
@@ -391,28 +488,103 @@ async def execute_workflow(workflow_name: str, request: WorkflowRequest = Workfl
             "id": workflow_id,
             "name": workflow_name,
             "timestamp": datetime.now().isoformat(),
+            "user_id": request.user_id,
             "status": "failed",
             "error": str(e),
             "partial_results": results
         }
         workflow_history.append(error_record)
-        
-        raise HTTPException(status_code=500, detail=f"Workflow execution failed: {str(e)}")
+        raise
+
+# Asynchronous job mode: queued by priority and run on a bounded worker pool
+async def run_job(job: Job) -> Dict:
+    return await run_workflow(job.workflow_name, job.id, job.request)
+
+async def broadcast_job(job: Job):
+    await broadcast_update({
+        "type": "job_update",
+        "job_id": job.id,
+        "workflow_name": job.workflow_name,
+        "user_id": job.request.user_id,
+        "request_id": job.request.request_id,
+        "priority": job.priority,
+        "status": job.status,
+        "error": job.error,
+        "timestamp": datetime.now().isoformat()
+    })
+    if job.status in ("completed", "failed"):
+        release_socket_job(job)
+
+job_scheduler = JobScheduler(
+    run=run_job,
+    workers=int(os.environ.get("WORKFLOW_WORKERS", 4)),
+    max_queue_depth=int(os.environ.get("WORKFLOW_MAX_QUEUE_DEPTH", 200)),
+    aging_seconds=float(os.environ.get("WORKFLOW_JOB_AGING_SECONDS", 10)),
+    on_change=broadcast_job
+)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_scheduler.stop()
+
+job_sequence = itertools.count(1)
+
+def submit_job(workflow_name: str, request: WorkflowRequest) -> Job:
+    """Queue a workflow job at its template's priority; raises QueueFull"""
+    priority = job_priority(workflow_templates[workflow_name].get("priority", "normal"), request.priority)
+    job_id = f"{workflow_name}_{datetime.now().timestamp()}_{next(job_sequence)}"
+    return job_scheduler.submit(Job(job_id, workflow_name, request, priority))
+
+@app.post("/jobs/{workflow_name}", status_code=202)
+async def submit_workflow_job(workflow_name: str, request: WorkflowRequest = WorkflowRequest()):
+    """Queue a workflow and return immediately with a job ID"""
+    
+    if workflow_name not in workflow_templates:
+        raise HTTPException(status_code=404, detail=f"Workflow '{workflow_name}' not found")
+    
+    try:
+        job = submit_job(workflow_name, request)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    
+    return MeteredORJSONResponse({
+        "job_id": job.id,
+        "workflow_name": workflow_name,
+        "priority": job.priority,
+        "status": job.status,
+        "queue_position": job_scheduler.position(job),
+        "status_url": f"/jobs/{job.id}"
+    }, status_code=202)
+
+@app.get("/jobs/{job_id}")
+async def get_workflow_job(job_id: str):
+    """Poll a queued workflow job"""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return {**job.to_dict(), "queue_position": job_scheduler.position(job)}
+
+@app.get("/jobs")
+async def get_job_queue():
+    """Job queue depth, wait times and throughput by priority"""
+    return job_scheduler.stats()
 
 async def generate_workflow_summary(workflow_name: str, results: List[Dict]) -> str:
     """Generate AI-powered workflow summary"""
     
-    if model:
+    if model_router:
         try:
-            prompt = f"""
-            Summarize this workflow execution in one clear sentence:
-            Workflow: {workflow_name}
-            Results: {json.dumps(results, indent=2)[:500]}...
-            
-            Focus on the key outcomes and benefits. Keep it under 100 characters.
-            """
+            prompt = SUMMARY_PROMPT.render(
+                workflow_name=workflow_name,
+                results=json.dumps(results, indent=2)[:500]
+            )
             
-            response = model.generate_content(prompt)
+            with model_router.route("summary", SUMMARY_PROMPT) as call:
+                response = await asyncio.to_thread(call.generate_content, prompt)
             return response.text.strip()[:100]
         except Exception as e:
             print(f"Summary generation error: {e}")
@@ -438,15 +610,18 @@ async def send_agent_message(message: AgentMessage):
     from_agent = agents[message.from_agent]
     to_agent = agents[message.to_agent]
     
-    # Process the message
-    response = await to_agent.process(
-        f"message_from_{message.from_agent}",
-        {
-            "message_type": message.message_type,
-            "payload": message.payload,
-            "correlation_id": message.correlation_id
-        }
-    )
+    # Process the message on one of the receiving agent's workers
+    try:
+        response = await to_agent.process(
+            f"message_from_{message.from_agent}",
+            {
+                "message_type": message.message_type,
+                "payload": message.payload,
+                "correlation_id": message.correlation_id
+            }
+        )
+    except AgentBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     
     # Broadcast the communication
     await broadcast_update({
@@ -465,76 +640,163 @@ async def send_agent_message(message: AgentMessage):
         "response": response
     }
 
+# One timer wheel heartbeats idle clients instead of a timer per connection
+heartbeats = HeartbeatWheel(
+    connections,
+    message=lambda: {
+        "type": "heartbeat",
+        "timestamp": datetime.now().isoformat(),
+        "active_workflows": len(workflow_history.running)
+    },
+    interval=float(os.environ.get("WS_HEARTBEAT_INTERVAL_SECONDS", 30)),
+    idle_timeout=float(os.environ.get("WS_IDLE_TIMEOUT_SECONDS", 0)),
+    tick=float(os.environ.get("WS_HEARTBEAT_TICK_SECONDS", 1))
+)
+
+@app.on_event("startup")
+async def start_heartbeats():
+    heartbeats.start()
+
+@app.on_event("shutdown")
+async def stop_heartbeats():
+    await heartbeats.stop()
+
+@app.on_event("startup")
+async def start_broker():
+    await broker.start()
+
+@app.on_event("shutdown")
+async def stop_broker():
+    await broker.stop()
+
+# Workflows started over a socket: job ID -> connection ID, and each connection's running jobs
+WS_MAX_INFLIGHT_WORKFLOWS = int(os.environ.get("WS_MAX_INFLIGHT_WORKFLOWS", 4))
+socket_job_owners: Dict[str, int] = {}
+socket_jobs: Dict[int, set] = {}
+socket_request_ids = itertools.count(1)
+
+def execute_from_socket(conn, command: Dict) -> Dict:
+    """Queue a workflow for a WebSocket client; its events stream back on the same socket"""
+    request_id = str(command.get("request_id") or f"ws_{next(socket_request_ids)}")
+    workflow_name = command.get("workflow")
+    if not isinstance(workflow_name, str) or workflow_name not in workflow_templates:
+        return {"type": "error", "request_id": request_id, "message": f"Workflow '{workflow_name}' not found"}
+    priority = command.get("priority") or "normal"
+    if not isinstance(priority, str) or priority not in REQUEST_PRIORITY_OFFSETS:
+        return {"type": "error", "request_id": request_id,
+                "message": f"Invalid priority {priority!r}: use {', '.join(REQUEST_PRIORITY_OFFSETS)}"}
+    running = socket_jobs.setdefault(conn.id, set())
+    if len(running) >= WS_MAX_INFLIGHT_WORKFLOWS:
+        return {"type": "error", "request_id": request_id,
+                "message": f"At most {WS_MAX_INFLIGHT_WORKFLOWS} workflows in flight per connection"}
+    try:
+        request = WorkflowRequest(
+            user_id=conn.user_id,
+            parameters=command.get("parameters") or {},
+            priority=priority,
+            request_id=request_id
+        )
+        job = submit_job(workflow_name, request)
+    except QueueFull as e:
+        return {"type": "error", "request_id": request_id, "message": str(e), "retry_after": 5}
+    except ValueError as e:
+        return {"type": "error", "request_id": request_id, "message": f"Invalid request: {e}"}
+    
+    running.add(job.id)
+    socket_job_owners[job.id] = conn.id
+    # Events carry the caller's user_id, so its default user topic already matches;
+    # the workflow topic also covers callers who unsubscribed from it
+    connections.subscribe(conn, f"workflow:{job.id}")
+    return {
+        "type": "workflow_started",
+        "request_id": request_id,
+        "job_id": job.id,
+        "workflow_name": workflow_name,
+        "priority": job.priority,
+        "queue_position": job_scheduler.position(job),
+        "message": f"Starting {workflow_name}..."
+    }
+
+def release_socket_job(job: Job):
+    conn_id = socket_job_owners.pop(job.id, None)
+    if conn_id is None:
+        return
+    running = socket_jobs.get(conn_id)
+    if running is not None:
+        running.discard(job.id)
+    conn = connections.connections.get(conn_id)
+    if conn is not None:
+        connections.unsubscribe(conn, f"workflow:{job.id}")
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
     """WebSocket for real-time workflow updates"""
     await websocket.accept()
-    active_connections[user_id] = websocket
+    # Everything sent to this client goes through its queue and writer task.
+    # It starts subscribed to its own user's events and the store-wide shopper events.
+    conn = connections.connect(
+        user_id, websocket, [f"user:{user_id}"] + [f"type:{t}" for t in DEFAULT_EVENT_TYPES]
+    )
     
     try:
         # Send initial connection message
-        await websocket.send_json({
+        conn.send({
             "type": "connection_established",
             "message": "Connected to A2A Orchestrator",
             "user_id": user_id,
             "available_workflows": list(workflow_templates.keys()),
             "active_agents": list(agents.keys()),
+            "subscriptions": sorted(conn.topics),
             "timestamp": datetime.now().isoformat()
         })
         
-        # Keep connection alive and handle incoming messages
+        # Handle incoming messages; heartbeats and idle timeouts are the wheel's job
         while True:
-            try:
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                
-                if data == "ping":
-                    await websocket.send_text("pong")
-                elif data.startswith("execute:"):
-                    # Quick workflow execution via WebSocket
-                    workflow_name = data.split(":", 1)[1]
-                    if workflow_name in workflow_templates:
-                        await websocket.send_json({
-                            "type": "workflow_started",
-                            "workflow_name": workflow_name,
-                            "message": f"Starting {workflow_name}..."
-                        })
-                        # Note: Full execution would happen via HTTP endpoint
+            data = await websocket.receive_text()
+            conn.received()
+            
+            if data == "ping":
+                conn.enqueue("pong")
+            elif data.startswith("{"):
+                # JSON commands: {"action": "subscribe" | "unsubscribe" | "execute", ...}
+                try:
+                    command = json.loads(data)
+                except ValueError:
+                    command = None
+                if not isinstance(command, dict):
+                    conn.send({"type": "error", "message": "Commands must be JSON objects"})
+                elif command.get("action") == "execute":
+                    conn.send(execute_from_socket(conn, command))
                 else:
-                    # Echo unknown commands
-                    await websocket.send_json({
-                        "type": "echo",
-                        "message": f"Received: {data}",
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-            except asyncio.TimeoutError:
-                # Send periodic heartbeat
-                await websocket.send_json({
-                    "type": "heartbeat",
-                    "timestamp": datetime.now().isoformat(),
-                    "active_workflows": len([w for w in workflow_history if w.get("status") == "running"])
+                    conn.send(connections.command(conn, command))
+            elif data.startswith("execute:"):
+                # Shorthand for {"action": "execute", "workflow": ...}
+                conn.send(execute_from_socket(conn, {"workflow": data.split(":", 1)[1]}))
+            else:
+                # Echo unknown commands
+                conn.send({
+                    "type": "echo",
+                    "message": f"Received: {data}",
+                    "timestamp": datetime.now().isoformat()
                 })
     
     except WebSocketDisconnect:
-        if user_id in active_connections:
-            del active_connections[user_id]
         print(f"WebSocket disconnected: {user_id}")
+    except RuntimeError:
+        pass   # socket already closed, e.g. dropped as a slow consumer
+    finally:
+        connections.disconnect(conn)
+        # Its workflows keep running; results stay available from /jobs/{job_id}
+        socket_jobs.pop(conn.id, None)
 
-async def broadcast_update(message: dict):
-    """Broadcast update to all connected WebSocket clients"""
-    if not active_connections:
-        return
-        
-    disconnected = []
-    for user_id, connection in active_connections.items():
-        try:
-            await connection.send_json(message)
-        except:
-            disconnected.append(user_id)
-    
-    # Clean up disconnected clients
-    for user_id in disconnected:
-        active_connections.pop(user_id, None)
+async def broadcast_update(message: dict) -> int:
+    """Publish an update to the WebSocket clients subscribed to it, on every replica
+
+    Returns the clients reached on this replica. The other replicas get it
+    in the broker's next batch.
+    """
+    # Encoded once and queued per client; never waits on a socket or the broker
+    return broker.publish(message)
 
 @app.get("/agents")
 async def list_agents():
@@ -549,7 +811,8 @@ async def list_agents():
                 "success_rate": agent.success_rate,
                 "avg_response_time": agent.average_response_time,
                 "last_activity": agent.last_activity.isoformat(),
-                "status": "active"
+                "status": "saturated" if agent.mailbox.full() else "active",
+                "pool": agent.stats()
             }
             for agent in agents.values()
         ],
@@ -557,15 +820,48 @@ async def list_agents():
         "total_capabilities": sum(len(agent.capabilities) for agent in agents.values())
     }
 
+@app.on_event("startup")
+async def start_history_store():
+    if history_store:
+        history_store.start()
+
+@app.on_event("shutdown")
+async def stop_history_store():
+    if history_store:
+        await history_store.stop()
+
 @app.get("/workflow-history")
-async def get_workflow_history(limit: int = 10):
-    """Get recent workflow execution history"""
+async def get_workflow_history(limit: int = 10, user_id: Optional[str] = None,
+                               workflow_name: Optional[str] = None, status: Optional[str] = None,
+                               since: Optional[datetime] = None, until: Optional[datetime] = None,
+                               before: Optional[int] = None):
+    """Get workflow execution history, newest page first; pass `next_cursor` as `before` for older pages"""
+    limit = min(max(limit, 1), 500)
+    if history_store:
+        page = await history_store.page(
+            limit, before=before, user_id=user_id, name=workflow_name, status=status,
+            since=since.timestamp() if since else None, until=until.timestamp() if until else None
+        )
+    elif workflow_name or status or since or until or before is not None:
+        raise HTTPException(status_code=400, detail="History filters and cursors need WORKFLOW_HISTORY_DB")
+    else:
+        page = {"workflows": workflow_history.recent(limit, user_id), "next_cursor": None}
     return {
-        "workflows": workflow_history[-limit:],
-        "total_executions": len(workflow_history),
-        "success_rate": len([w for w in workflow_history if w.get("status") == "completed"]) / max(len(workflow_history), 1)
+        **page,
+        "total_executions": workflow_history.total,
+        "success_rate": workflow_history.success_rate()
     }
 
+@app.get("/workflow-history/{workflow_id}")
+async def get_workflow_record(workflow_id: str):
+    """Get one workflow execution by ID"""
+    record = workflow_history.get(workflow_id)
+    if record is None and history_store:
+        record = await history_store.get(workflow_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Workflow '{workflow_id}' not found in history")
+    return record
+
 @app.post("/simulate-event")
 async def simulate_event(event_type: str, parameters: Dict = {}):
     """Simulate various system events for demonstration"""
@@ -607,24 +903,24 @@ async def simulate_event(event_type: str, parameters: Dict = {}):
     event["simulation"] = True
     
     # Broadcast event to all connected clients
-    await broadcast_update(event)
+    reached = await broadcast_update(event)
     
     return {
         "status": "event_simulated",
         "event": event,
-        "broadcasted_to": len(active_connections)
+        "broadcasted_to": reached
     }
 
 @app.get("/metrics")
 async def get_metrics():
     """Get comprehensive system metrics"""
     return {
-        "workflow_metrics": {
-            "total_executions": len(workflow_history),
-            "successful_executions": len([w for w in workflow_history if w.get("status") == "completed"]),
-            "failed_executions": len([w for w in workflow_history if w.get("status") == "failed"]),
-            "success_rate": len([w for w in workflow_history if w.get("status") == "completed"]) / max(len(workflow_history), 1)
-        },
+        "workflow_metrics": workflow_history.stats(),
+        "history_store": history_store.stats() if history_store else None,
+        "websocket_fanout": connections.stats(),
+        "websocket_heartbeat": heartbeats.stats(),
+        "event_broker": broker.stats(),
+        "agent_pools": {name: pool.stats() for name, pool in agents.items()},
         "agent_metrics": {
             "total_agents": len(agents),
             "total_messages_processed": sum(agent.message_count for agent in agents.values()),
@@ -632,11 +928,15 @@ async def get_metrics():
             "most_active_agent": max(agents.values(), key=lambda a: a.message_count).name if agents else None
         },
         "system_metrics": {
-            "active_websocket_connections": len(active_connections),
+            "active_websocket_connections": len(connections),
             "uptime": "operational",
-            "ai_model_available": bool(model),
+            "ai_model_available": bool(model_router),
             "memory_usage": "normal"
-        }
+        },
+        "model_routing": model_router.stats() if model_router else None,
+        "prompt_templates": prompts.stats(),
+        "job_queue": job_scheduler.stats(),
+        "json_encoding": encoding_stats.stats()
     }
 
 if __name__ == "__main__":
@@ -646,5 +946,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=port,
         log_level="info",
-        access_log=True
+        access_log=True,
+        ws_ping_interval=WS_PING_INTERVAL_SECONDS,
+        ws_ping_timeout=WS_PING_TIMEOUT_SECONDS
     )
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Per-agent worker pools with bounded mailboxes.
+
+Each agent role is served by a fixed number of workers, and each worker
+owns its own agent instance. Callers post a task to the pool's bounded
+mailbox and await the result, so at most `workers` tasks run at once per
+role. When the mailbox is full:
+
+- with `admission="queue"`, the caller waits up to `admission_timeout`
+  for space;
+- with `admission="reject"`, the caller is turned away at once.
+
+Either way, a caller that is not admitted gets `AgentBusy`. One saturated
+agent then fails fast instead of piling up unbounded work that slows
+every workflow sharing it.
+
+Time spent waiting in the mailbox and time spent processing are measured
+separately, as rolling percentiles. A caller that gives up (a step
+timeout) cancels its task, whether it is still queued or already
+running.
+"""
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from latency_stats import percentiles
+
+ADMISSION_POLICIES = ("queue", "reject")
+
+
+class AgentBusy(Exception):
+    def __init__(self, agent: str, depth: int):
+        super().__init__(f"Agent {agent} is saturated ({depth} tasks waiting)")
+        self.agent = agent
+        self.depth = depth
+
+
+class AgentPool:
+    """Workers for one agent role, fed from a bounded mailbox
+
+    `factory()` builds one agent per worker. The pool stands in for a
+    single agent: `process(task, context)` has the same signature, and the
+    agent's stats are aggregated over the workers.
+    """
+
+    def __init__(self, factory: Callable[[], Any], workers: int = 4, mailbox_size: int = 64,
+                 admission: str = "queue", admission_timeout: float = 2.0, latency_samples: int = 2000):
+        if admission not in ADMISSION_POLICIES:
+            raise ValueError(f"Unknown admission policy: {admission}")
+        if mailbox_size < 1:
+            # asyncio.Queue treats 0 as unbounded, which would remove the backpressure
+            raise ValueError(f"Mailbox size must be at least 1, got {mailbox_size}")
+        self.agents = [factory() for _ in range(max(workers, 1))]
+        self.name = self.agents[0].name
+        self.role = self.agents[0].role
+        self.capabilities = self.agents[0].capabilities
+        self.mailbox_size = mailbox_size
+        self.admission = admission
+        self.admission_timeout = admission_timeout
+        self.mailbox: asyncio.Queue = asyncio.Queue(maxsize=mailbox_size)
+        self.tasks: List[asyncio.Task] = []
+        self.busy = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wait_seconds: deque = deque(maxlen=latency_samples)
+        self.processing_seconds: deque = deque(maxlen=latency_samples)
+
+    async def process(self, task: str, context: Dict = None) -> Dict:
+        """Run `task` on the next free worker; raises AgentBusy if not admitted"""
+        future = asyncio.get_running_loop().create_future()
+        item = (task, context, future, time.perf_counter())
+        try:
+            if self.admission == "reject":
+                self.mailbox.put_nowait(item)
+            else:
+                await asyncio.wait_for(self.mailbox.put(item), timeout=self.admission_timeout)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            raise AgentBusy(self.name, self.mailbox.qsize())
+        self.admitted += 1
+        return await future
+
+    async def _worker(self, agent):
+        while True:
+            task, context, future, enqueued = await self.mailbox.get()
+            if future.done():
+                # The caller gave up while the task was queued
+                self.cancelled += 1
+                continue
+            started = time.perf_counter()
+            self.wait_seconds.append(started - enqueued)
+            self.busy += 1
+            work = asyncio.ensure_future(agent.process(task, context))
+            # A caller that gives up (step timeout) cancels the work too
+            future.add_done_callback(lambda f, work=work: work.cancel() if f.cancelled() else None)
+            try:
+                result = await work
+                if not future.done():
+                    future.set_result(result)
+                self.completed += 1
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise   # the pool is stopping
+                self.cancelled += 1
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                self.failed += 1
+            finally:
+                self.processing_seconds.append(time.perf_counter() - started)
+                self.busy -= 1
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker(agent)) for agent in self.agents]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    # Aggregate agent stats, read by /agents and /metrics
+
+    @property
+    def message_count(self) -> int:
+        return sum(agent.message_count for agent in self.agents)
+
+    @property
+    def success_rate(self) -> float:
+        return sum(agent.success_rate for agent in self.agents) / len(self.agents)
+
+    @property
+    def average_response_time(self) -> float:
+        if not self.processing_seconds:
+            return self.agents[0].average_response_time
+        return round(sum(self.processing_seconds) / len(self.processing_seconds), 3)
+
+    @property
+    def last_activity(self) -> datetime:
+        return max(agent.last_activity for agent in self.agents)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self.agents),
+            "busy": self.busy,
+            "mailbox_depth": self.mailbox.qsize(),
+            "mailbox_size": self.mailbox_size,
+            "admission": self.admission,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "queue_wait_ms": percentiles(self.wait_seconds),
+            "processing_ms": percentiles(self.processing_seconds)
+        }
@@ -2,7 +2,7 @@ import os
 import asyncio
 from typing import Optional
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
 import uvicorn
@@ -11,7 +11,8 @@ import uvicorn
 app = FastAPI(
     title="AI Gateway - Frontend Integration Layer", 
     description="Proxies requests to Online Boutique while injecting AI widget",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS
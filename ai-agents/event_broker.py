@@ -0,0 +1,407 @@
+"""Cross-replica event fan-out through a pub/sub broker.
+
+Every replica publishes its WebSocket events to a shared channel and
+delivers the events it receives from other replicas to its own clients.
+A workflow running on one pod can therefore reach a client connected to
+another.
+
+- Local clients are served directly, without waiting for the broker.
+- Outgoing events are batched: a batch is sent once `batch_size` events
+  are waiting or `batch_interval` has passed. Each replica sends one
+  message per batch, not per event.
+- Every event is stamped with `origin` (the publishing replica instance)
+  and `seq`, which counts up by one per event from that origin. A client
+  following an origin's events, and each receiving replica, can detect
+  lost events as gaps in `seq`. Receivers count the gaps they see.
+- Latency is measured separately for local and cross-replica delivery:
+  from publish to the hand-off to the local hub.
+
+Backends:
+- `InMemoryBroker`: replicas attached to one in-process `InMemoryBus`.
+  Used for single-replica deployments and tests. A broker that is alone
+  on its bus does no batching at all.
+- `RedisBroker`: Redis PUBLISH/SUBSCRIBE, spoken directly over asyncio
+  streams (only those two commands are needed). It reconnects with
+  backoff. `LocalRedisServer` is a minimal stand-in for local testing.
+  Run this module for a two-replica round trip through it.
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import orjson
+
+from latency_stats import percentiles
+
+
+def replica_id() -> str:
+    """Unique per process start, so a restarted replica's sequence starts a new stream"""
+    return f"{os.environ.get('HOSTNAME') or socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+
+
+class EventBroker(ABC):
+    """Batching, sequencing and delivery shared by all backends
+
+    `deliver(message)` hands a message to this replica's clients and
+    returns how many it reached (the WebSocket hub's `publish`). Backends
+    implement `send` and may override `has_peers`.
+    """
+
+    name = "base"
+
+    def __init__(self, deliver: Callable[[Dict], int], batch_size: int = 100,
+                 batch_interval: float = 0.005, max_pending: int = 10000, latency_samples: int = 10000):
+        self.deliver = deliver
+        self.origin = replica_id()
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_pending = max_pending
+        self.seq = 0
+        self.pending: List[list] = []   # [seq, published_at, message]
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.last_seq: Dict[str, int] = {}
+        self.published = 0
+        self.batches_sent = 0
+        self.events_sent = 0
+        self.batches_received = 0
+        self.remote_events = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.send_errors = 0
+        self.local_latency: deque = deque(maxlen=latency_samples)
+        self.remote_latency: deque = deque(maxlen=latency_samples)
+
+    def publish(self, message: Dict) -> int:
+        """Deliver locally now and queue for the other replicas; returns local clients reached"""
+        published_at = time.time()
+        self.seq += 1
+        message["origin"] = self.origin
+        message["seq"] = self.seq
+        self.published += 1
+        reached = self.deliver(message)
+        self.local_latency.append(time.time() - published_at)
+        if not self.has_peers():
+            return reached
+
+        self.pending.append([self.seq, published_at, message])
+        if len(self.pending) > self.max_pending:
+            del self.pending[0]
+            self.dropped += 1
+        if len(self.pending) == 1 or len(self.pending) >= self.batch_size:
+            self.wake.set()   # a batch has started, or is full
+        return reached
+
+    def receive(self, payload: bytes):
+        """Deliver a batch from the channel to local clients"""
+        batch = orjson.loads(payload)
+        origin = batch["origin"]
+        if origin == self.origin:
+            return   # our own batch, already delivered locally
+        self.batches_received += 1
+        now = time.time()
+        for seq, published_at, message in batch["events"]:
+            last = self.last_seq.get(origin)
+            if last is not None and seq > last + 1:
+                self.gaps += seq - last - 1
+            self.last_seq[origin] = max(seq, last or 0)
+            self.remote_events += 1
+            self.deliver(message)
+            self.remote_latency.append(time.time() - published_at if published_at <= now else 0.0)
+
+    def has_peers(self) -> bool:
+        """Whether other replicas may be listening; batches are only built if so"""
+        return True
+
+    @abstractmethod
+    async def send(self, payload: bytes):
+        """Publish one encoded batch to the channel"""
+
+    async def flush(self):
+        while self.pending:
+            events, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            payload = orjson.dumps({"origin": self.origin, "events": events}, option=orjson.OPT_NON_STR_KEYS)
+            try:
+                await self.send(payload)
+                self.batches_sent += 1
+                self.events_sent += len(events)
+            except Exception as e:
+                self.send_errors += 1
+                print(f"Event broker send error ({len(events)} events not shared): {e}")
+
+    async def _run(self):
+        # Idle until a batch starts, then collect for up to batch_interval
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            if len(self.pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout=self.batch_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+            await self.flush()
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "origin": self.origin,
+            "published": self.published,
+            "pending": len(self.pending),
+            "batches_sent": self.batches_sent,
+            "avg_batch_size": round(self.events_sent / self.batches_sent, 2) if self.batches_sent else 0.0,
+            "batches_received": self.batches_received,
+            "remote_events": self.remote_events,
+            "remote_origins": len(self.last_seq),
+            "sequence_gaps": self.gaps,
+            "dropped": self.dropped,
+            "send_errors": self.send_errors,
+            "local_delivery_ms": percentiles(self.local_latency),
+            "remote_delivery_ms": percentiles(self.remote_latency)
+        }
+
+
+class InMemoryBus:
+    """In-process channel shared by InMemoryBroker replicas"""
+
+    def __init__(self):
+        self.brokers: List["InMemoryBroker"] = []
+
+
+class InMemoryBroker(EventBroker):
+    name = "memory"
+
+    def __init__(self, deliver: Callable[[Dict], int], bus: Optional[InMemoryBus] = None, **kwargs):
+        super().__init__(deliver, **kwargs)
+        self.bus = bus or InMemoryBus()
+        self.bus.brokers.append(self)
+
+    def has_peers(self) -> bool:
+        return len(self.bus.brokers) > 1
+
+    async def send(self, payload: bytes):
+        for broker in self.bus.brokers:
+            broker.receive(payload)
+
+
+# Redis serialization protocol (RESP2), just enough for PUBLISH / SUBSCRIBE
+
+def _command(*parts: bytes) -> bytes:
+    out = [b"*%d\r\n" % len(parts)]
+    for part in parts:
+        out.append(b"$%d\r\n%s\r\n" % (len(part), part))
+    return b"".join(out)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise ConnectionError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        return [await _read_reply(reader) for _ in range(int(rest))]
+    raise ConnectionError(f"Unexpected reply: {line!r}")
+
+
+class RedisBroker(EventBroker):
+    name = "redis"
+
+    def __init__(self, deliver: Callable[[Dict], int], url: str, channel: str = "a2a-events", **kwargs):
+        super().__init__(deliver, **kwargs)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel.encode()
+        self.publisher: Optional[tuple] = None
+        self.subscriber: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    async def _connect(self) -> tuple:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(_command(b"AUTH", self.password.encode()))
+            await writer.drain()
+            await _read_reply(reader)
+        return reader, writer
+
+    async def send(self, payload: bytes):
+        for attempt in range(2):
+            try:
+                if self.publisher is None:
+                    self.publisher = await self._connect()
+                reader, writer = self.publisher
+                writer.write(_command(b"PUBLISH", self.channel, payload))
+                await writer.drain()
+                await _read_reply(reader)
+                return
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                self._close_publisher()
+                if attempt:
+                    raise
+
+    def _close_publisher(self):
+        if self.publisher is not None:
+            self.publisher[1].close()
+            self.publisher = None
+
+    async def _subscribe(self):
+        backoff = 0.1
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                writer.write(_command(b"SUBSCRIBE", self.channel))
+                await writer.drain()
+                backoff = 0.1
+                while True:
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, list) and reply and reply[0] == b"message":
+                        try:
+                            self.receive(reply[2])
+                        except Exception as e:
+                            print(f"Event broker delivery error: {e}")
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                self.reconnects += 1
+                print(f"Event broker subscription lost ({e}); reconnecting in {backoff:.1f}s")
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 5.0)
+
+    async def start(self):
+        self.subscriber = asyncio.create_task(self._subscribe())
+        await super().start()
+
+    async def stop(self):
+        await super().stop()
+        if self.subscriber is not None:
+            self.subscriber.cancel()
+            await asyncio.gather(self.subscriber, return_exceptions=True)
+            self.subscriber = None
+        self._close_publisher()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "server": f"{self.host}:{self.port}", "reconnects": self.reconnects}
+
+
+class LocalRedisServer:
+    """Minimal Redis stand-in: PING, PUBLISH, SUBSCRIBE"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.channels: Dict[bytes, set] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed = []
+        try:
+            while True:
+                parts = await _read_reply(reader)
+                command = parts[0].upper()
+                if command == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif command == b"AUTH":
+                    writer.write(b"+OK\r\n")
+                elif command == b"PUBLISH":
+                    receivers = self.channels.get(parts[1], set())
+                    for receiver in receivers:
+                        receiver.write(_command(b"message", parts[1], parts[2]))
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif command == b"SUBSCRIBE":
+                    for index, channel in enumerate(parts[1:], 1):
+                        self.channels.setdefault(channel, set()).add(writer)
+                        subscribed.append(channel)
+                        writer.write(b"*3\r\n$9\r\nsubscribe\r\n$%d\r\n%s\r\n:%d\r\n" % (len(channel), channel, index))
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, IndexError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+def create_broker(deliver: Callable[[Dict], int]) -> EventBroker:
+    """Redis when `EVENT_BROKER_URL` is set, otherwise in-memory (this replica only)"""
+    url = os.environ.get("EVENT_BROKER_URL", "")
+    options = {
+        "batch_size": int(os.environ.get("EVENT_BROKER_BATCH_SIZE", 100)),
+        "batch_interval": float(os.environ.get("EVENT_BROKER_BATCH_MS", 5)) / 1000
+    }
+    if url:
+        return RedisBroker(deliver, url, os.environ.get("EVENT_BROKER_CHANNEL", "a2a-events"), **options)
+    return InMemoryBroker(deliver, **options)
+
+
+if __name__ == "__main__":
+    # Two replicas through the local stand-in: events published on A reach B's clients
+    async def round_trip(events: int = 2000):
+        server = LocalRedisServer()
+        url = await server.start()
+        received: List[Dict] = []
+        replica_a = RedisBroker(lambda message: 0, url)
+        replica_b = RedisBroker(lambda message: received.append(message) or 1, url)
+        await replica_a.start()
+        await replica_b.start()
+        await asyncio.sleep(0.2)   # let the subscriptions settle
+        for i in range(events):
+            replica_a.publish({"type": "workflow_progress", "workflow_id": "bench", "step": i})
+            if i % 50 == 0:
+                await asyncio.sleep(0)
+        await asyncio.sleep(0.5)
+        stats_a, stats_b = replica_a.stats(), replica_b.stats()
+        print(f"{events} events A->B: {len(received)} delivered, {stats_a['batches_sent']} batches "
+              f"(avg {stats_a['avg_batch_size']}), gaps={stats_b['sequence_gaps']}, "
+              f"local p50={stats_a['local_delivery_ms']['p50']}ms, "
+              f"cross-replica p50={stats_b['remote_delivery_ms']['p50']}ms p99={stats_b['remote_delivery_ms']['p99']}ms")
+        await replica_a.stop()
+        await replica_b.stop()
+        await server.stop()
+
+    asyncio.run(round_trip())
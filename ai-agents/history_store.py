@@ -0,0 +1,280 @@
+"""Durable workflow history in SQLite (WAL mode).
+
+Request handlers only append finished records to an in-memory buffer. A
+background task writes the buffer in batches, one transaction per batch,
+on a worker thread, so database I/O never runs on the event loop. In WAL
+mode readers do not block that writer. If the buffer fills, for example
+because the disk stalls, the oldest unwritten records are dropped and
+counted rather than slowing requests down.
+
+Records are indexed by user, template, status and time. Queries page with
+a keyset cursor (the row's `seq`), so deep pages cost the same as the
+first. The first page also includes matching records that are still
+waiting to be written, so a workflow shows up as soon as it finishes.
+Retention keeps at most `max_rows` rows and nothing older than
+`retention_days`. Compaction deletes the excess, checkpoints the WAL and
+returns free pages to the filesystem.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflow_runs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    name TEXT,
+    user_id TEXT,
+    status TEXT,
+    ts REAL NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_id ON workflow_runs (id);
+CREATE INDEX IF NOT EXISTS idx_runs_user ON workflow_runs (user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_runs_name ON workflow_runs (name, seq);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON workflow_runs (status, seq);
+CREATE INDEX IF NOT EXISTS idx_runs_ts ON workflow_runs (ts);
+"""
+
+
+def record_time(record: Dict) -> float:
+    try:
+        return datetime.fromisoformat(record["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class SQLiteHistoryStore:
+    """Batched, non-blocking writer and keyset-paginated reader for workflow records"""
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_pending: int = 10000, max_rows: int = 1000000, retention_days: float = 30,
+                 compact_interval: float = 3600):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_rows = max_rows
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self.pending: List[Dict] = []
+        self.writing: List[Dict] = []   # the batch being written, not yet readable
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.writer = self._connect()
+        self.writer.executescript(SCHEMA)
+        self.reader = self._connect()
+        self.write_lock = threading.Lock()
+        self.read_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+        self.compactions = 0
+        self.compacted_rows = 0
+        self.last_compaction: Optional[float] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # Only takes effect on a new database, so it must come before anything initializes the file
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    # Writes
+
+    def append(self, record: Dict):
+        """Buffer a record for the next batch; never blocks"""
+        self.pending.append(record)
+        if len(self.pending) > self.max_pending:
+            del self.pending[0]
+            self.dropped += 1
+        if len(self.pending) >= self.batch_size:
+            self.wake.set()
+
+    def _write_batch(self, batch: List[Dict]):
+        rows = [
+            (record["id"], record.get("name"), record.get("user_id"), record.get("status"),
+             record_time(record), orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS))
+            for record in batch
+        ]
+        with self.write_lock:
+            self.writer.execute("BEGIN")
+            try:
+                self.writer.executemany(
+                    "INSERT OR REPLACE INTO workflow_runs (id, name, user_id, status, ts, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                self.writer.execute("COMMIT")
+            except Exception:
+                self.writer.execute("ROLLBACK")
+                raise
+
+    async def flush(self):
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            start = time.perf_counter()
+            self.writing = batch
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                self.write_errors += 1
+                print(f"History store write error ({len(batch)} records lost): {e}")
+                continue
+            finally:
+                self.writing = []
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flush_ms_total += elapsed_ms
+            self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+            self.written += len(batch)
+            self.batches += 1
+
+    async def _run(self):
+        next_compaction = time.time() + self.compact_interval
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            await self.flush()
+            if time.time() >= next_compaction:
+                await self.compact()
+                next_compaction = time.time() + self.compact_interval
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    # Retention
+
+    def _compact(self) -> int:
+        cutoff = time.time() - self.retention_days * 86400
+        with self.write_lock:
+            deleted = self.writer.execute("DELETE FROM workflow_runs WHERE ts < ?", (cutoff,)).rowcount
+            row = self.writer.execute(
+                "SELECT seq FROM workflow_runs ORDER BY seq DESC LIMIT 1 OFFSET ?", (self.max_rows,)
+            ).fetchone()
+            if row is not None:
+                deleted += self.writer.execute("DELETE FROM workflow_runs WHERE seq <= ?", (row[0],)).rowcount
+            self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.writer.execute("PRAGMA incremental_vacuum")
+        return deleted
+
+    async def compact(self):
+        try:
+            deleted = await asyncio.to_thread(self._compact)
+        except Exception as e:
+            print(f"History store compaction error: {e}")
+            return
+        self.compactions += 1
+        self.compacted_rows += deleted
+        self.last_compaction = time.time()
+
+    # Reads
+
+    def _query(self, sql: str, params: tuple) -> List[tuple]:
+        with self.read_lock:
+            return self.reader.execute(sql, params).fetchall()
+
+    async def page(self, limit: int = 10, before: Optional[int] = None, user_id: Optional[str] = None,
+                   name: Optional[str] = None, status: Optional[str] = None,
+                   since: Optional[float] = None, until: Optional[float] = None) -> Dict:
+        """Newest matching records before the `before` cursor, oldest first, with the next cursor
+
+        Without a cursor, matching records not yet written come first: they
+        are newer than every stored row.
+        """
+        unwritten: List[Dict] = []
+        if before is None:
+            for record in reversed(self.writing + self.pending):
+                if len(unwritten) == limit:
+                    break
+                if ((user_id is None or record.get("user_id") == user_id)
+                        and (name is None or record.get("name") == name)
+                        and (status is None or record.get("status") == status)
+                        and (since is None or record_time(record) >= since)
+                        and (until is None or record_time(record) < until)):
+                    unwritten.append(record)
+            unwritten.reverse()
+            if len(unwritten) == limit:
+                # The page is all unwritten records; older pages start at the newest stored
+                # row, so unwritten records that did not fit are not paged to
+                rows = await asyncio.to_thread(self._query, "SELECT MAX(seq) FROM workflow_runs", ())
+                newest = rows[0][0]
+                return {"workflows": unwritten, "next_cursor": newest + 1 if newest is not None else None}
+            limit -= len(unwritten)
+        clauses, params = [], []
+        for column, value in (("user_id", user_id), ("name", name), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before is not None:
+            clauses.append("seq < ?")
+            params.append(before)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        rows = await asyncio.to_thread(
+            self._query, f"SELECT seq, record FROM workflow_runs {where} ORDER BY seq DESC LIMIT ?", tuple(params)
+        )
+        rows.reverse()
+        # A record rewritten while still unwritten is listed once, in its newest form
+        unwritten_ids = {record["id"] for record in unwritten}
+        stored = [orjson.loads(record) for _, record in rows]
+        return {
+            "workflows": [record for record in stored if record["id"] not in unwritten_ids] + unwritten,
+            "next_cursor": rows[0][0] if len(rows) == limit else None
+        }
+
+    async def get(self, workflow_id: str) -> Optional[Dict]:
+        for record in reversed(self.writing + self.pending):
+            if record["id"] == workflow_id:
+                return record
+        rows = await asyncio.to_thread(self._query, "SELECT record FROM workflow_runs WHERE id = ?", (workflow_id,))
+        return orjson.loads(rows[0][0]) if rows else None
+
+    def counts(self) -> List[tuple]:
+        """(template, status, count) for every stored record, to seed counters at startup"""
+        return self._query("SELECT name, status, COUNT(*) FROM workflow_runs GROUP BY name, status", ())
+
+    def stats(self) -> Dict:
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        return {
+            "path": self.path,
+            "pending": len(self.pending),
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "avg_flush_ms": round(self.flush_ms_total / self.batches, 2) if self.batches else 0.0,
+            "max_flush_ms": round(self.flush_ms_max, 2),
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "compactions": self.compactions,
+            "compacted_rows": self.compacted_rows,
+            "last_compaction": self.last_compaction,
+            "size_bytes": size
+        }
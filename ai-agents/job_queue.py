@@ -0,0 +1,221 @@
+"""Asynchronous workflow jobs on a bounded priority queue.
+
+Submitting a job returns at once. A fixed pool of workers runs queued jobs,
+and the results can be polled or followed over the WebSocket.
+
+- Priorities are levels (`high`, `normal`, `low`). Each level is a FIFO,
+  so taking the next job only compares the heads of a few queues.
+- To keep low levels from starving, a job is promoted one level for every
+  `aging_seconds` it has waited. The next job is the head with the best
+  aged level, with ties going to the oldest.
+- Queue depth is bounded. The last `reserved_share` of capacity only
+  accepts `high` jobs, so a flood of background work cannot lock out
+  urgent work. Rejected submissions raise `QueueFull`.
+- Finished jobs are kept for polling up to `max_finished`, oldest dropped
+  first.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+PRIORITY_LEVELS = {"high": 0, "normal": 1, "low": 2}
+# A request's priority shifts its template's default level by this much
+REQUEST_PRIORITY_OFFSETS = {"high": -1, "normal": 0, "low": 1}
+
+
+def job_priority(template_priority: str, request_priority: str) -> str:
+    """Level for a job from its template's default and the request's hint"""
+    names = list(PRIORITY_LEVELS)
+    level = PRIORITY_LEVELS.get(template_priority, PRIORITY_LEVELS["normal"])
+    level += REQUEST_PRIORITY_OFFSETS.get(request_priority, 0)
+    return names[min(max(level, 0), len(names) - 1)]
+
+
+class QueueFull(Exception):
+    def __init__(self, priority: str, depth: int):
+        super().__init__(f"Job queue full for {priority} priority jobs ({depth} queued)")
+        self.priority = priority
+        self.depth = depth
+
+
+class Job:
+    __slots__ = ("id", "workflow_name", "request", "priority", "status", "submitted_at",
+                 "started_at", "finished_at", "result", "error")
+
+    def __init__(self, job_id: str, workflow_name: str, request: Any, priority: str):
+        self.id = job_id
+        self.workflow_name = workflow_name
+        self.request = request
+        self.priority = priority
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "workflow_name": self.workflow_name,
+            "priority": self.priority,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_seconds": round((self.started_at or time.time()) - self.submitted_at, 3),
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobScheduler:
+    """Priority queue of workflow jobs drained by a bounded worker pool"""
+
+    def __init__(self, run: Callable[[Job], Awaitable[Dict]], workers: int = 4,
+                 max_queue_depth: int = 200, reserved_share: float = 0.2,
+                 aging_seconds: float = 10.0, max_finished: int = 10000,
+                 on_change: Optional[Callable[[Job], Awaitable[None]]] = None):
+        self.run = run
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.reserved_share = reserved_share
+        self.aging_seconds = aging_seconds
+        self.max_finished = max_finished
+        self.on_change = on_change
+        self.levels: Dict[str, deque] = {name: deque() for name in PRIORITY_LEVELS}
+        self.jobs: Dict[str, Job] = {}
+        self.finished: deque = deque()   # finished job ids, oldest first
+        self.depth = 0
+        self.running = 0
+        self.available = asyncio.Semaphore(0)
+        self.tasks: List[asyncio.Task] = []
+        self.submitted = {name: 0 for name in PRIORITY_LEVELS}
+        self.rejected = {name: 0 for name in PRIORITY_LEVELS}
+        self.completed = 0
+        self.failed = 0
+        self.promoted = 0
+        self.waits = {name: deque(maxlen=500) for name in PRIORITY_LEVELS}
+
+    def submit(self, job: Job) -> Job:
+        limit = self.max_queue_depth
+        if job.priority != "high":
+            limit = int(self.max_queue_depth * (1 - self.reserved_share))
+        if self.depth >= limit:
+            self.rejected[job.priority] += 1
+            raise QueueFull(job.priority, self.depth)
+        self.levels[job.priority].append(job)
+        self.jobs[job.id] = job
+        self.depth += 1
+        self.submitted[job.priority] += 1
+        self.available.release()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """Jobs ahead of this one at its own level (None once it has started)"""
+        if job.status != "queued":
+            return None
+        for index, queued in enumerate(self.levels[job.priority]):
+            if queued is job:
+                return index
+        return None
+
+    def _next(self, now: float) -> Job:
+        best_name, best_key = None, None
+        for name, level in PRIORITY_LEVELS.items():
+            queue = self.levels[name]
+            if not queue:
+                continue
+            head = queue[0]
+            aged = level - (now - head.submitted_at) / self.aging_seconds
+            key = (aged, head.submitted_at)
+            if best_key is None or key < best_key:
+                best_name, best_key = name, key
+        if any(self.levels[name] for name, level in PRIORITY_LEVELS.items()
+               if level < PRIORITY_LEVELS[best_name]):
+            self.promoted += 1   # aging let it go ahead of a better level
+        self.depth -= 1
+        return self.levels[best_name].popleft()
+
+    async def _worker(self):
+        while True:
+            await self.available.acquire()
+            job = self._next(time.time())
+            job.status = "running"
+            job.started_at = time.time()
+            self.waits[job.priority].append(job.started_at - job.submitted_at)
+            self.running += 1
+            await self._notify(job)
+            try:
+                job.result = await self.run(job)
+                job.status = "completed"
+                self.completed += 1
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "cancelled"
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                self.failed += 1
+            finally:
+                job.finished_at = time.time()
+                self.running -= 1
+                self._trim(job)
+            await self._notify(job)
+
+    async def _notify(self, job: Job):
+        if self.on_change is not None:
+            try:
+                await self.on_change(job)
+            except Exception as e:
+                print(f"Job notification error for {job.id}: {e}")
+
+    def _trim(self, job: Job):
+        # Queued and running jobs are always kept; finished ones age out
+        self.finished.append(job.id)
+        while len(self.finished) > self.max_finished:
+            self.jobs.pop(self.finished.popleft(), None)
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self) -> Dict:
+        def percentile(values: List[float], p: float) -> Optional[float]:
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)], 3)
+
+        now = time.time()
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "promoted_by_aging": self.promoted,
+            "priorities": {
+                name: {
+                    "queued": len(self.levels[name]),
+                    "oldest_wait_seconds": round(now - self.levels[name][0].submitted_at, 3) if self.levels[name] else 0.0,
+                    "submitted": self.submitted[name],
+                    "rejected": self.rejected[name],
+                    "wait_p50_seconds": percentile(list(self.waits[name]), 0.50),
+                    "wait_p95_seconds": percentile(list(self.waits[name]), 0.95)
+                }
+                for name in PRIORITY_LEVELS
+            }
+        }
@@ -0,0 +1,12 @@
+"""Rolling latency percentiles shared by the orchestrator's metrics."""
+
+from typing import Dict, Iterable, Optional
+
+
+def percentiles(samples: Iterable[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max of `samples` (seconds), scaled to milliseconds by default"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    pick = lambda p: round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * scale, 3)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1] * scale, 3)}
@@ -0,0 +1,296 @@
+"""Precomputed bundle optimizer for `/smart-deals`.
+
+For each customer segment a greedy knapsack search builds bundles from
+catalog items: starting from every seed product it repeatedly adds the item
+with the best affinity gain per dollar that still fits the segment budget.
+Affinity comes from co-purchase lift when enough baskets have been seen and
+from content similarity otherwise. Discounts are capped so every bundle
+keeps the segment's minimum margin.
+
+Results are precomputed into a per-segment cache whose expiry matches the
+`expires_in` advertised on each deal; requests are served from memory.
+"""
+
+import heapq
+import time
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from product_index import product_price
+from trending import product_key
+
+SEGMENTS = {
+    "new_customer": {
+        "title": "Starter",
+        "budget": 150.0,
+        "max_discount": 0.20,
+        "min_margin": 0.15,
+        "max_items": 3,
+        "ttl_seconds": 2 * 3600
+    },
+    "regular": {
+        "title": "Everyday",
+        "budget": 250.0,
+        "max_discount": 0.25,
+        "min_margin": 0.20,
+        "max_items": 3,
+        "ttl_seconds": 4 * 3600
+    },
+    "premium": {
+        "title": "Premium",
+        "budget": 600.0,
+        "max_discount": 0.30,
+        "min_margin": 0.25,
+        "max_items": 4,
+        "ttl_seconds": 6 * 3600
+    }
+}
+
+DEFAULT_SEGMENT = "regular"
+DEFAULT_COST_RATIO = 0.55    # assumed unit cost when the catalog has none
+MIN_DISCOUNT = 0.05          # bundles that can't give at least 5% are dropped
+DIVERSITY_BONUS = 0.15       # reward for each extra category in a bundle
+POOL_SIZE = 40               # candidate products considered per segment
+MIN_BASKETS = 20             # co-purchase data needed before it is trusted
+DEALS_PER_SEGMENT = 3
+
+
+def format_expires_in(seconds: float) -> str:
+    hours = int(round(seconds / 3600))
+    if hours >= 1:
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    minutes = max(int(round(seconds / 60)), 1)
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+class CoPurchaseAffinity:
+    """Bounded co-purchase pair counts with lift-based affinity"""
+
+    def __init__(self, max_pairs: int = 100000):
+        self.max_pairs = max_pairs
+        self.baskets = 0
+        self.item_counts: Dict[str, int] = {}
+        self.pair_counts: Dict[tuple, int] = {}
+
+    def record(self, product_ids):
+        """Count one basket; ids may be strings, numbers or item dicts, or a single id"""
+        if not isinstance(product_ids, (list, tuple, set)):
+            product_ids = [product_ids]
+        keys = (product_key(pid) for pid in product_ids)
+        items = sorted(set(key for key in keys if key is not None))
+        if not items:
+            return
+        self.baskets += 1
+        for pid in items:
+            self.item_counts[pid] = self.item_counts.get(pid, 0) + 1
+        for pair in combinations(items, 2):
+            self.pair_counts[pair] = self.pair_counts.get(pair, 0) + 1
+
+        # Keep memory bounded: keep the most frequent half of the pairs
+        if len(self.pair_counts) > self.max_pairs:
+            kept = heapq.nlargest(self.max_pairs // 2, self.pair_counts.items(), key=lambda kv: kv[1])
+            self.pair_counts = dict(kept)
+
+    def matrix(self, product_ids: List[str]) -> np.ndarray:
+        """Pairwise affinity in [0, 1) from lift: lift / (1 + lift)"""
+        n = len(product_ids)
+        affinity = np.zeros((n, n), dtype=np.float64)
+        if self.baskets == 0:
+            return affinity
+        for i, a in enumerate(product_ids):
+            count_a = self.item_counts.get(a)
+            if not count_a:
+                continue
+            for j in range(i + 1, n):
+                b = product_ids[j]
+                pair = self.pair_counts.get((a, b) if a < b else (b, a))
+                if pair:
+                    lift = pair * self.baskets / (count_a * self.item_counts[b])
+                    affinity[i, j] = affinity[j, i] = lift / (1 + lift)
+        return affinity
+
+    def stats(self) -> Dict:
+        return {"baskets": self.baskets, "products": len(self.item_counts), "pairs": len(self.pair_counts)}
+
+
+class BundleOptimizer:
+    """Greedy knapsack bundle search with a per-segment result cache"""
+
+    def __init__(self, segments: Optional[Dict] = None, similarity_index=None,
+                 affinity: Optional[CoPurchaseAffinity] = None):
+        self.segments = segments or SEGMENTS
+        self.similarity_index = similarity_index
+        self.affinity = affinity or CoPurchaseAffinity()
+        self.products: List[Dict] = []
+        self.cache: Dict[str, Dict] = {}
+        self.build_seconds: Dict[str, float] = {}
+        self.refresh_count = 0
+
+    def set_catalog(self, products: List[Dict]):
+        self.products = [p for p in products if p.get("id") and product_price(p) > 0]
+        self.cache.clear()
+
+    def _pool(self, budget: float) -> List[Dict]:
+        candidates = [p for p in self.products if product_price(p) <= budget]
+        # Prefer products shoppers actually buy, then cheaper ones (more combinations fit)
+        candidates.sort(key=lambda p: (-self.affinity.item_counts.get(p["id"], 0), product_price(p)))
+        return candidates[:POOL_SIZE]
+
+    def _affinity_matrix(self, pool: List[Dict]) -> np.ndarray:
+        ids = [p["id"] for p in pool]
+        content = np.zeros((len(pool), len(pool)), dtype=np.float64)
+        index = self.similarity_index
+        if index is not None and len(index.product_ids):
+            rows = [index.positions.get(pid) for pid in ids]
+            known = [i for i, r in enumerate(rows) if r is not None]
+            if known:
+                vectors = index.matrix[[rows[i] for i in known]].astype(np.float64)
+                content[np.ix_(known, known)] = vectors @ vectors.T
+        np.fill_diagonal(content, 0.0)
+
+        if self.affinity.baskets >= MIN_BASKETS:
+            return 0.7 * self.affinity.matrix(ids) + 0.3 * content
+        return content
+
+    def solve(self, segment: str) -> List[Dict]:
+        """Search bundles for one segment"""
+        config = self.segments[segment]
+        pool = self._pool(config["budget"])
+        if len(pool) < 2:
+            return []
+
+        prices = np.array([product_price(p) for p in pool])
+        costs = np.array([p.get("cost", product_price(p) * DEFAULT_COST_RATIO) for p in pool])
+        categories = [p.get("category", "general") for p in pool]
+        affinity = self._affinity_matrix(pool)
+
+        candidates = {}
+        for seed in range(len(pool)):
+            chosen = [seed]
+            total = prices[seed]
+            chosen_categories = {categories[seed]}
+            while len(chosen) < config["max_items"]:
+                gain = affinity[chosen].sum(axis=0)
+                gain += np.array([DIVERSITY_BONUS if c not in chosen_categories else 0.0 for c in categories])
+                feasible = (prices + total <= config["budget"])
+                feasible[chosen] = False
+                if not feasible.any():
+                    break
+                # Knapsack density: value gained per dollar of budget used
+                density = np.where(feasible, (gain + 1e-6) / prices, -np.inf)
+                best = int(density.argmax())
+                chosen.append(best)
+                total += prices[best]
+                chosen_categories.add(categories[best])
+
+            if len(chosen) < 2:
+                continue
+            key = tuple(sorted(chosen))
+            if key in candidates:
+                continue
+
+            original = float(prices[list(key)].sum())
+            cost = float(costs[list(key)].sum())
+            # Largest discount that still keeps min_margin on the bundle price
+            margin_cap = 1 - cost / (original * (1 - config["min_margin"]))
+            discount = np.floor(min(config["max_discount"], margin_cap) * 100) / 100
+            if discount < MIN_DISCOUNT:
+                continue
+
+            pairs = [(a, b) for i, a in enumerate(key) for b in key[i + 1:]]
+            value = sum(affinity[a, b] for a, b in pairs) / len(pairs)
+            value += DIVERSITY_BONUS * (len({categories[i] for i in key}) - 1)
+            candidates[key] = (value, discount, original)
+
+        # Best bundles first, with at most one shared item between any two deals
+        ranked = sorted(candidates.items(), key=lambda kv: (kv[1][0], kv[1][1] * kv[1][2]), reverse=True)
+        selected = []
+        for key, (value, discount, original) in ranked:
+            if any(len(set(key) & set(other)) > 1 for other, _ in selected):
+                continue
+            selected.append((key, (value, discount, original)))
+            if len(selected) == DEALS_PER_SEGMENT:
+                break
+
+        deals = []
+        for key, (value, discount, original) in selected:
+            items = [pool[i] for i in key]
+            bundle_categories = list(dict.fromkeys(categories[i] for i in key))
+            ai_price = round(original * (1 - discount), 2)
+            deals.append({
+                "bundle_name": f"{config['title']} {' & '.join(c.title() for c in bundle_categories[:2])} Bundle",
+                "description": " + ".join(p.get("name", p["id"]) for p in items),
+                "items": [p.get("name", p["id"]) for p in items],
+                "product_ids": [p["id"] for p in items],
+                "original_price": round(original, 2),
+                "ai_price": ai_price,
+                "discount": int(round(discount * 100)),
+                "margin": round(1 - float(costs[list(key)].sum()) / ai_price, 3),
+                "affinity_score": round(float(value), 3)
+            })
+        return deals
+
+    def refresh(self, segment: Optional[str] = None) -> Dict[str, Dict]:
+        """Recompute bundles for one or all segments into the cache"""
+        for name in ([segment] if segment else list(self.segments)):
+            start = time.perf_counter()
+            deals = self.solve(name)
+            now = time.time()
+            self.cache[name] = {
+                "deals": deals,
+                "total_savings": round(sum(d["original_price"] - d["ai_price"] for d in deals), 2),
+                "generated_at": now,
+                "expires_at": now + self.segments[name]["ttl_seconds"]
+            }
+            self.build_seconds[name] = time.perf_counter() - start
+        self.refresh_count += 1
+        return self.cache
+
+    def refresh_expired(self) -> List[str]:
+        now = time.time()
+        expired = [s for s in self.segments if s not in self.cache or self.cache[s]["expires_at"] <= now]
+        for segment in expired:
+            self.refresh(segment)
+        return expired
+
+    def seconds_until_next_expiry(self) -> float:
+        if not self.cache:
+            return 0.0
+        return max(min(entry["expires_at"] for entry in self.cache.values()) - time.time(), 0.0)
+
+    def resolve(self, segment: Optional[str]) -> str:
+        return segment if segment in self.segments else DEFAULT_SEGMENT
+
+    def version(self, segment: str) -> Optional[tuple]:
+        """(generated_at, expires_in label) of a live cache entry, or None if it needs a rebuild"""
+        entry = self.cache.get(segment)
+        now = time.time()
+        if entry is None or entry["expires_at"] <= now:
+            return None
+        return entry["generated_at"], format_expires_in(entry["expires_at"] - now)
+
+    def get(self, segment: str) -> Dict:
+        """Serve a segment's bundles from the cache, rebuilding it only if expired"""
+        segment = self.resolve(segment)
+        entry = self.cache.get(segment)
+        if entry is None or entry["expires_at"] <= time.time():
+            self.refresh(segment)
+            entry = self.cache[segment]
+        expires_in = format_expires_in(entry["expires_at"] - time.time())
+        return {
+            "segment": segment,
+            "deals": [{**deal, "expires_in": expires_in} for deal in entry["deals"]],
+            "total_savings": entry["total_savings"],
+            "generated_at": entry["generated_at"],
+            "expires_at": entry["expires_at"]
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "segments_cached": len(self.cache),
+            "refreshes": self.refresh_count,
+            "build_time_ms": {s: round(t * 1000, 3) for s, t in self.build_seconds.items()},
+            "co_purchase": self.affinity.stats()
+        }
@@ -0,0 +1,331 @@
+"""Cart-analysis rules engine for `/analyze-cart`.
+
+Rules (free-shipping threshold, bundles, bulk tiers and loyalty discounts)
+are compiled once against the product catalog into NumPy arrays:
+
+- bundles become a (bundles x products) membership matrix, so matching
+  every bundle against a cart is a single matrix product;
+- bulk tiers become sorted threshold/discount arrays searched with
+  `searchsorted`;
+- loyalty tiers become a discount lookup table.
+
+`evaluate_batch` scores many carts with one pass of array operations;
+`evaluate` is the single-cart convenience wrapper. Items that cannot be
+read (non-numeric or fractional quantities, unusable prices or product
+ids) are left out of the cart and counted in `skipped_items`.
+"""
+
+import json
+import math
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from product_index import product_price
+
+DEFAULT_RULES = {
+    "free_shipping": {
+        "threshold": 50.0,
+        "shipping_cost": 8.99
+    },
+    "bundles": [
+        {
+            "name": "Coffee Enthusiast Bundle",
+            "product_ids": ["1YMWWN1N4O", "2ZYFJ3GM2N"],
+            "discount": 15
+        },
+        {
+            "name": "Vintage Collector Set",
+            "product_ids": ["OLJCESPC7Z", "9SIQT8TOJO"],
+            "discount": 12
+        },
+        {
+            "name": "Analog Creative Kit",
+            "product_ids": ["OLJCESPC7Z", "66VCHSJNUP", "9SIQT8TOJO"],
+            "discount": 20
+        }
+    ],
+    "bulk_tiers": [
+        {"min_quantity": 3, "discount": 5},
+        {"min_quantity": 5, "discount": 10},
+        {"min_quantity": 10, "discount": 20}
+    ],
+    "loyalty_tiers": {
+        "silver": 5,
+        "gold": 10,
+        "premium": 25
+    }
+}
+
+# Confidence reported for each kind of suggestion
+CONFIDENCE = {
+    "bundle": 0.95,
+    "loyalty": 0.95,
+    "bulk": 0.92,
+    "complete_bundle": 0.82,
+    "shipping": 0.88
+}
+
+# Larger quantities are clamped, keeping item counts and totals well inside 64 bits
+MAX_ITEM_QUANTITY = 10_000
+
+
+def load_rules(path: Optional[str] = None) -> Dict:
+    """Load cart rules from a JSON file, falling back to DEFAULT_RULES"""
+    path = path or os.environ.get("CART_RULES_FILE", "")
+    if path:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Could not load cart rules from {path}: {e}")
+    return DEFAULT_RULES
+
+
+def cart_item(item) -> Optional[tuple]:
+    """(product_id, quantity, price or None) for a cart item, or None if it is unusable
+
+    A bare string is a product id with quantity 1. Quantities must be
+    whole numbers and are clamped to MAX_ITEM_QUANTITY; prices may be
+    numbers, numeric strings or money dicts, and the line total must be
+    finite.
+    """
+    if isinstance(item, str):
+        item = {"product_id": item}
+    if not isinstance(item, dict):
+        return None
+    pid = item.get("product_id") or item.get("id")
+    if isinstance(pid, bool) or not isinstance(pid, (str, int)):
+        return None
+    quantity = item.get("quantity", 1)
+    if quantity is None:
+        quantity = 1
+    if isinstance(quantity, bool):
+        return None
+    try:
+        quantity = float(quantity)
+    except (TypeError, ValueError):
+        return None
+    if not quantity.is_integer() or quantity < 0:
+        return None
+    quantity = min(quantity, MAX_ITEM_QUANTITY)
+    price = item.get("price")
+    if price is not None:
+        if isinstance(price, dict):
+            try:
+                price = product_price({"price": price})
+            except (AttributeError, TypeError):
+                return None
+        elif isinstance(price, bool):
+            return None
+        else:
+            try:
+                price = float(price)
+            except (TypeError, ValueError):
+                return None
+        if not math.isfinite(price) or price < 0 or not math.isfinite(price * quantity):
+            return None
+    return str(pid), int(quantity), price
+
+
+class CartRulesEngine:
+    """Cart rules compiled into array-backed structures"""
+
+    def __init__(self, products: List[Dict], rules: Optional[Dict] = None):
+        self.compile(products, rules or DEFAULT_RULES)
+
+    def compile(self, products: List[Dict], rules: Dict):
+        self.rules = rules
+        self.product_ids = [p["id"] for p in products if p.get("id")]
+        self.positions = {pid: i for i, pid in enumerate(self.product_ids)}
+        self.names = {p["id"]: p.get("name", p["id"]) for p in products if p.get("id")}
+        self.prices = np.array([product_price(p) for p in products if p.get("id")], dtype=np.float64)
+        n_products = len(self.product_ids)
+
+        shipping = rules.get("free_shipping", {})
+        self.shipping_threshold = float(shipping.get("threshold", 0))
+        self.shipping_cost = float(shipping.get("shipping_cost", 0))
+
+        # Only bundles whose products are all in the catalog can ever match
+        bundles = [b for b in rules.get("bundles", [])
+                   if b.get("product_ids") and all(pid in self.positions for pid in b["product_ids"])]
+        self.bundle_names = [b["name"] for b in bundles]
+        self.bundle_members = [list(b["product_ids"]) for b in bundles]
+        self.bundle_matrix = np.zeros((len(bundles), n_products), dtype=np.float32)
+        for row, bundle in enumerate(bundles):
+            for pid in bundle["product_ids"]:
+                self.bundle_matrix[row, self.positions[pid]] = 1.0
+        self.bundle_sizes = self.bundle_matrix.sum(axis=1)
+        self.bundle_discounts = np.array([b["discount"] / 100 for b in bundles], dtype=np.float64)
+        self.bundle_values = self.bundle_matrix.astype(np.float64) @ self.prices
+
+        tiers = sorted(rules.get("bulk_tiers", []), key=lambda t: t["min_quantity"])
+        self.bulk_min_quantity = np.array([t["min_quantity"] for t in tiers], dtype=np.float64)
+        self.bulk_discounts = np.array([t["discount"] / 100 for t in tiers], dtype=np.float64)
+
+        self.loyalty_tiers = list(rules.get("loyalty_tiers", {}).keys())
+        self.loyalty_lookup = {tier: i + 1 for i, tier in enumerate(self.loyalty_tiers)}
+        # Index 0 is "no tier"
+        self.loyalty_discounts = np.array(
+            [0.0] + [rules["loyalty_tiers"][t] / 100 for t in self.loyalty_tiers], dtype=np.float64)
+
+    def _vectorize(self, carts: List[Dict]):
+        n_carts = len(carts)
+        quantities = np.zeros((n_carts, len(self.product_ids)), dtype=np.float32)
+        subtotals = np.zeros(n_carts, dtype=np.float64)
+        item_counts = np.zeros(n_carts, dtype=np.float64)
+        loyalty = np.zeros(n_carts, dtype=np.int64)
+        skipped = np.zeros(n_carts, dtype=np.int64)
+
+        for row, cart in enumerate(carts):
+            tier = cart.get("loyalty_tier")
+            loyalty[row] = self.loyalty_lookup.get(tier.lower(), 0) if isinstance(tier, str) else 0
+            items = cart.get("cart_items") or []
+            if not isinstance(items, list):
+                skipped[row] += 1
+                continue
+            for item in items:
+                parsed = cart_item(item)
+                if parsed is None:
+                    skipped[row] += 1
+                    continue
+                pid, quantity, price = parsed
+                position = self.positions.get(pid)
+                if price is None:
+                    price = self.prices[position] if position is not None else 0.0
+                line_total = price * quantity
+                if not math.isfinite(float(subtotals[row]) + line_total):
+                    skipped[row] += 1
+                    continue
+                if position is not None:
+                    quantities[row, position] += quantity
+                subtotals[row] += line_total
+                item_counts[row] += quantity
+
+        return quantities, subtotals, item_counts, loyalty, skipped
+
+    def evaluate_batch(self, carts: List[Dict]) -> List[Dict]:
+        """Evaluate every rule against every cart; returns one result per cart"""
+        if not carts:
+            return []
+        quantities, subtotals, item_counts, loyalty, skipped = self._vectorize(carts)
+
+        # Free shipping: how far each cart is from the threshold
+        shipping_gap = np.maximum(self.shipping_threshold - subtotals, 0.0)
+        shipping_open = shipping_gap > 0
+
+        # Bundles: number of distinct bundle members present in each cart
+        if len(self.bundle_names):
+            present = (quantities > 0).astype(np.float32)
+            matched = present @ self.bundle_matrix.T
+            bundle_savings = self.bundle_values * self.bundle_discounts
+            complete = matched >= self.bundle_sizes
+            near = (matched == self.bundle_sizes - 1) & (matched > 0)
+            complete_savings = np.where(complete, bundle_savings, 0.0)
+            near_savings = np.where(near, bundle_savings, 0.0)
+            best_complete = complete_savings.argmax(axis=1)
+            best_near = near_savings.argmax(axis=1)
+            best_complete_savings = complete_savings.max(axis=1)
+            best_near_savings = near_savings.max(axis=1)
+        else:
+            best_complete = best_near = np.zeros(len(carts), dtype=np.int64)
+            best_complete_savings = best_near_savings = np.zeros(len(carts))
+
+        # Bulk tiers: highest tier whose minimum quantity is reached
+        if len(self.bulk_min_quantity):
+            tier = np.searchsorted(self.bulk_min_quantity, item_counts, side="right") - 1
+            bulk_discount = np.where(tier >= 0, self.bulk_discounts[np.maximum(tier, 0)], 0.0)
+        else:
+            bulk_discount = np.zeros(len(carts))
+        bulk_savings = subtotals * bulk_discount
+
+        loyalty_discount = self.loyalty_discounts[loyalty]
+        loyalty_savings = subtotals * loyalty_discount
+
+        return [
+            self._format(
+                row, subtotals[row], item_counts[row],
+                shipping_open[row], shipping_gap[row],
+                best_complete[row], best_complete_savings[row],
+                best_near[row], best_near_savings[row], quantities[row],
+                bulk_discount[row], bulk_savings[row],
+                loyalty[row], loyalty_discount[row], loyalty_savings[row], skipped[row]
+            )
+            for row in range(len(carts))
+        ]
+
+    def evaluate(self, cart_items: List[Dict], loyalty_tier: Optional[str] = None) -> Dict:
+        return self.evaluate_batch([{"cart_items": cart_items, "loyalty_tier": loyalty_tier}])[0]
+
+    def _format(self, row, subtotal, item_count, shipping_open, shipping_gap,
+                complete_idx, complete_savings, near_idx, near_savings, quantities,
+                bulk_discount, bulk_savings, loyalty_idx, loyalty_discount, loyalty_savings,
+                skipped_items) -> Dict:
+        optimizations = []
+
+        if complete_savings > 0:
+            name = self.bundle_names[complete_idx]
+            optimizations.append({
+                "type": "bundle",
+                "message": f"Bundle your {name} items and save {self.bundle_discounts[complete_idx] * 100:.0f}%!",
+                "savings": round(float(complete_savings), 2),
+                "discount": round(float(self.bundle_discounts[complete_idx] * 100)),
+                "action": "create_bundle"
+            })
+        if near_savings > 0:
+            name = self.bundle_names[near_idx]
+            missing = [pid for pid in self.bundle_members[near_idx]
+                       if quantities[self.positions[pid]] == 0]
+            missing_name = self.names.get(missing[0], missing[0]) if missing else "one more item"
+            optimizations.append({
+                "type": "complete_bundle",
+                "message": f"Add {missing_name} to complete the {name} and save "
+                           f"{self.bundle_discounts[near_idx] * 100:.0f}%!",
+                "savings": round(float(near_savings), 2),
+                "discount": round(float(self.bundle_discounts[near_idx] * 100)),
+                "missing_product_ids": missing,
+                "action": "add_item"
+            })
+        if bulk_savings > 0:
+            optimizations.append({
+                "type": "bulk",
+                "message": f"You qualify for our {bulk_discount * 100:.0f}% bulk discount!",
+                "savings": round(float(bulk_savings), 2),
+                "discount": round(float(bulk_discount * 100)),
+                "action": "apply_bulk_discount"
+            })
+        if loyalty_savings > 0:
+            tier = self.loyalty_tiers[loyalty_idx - 1]
+            optimizations.append({
+                "type": "loyalty",
+                "message": f"{tier.title()} member discount applied!",
+                "savings": round(float(loyalty_savings), 2),
+                "discount": round(float(loyalty_discount * 100)),
+                "action": "apply_loyalty_discount"
+            })
+        if shipping_open:
+            optimizations.append({
+                "type": "shipping",
+                "message": f"Add ${shipping_gap:.2f} more for free shipping!",
+                "savings": round(self.shipping_cost, 2),
+                "threshold": self.shipping_threshold,
+                "amount_needed": round(float(shipping_gap), 2),
+                "action": "add_item"
+            })
+
+        optimizations.sort(key=lambda o: o["savings"], reverse=True)
+        best = optimizations[0] if optimizations else None
+
+        return {
+            "optimization_available": best is not None,
+            "optimization_type": best["type"] if best else None,
+            "message": best["message"] if best else "Your cart is already fully optimized!",
+            "potential_savings": best["savings"] if best else 0,
+            "confidence_score": CONFIDENCE[best["type"]] if best else 1.0,
+            "action_required": best["action"] if best else None,
+            "cart_total": round(float(subtotal), 2),
+            "item_count": int(item_count),
+            "skipped_items": int(skipped_items),
+            "optimizations": optimizations
+        }
@@ -0,0 +1,83 @@
+"""Product catalog shared by the MCP server and its offline tools."""
+
+import json
+from typing import Dict, List
+
+from product_index import product_price
+
+# Product catalog used for recommendations; extended at startup from
+# ProductCatalogService (via the product-catalog MCP) when configured
+PRODUCT_CATALOG = [
+    {
+        "id": "OLJCESPC7Z",
+        "name": "Vintage Camera Lens",
+        "description": "Manual-focus prime lens with a warm vintage rendering for film and mirrorless cameras.",
+        "price": 49.99,
+        "image": "/static/img/products/camera-lens.jpg",
+        "reason": "Based on your photography interests",
+        "match_score": 95,
+        "category": "photography"
+    },
+    {
+        "id": "66VCHSJNUP",
+        "name": "Vintage Record Player",
+        "description": "Belt-drive turntable with built-in speakers for your vinyl music collection.",
+        "price": 129.99,
+        "image": "/static/img/products/record-player.jpg",
+        "reason": "Customers also bought",
+        "match_score": 87,
+        "category": "music"
+    },
+    {
+        "id": "1YMWWN1N4O",
+        "name": "Home Barista Kit",
+        "description": "Pour-over coffee brewer, kettle and scale for cafe-style coffee at home.",
+        "price": 89.99,
+        "image": "/static/img/products/barista-kit.jpg",
+        "reason": "Trending in your area",
+        "match_score": 82,
+        "category": "kitchen"
+    },
+    {
+        "id": "2ZYFJ3GM2N",
+        "name": "Artisan Coffee Beans",
+        "description": "Small-batch roasted whole coffee beans with chocolate and citrus notes.",
+        "price": 24.99,
+        "image": "/static/img/products/coffee-beans.jpg",
+        "reason": "Perfect with your recent purchases",
+        "match_score": 89,
+        "category": "consumables"
+    },
+    {
+        "id": "9SIQT8TOJO",
+        "name": "Vintage Typewriter",
+        "description": "Restored mechanical typewriter with a classic vintage look for writers.",
+        "price": 199.99,
+        "image": "/static/img/products/typewriter.jpg",
+        "reason": "Based on browsing history",
+        "match_score": 78,
+        "category": "vintage"
+    }
+]
+
+
+def normalize_catalog_product(product: Dict) -> Dict:
+    """Convert a ProductCatalogService product into the MCP catalog shape"""
+    categories = product.get("categories", [])
+    return {
+        "id": product["id"],
+        "name": product.get("name", ""),
+        "description": product.get("description", ""),
+        "price": round(product_price(product), 2),
+        "image": product.get("picture", product.get("image", "")),
+        "category": categories[0] if categories else product.get("category", "general"),
+        "categories": categories
+    }
+
+
+def load_catalog_file(path: str) -> List[Dict]:
+    """Load a catalog dump (a product list or a /list_products response)"""
+    with open(path) as f:
+        data = json.load(f)
+    products = data.get("products", []) if isinstance(data, dict) else data
+    return [normalize_catalog_product(p) for p in products]
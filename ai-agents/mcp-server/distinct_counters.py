@@ -0,0 +1,224 @@
+"""HyperLogLog distinct counters for MCP metrics.
+
+Counts unique users helped, unique sessions and unique users who applied
+an optimization over hourly and daily windows without keeping the ids.
+Each sketch is 2^precision one-byte registers (4 KB at the default
+precision, ~1.6% standard error).
+
+Sketches merge with an element-wise max, which is idempotent and
+commutative, so workers and replicas can exchange state in any order and
+re-merging the same state never double counts. State serializes to
+zlib-compressed registers and is snapshotted to disk so it survives
+restarts.
+"""
+
+import base64
+import hashlib
+import json
+import math
+import os
+import time
+import zlib
+from typing import Dict, Optional
+
+import numpy as np
+
+METRICS = ("users_helped", "sessions", "optimized_users")
+
+# window name -> (bucket length in seconds, buckets kept)
+WINDOWS = {
+    "hour": (3600, 48),
+    "day": (86400, 7)
+}
+
+STATE_VERSION = 1
+
+
+def _hash64(item: str) -> int:
+    # Stable across processes and hosts so replicas' sketches line up
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Dense HyperLogLog with byte registers"""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 12, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hash(self, value: int):
+        index = value >> (64 - self.precision)
+        remainder = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, item: str):
+        self.add_hash(_hash64(item))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes, precision: int) -> "HyperLogLog":
+        registers = np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy()
+        if len(registers) != 1 << precision:
+            raise ValueError("Register count does not match precision")
+        return cls(precision, registers)
+
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class DistinctCounters:
+    """Windowed HyperLogLog counters that merge across workers and replicas"""
+
+    def __init__(self, precision: int = 12, metrics=METRICS):
+        self.precision = precision
+        self.metrics = tuple(metrics)
+        # metric -> window -> bucket epoch -> sketch
+        self.sketches: Dict[str, Dict[str, Dict[int, HyperLogLog]]] = {
+            metric: {window: {} for window in WINDOWS} for metric in self.metrics
+        }
+
+    def _bucket(self, metric: str, window: str, epoch: int, now: float) -> HyperLogLog:
+        buckets = self.sketches[metric][window]
+        sketch = buckets.get(epoch)
+        if sketch is None:
+            sketch = buckets[epoch] = HyperLogLog(self.precision)
+            # Drop buckets that have aged out, judged by the clock rather than the
+            # newest key so one far-future epoch cannot evict the live buckets
+            length, keep = WINDOWS[window]
+            current = int(now // length)
+            for old in [e for e in buckets if e <= current - keep]:
+                del buckets[old]
+        return sketch
+
+    def add(self, metric: str, item: Optional[str], now: Optional[float] = None):
+        if not item or metric not in self.sketches:
+            return
+        now = time.time() if now is None else now
+        value = _hash64(str(item))
+        for window, (length, _) in WINDOWS.items():
+            self._bucket(metric, window, int(now // length), now).add_hash(value)
+
+    def count(self, metric: str, window: str = "day", periods: int = 1,
+              now: Optional[float] = None) -> int:
+        """Distinct items over the last `periods` buckets of a window"""
+        now = time.time() if now is None else now
+        length, _ = WINDOWS[window]
+        current = int(now // length)
+        merged = HyperLogLog(self.precision)
+        for epoch, sketch in self.sketches[metric][window].items():
+            if current - periods < epoch <= current:
+                merged.merge(sketch)
+        return merged.count()
+
+    def summary(self) -> Dict:
+        return {
+            metric: {
+                "current_hour": self.count(metric, "hour"),
+                "last_24_hours": self.count(metric, "hour", periods=24),
+                "today": self.count(metric, "day"),
+                "last_7_days": self.count(metric, "day", periods=7)
+            }
+            for metric in self.metrics
+        }
+
+    def stats(self) -> Dict:
+        sketches = sum(len(b) for windows in self.sketches.values() for b in windows.values())
+        return {
+            "precision": self.precision,
+            "standard_error": round(1.04 / math.sqrt(1 << self.precision), 4),
+            "sketches": sketches,
+            "memory_bytes": sketches * (1 << self.precision)
+        }
+
+    def export_state(self) -> Dict:
+        return {
+            "version": STATE_VERSION,
+            "precision": self.precision,
+            "metrics": {
+                metric: {
+                    window: {
+                        str(epoch): base64.b64encode(sketch.to_bytes()).decode("ascii")
+                        for epoch, sketch in buckets.items()
+                    }
+                    for window, buckets in windows.items()
+                }
+                for metric, windows in self.sketches.items()
+            }
+        }
+
+    def merge_state(self, state: Dict, now: Optional[float] = None) -> int:
+        """Merge another worker's or replica's exported state; returns sketches merged
+
+        Buckets that have aged out, or that lie more than one bucket in the
+        future (a peer with a bad clock), are skipped.
+        """
+        if state.get("version") != STATE_VERSION or state.get("precision") != self.precision:
+            raise ValueError("Incompatible distinct-counter state")
+        # Decode everything first, so a corrupt payload is rejected without a partial merge
+        try:
+            decoded = [
+                (metric, window, int(epoch),
+                 HyperLogLog.from_bytes(base64.b64decode(encoded), self.precision))
+                for metric, windows in state.get("metrics", {}).items() if metric in self.sketches
+                for window, buckets in windows.items() if window in WINDOWS
+                for epoch, encoded in buckets.items()
+            ]
+        except (zlib.error, TypeError, AttributeError) as e:
+            raise ValueError(f"Corrupt distinct-counter state: {e}") from e
+        now = time.time() if now is None else now
+        merged = 0
+        for metric, window, epoch, other in decoded:
+            length, keep = WINDOWS[window]
+            current = int(now // length)
+            if not current - keep < epoch <= current + 1:
+                continue
+            self._bucket(metric, window, epoch, now).merge(other)
+            merged += 1
+        return merged
+
+    def snapshot(self, path: str):
+        """Merge into the on-disk state and atomically replace it.
+
+        Merging first means several workers can share one snapshot file:
+        a lost race only delays a worker's data until its next snapshot.
+        """
+        combined = DistinctCounters(self.precision, self.metrics)
+        combined.merge_state(self.export_state())
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    combined.merge_state(json.load(f))
+            except Exception as e:
+                print(f"Ignoring unreadable distinct-counter snapshot {path}: {e}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(combined.export_state(), f)
+        os.replace(tmp_path, path)
+
+    def restore(self, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return self.merge_state(json.load(f))
@@ -0,0 +1,197 @@
+"""Fast JSON responses, pre-serialized payloads and per-route encoding metrics.
+
+- `MeteredORJSONResponse` is the app's default response class. It encodes
+  with orjson and records encode time and size for the matched route.
+- `PreSerialized` holds a payload serialized to bytes once, with a strong
+  `ETag`. It answers `If-None-Match` with `304`, and can be embedded in a
+  larger response as an `orjson.Fragment` without being encoded again.
+- `VersionedPayloads` keeps the latest `PreSerialized` per name and only
+  re-encodes when the version changes, for data that is constant between
+  refreshes.
+- `EncodingMetricsMiddleware` attributes each response's encoding cost to
+  its route template (`/smart-deals/{user_id}`, not the concrete path).
+"""
+
+import contextvars
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from starlette.requests import Request
+from starlette.responses import Response
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Per-request accumulator: [encode_ns, bytes, preserialized]
+_encoding = contextvars.ContextVar("json_encoding", default=None)
+
+
+class EncodingStats:
+    """Per-route JSON encoding time and size"""
+
+    def __init__(self):
+        self.routes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, route: str, encode_ns: int, size: int, preserialized: bool):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {"responses": 0, "encode_ns": 0, "max_encode_ns": 0,
+                                          "bytes": 0, "preserialized": 0}
+        stats["responses"] += 1
+        stats["encode_ns"] += encode_ns
+        stats["max_encode_ns"] = max(stats["max_encode_ns"], encode_ns)
+        stats["bytes"] += size
+        stats["preserialized"] += 1 if preserialized else 0
+
+    def stats(self) -> Dict:
+        return {
+            route: {
+                "responses": s["responses"],
+                "avg_encode_us": round(s["encode_ns"] / s["responses"] / 1000, 2),
+                "max_encode_us": round(s["max_encode_ns"] / 1000, 2),
+                "avg_bytes": int(s["bytes"] / s["responses"]),
+                "preserialized_share": round(s["preserialized"] / s["responses"], 4)
+            }
+            for route, s in self.routes.items()
+        }
+
+
+encoding_stats = EncodingStats()
+
+
+def _account(encode_ns: int, size: int, preserialized: bool = False):
+    current = _encoding.get()
+    if current is not None:
+        current[0] += encode_ns
+        current[1] += size
+        current[2] = current[2] or preserialized
+
+
+class MeteredORJSONResponse(ORJSONResponse):
+    """orjson response that reports its encode time to the route metrics"""
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter_ns()
+        body = orjson.dumps(content, option=ORJSON_OPTIONS)
+        _account(time.perf_counter_ns() - start, len(body))
+        return body
+
+
+def etag_matches(request: Optional[Request], etag: str) -> bool:
+    """True if the request's If-None-Match already names this ETag"""
+    if request is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    _account(0, 0, preserialized=True)
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+
+
+class PreSerialized:
+    """A JSON payload encoded once, with a content-derived ETag"""
+
+    __slots__ = ("body", "etag", "fragment")
+
+    def __init__(self, content: Any):
+        self.body = orjson.dumps(content, option=ORJSON_OPTIONS)
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=12).hexdigest()}"'
+        self.fragment = orjson.Fragment(self.body)
+
+    def response(self, request: Optional[Request] = None, headers: Optional[Dict[str, str]] = None,
+                 extra: Optional[Dict[str, Any]] = None) -> Response:
+        """Serve the payload; `extra` fields (e.g. a path parameter) are spliced in front"""
+        body, etag = self.body, self.etag
+        if extra:
+            prefix = orjson.dumps(extra, option=ORJSON_OPTIONS)[:-1]
+            etag = f'"{hashlib.blake2b(prefix + etag.encode(), digest_size=12).hexdigest()}"'
+            if etag_matches(request, etag):
+                return not_modified(etag, headers)
+            body = prefix + b"," + body[1:] if len(body) > 2 else prefix + b"}"
+        elif etag_matches(request, etag):
+            return not_modified(etag, headers)
+        _account(0, len(body), preserialized=True)
+        return Response(body, media_type="application/json", headers={"ETag": etag, **(headers or {})})
+
+
+class VersionedPayloads:
+    """Latest pre-serialized payload per name, re-encoded only on a version change
+
+    Entries can also carry a TTL, and the number of names is bounded
+    (least recently used first out), so per-user responses fit here too.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()   # name -> (version, payload, expires_at)
+        self.max_entries = max_entries
+        self.encodes = 0
+        self.hits = 0
+
+    def peek(self, name: Hashable, version: Hashable = None) -> Optional[PreSerialized]:
+        """Stored payload if it is current for `version` and not expired"""
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != version or entry[2] <= time.time():
+            return None
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, name: Hashable, version: Hashable, content: Any,
+            ttl_seconds: Optional[float] = None) -> PreSerialized:
+        payload = PreSerialized(content)
+        expires_at = time.time() + ttl_seconds if ttl_seconds is not None else float("inf")
+        self.entries[name] = (version, payload, expires_at)
+        self.entries.move_to_end(name)
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.encodes += 1
+        return payload
+
+    def get(self, name: Hashable, version: Hashable, build: Callable[[], Any],
+            ttl_seconds: Optional[float] = None) -> PreSerialized:
+        payload = self.peek(name, version)
+        return payload if payload is not None else self.put(name, version, build(), ttl_seconds)
+
+    def seconds_left(self, name: Hashable) -> float:
+        entry = self.entries.get(name)
+        return max(entry[2] - time.time(), 0.0) if entry is not None else 0.0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.encodes
+        return {
+            "payloads": len(self.entries),
+            "encodes": self.encodes,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class EncodingMetricsMiddleware:
+    """ASGI middleware recording each response's encoding cost under its route"""
+
+    def __init__(self, app, stats: EncodingStats = encoding_stats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        current = [0, 0, False]
+        token = _encoding.set(current)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _encoding.reset(token)
+            route = scope.get("route")
+            if route is not None and (current[1] or current[2]):
+                self.stats.record(getattr(route, "path", str(route)), current[0], current[1], current[2])
@@ -0,0 +1,345 @@
+"""Compact in-memory per-user feature store fed by `/track` events.
+
+Each user is one `__slots__` record whose counters live in a single
+fixed-size `array('H')`: per-category interaction counts followed by
+purchase-amount (spend) buckets. Updates are O(1); users idle longer than
+the inactivity TTL are evicted from the front of an LRU-ordered dict, and
+the whole store is periodically snapshotted to a compact binary file.
+
+At roughly 450 bytes per user (id string, record, counters and dict
+entry) a million active users take about 450 MB, within one MCP pod's
+1 Gi memory limit.
+"""
+
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from trending import product_key
+
+N_CATEGORIES = 16
+SPEND_EDGES = (10, 25, 50, 100, 250, 500, 1000)   # dollars; 8 buckets
+N_SPEND = len(SPEND_EDGES) + 1
+COUNTER_MAX = 0xFFFF
+
+# Lifetime spend (dollars) needed for each loyalty tier, highest first
+LOYALTY_THRESHOLDS = (("premium", 1000), ("gold", 300), ("silver", 100))
+
+# Event types that count as shopping interest in a category
+INTEREST_WEIGHTS = {
+    "page_view": 1,
+    "product_view": 1,
+    "add_to_cart": 2,
+    "purchase": 3
+}
+
+SPEND_CENTS_MAX = 2 ** 64 - 1   # the snapshot stores spend as an unsigned 64-bit field
+
+MAX_USER_ID_BYTES = 256   # well inside the snapshot's 16-bit id length field
+
+SNAPSHOT_MAGIC = b"UFS1"
+_RECORD = struct.Struct(f"<IIIQ{N_CATEGORIES + N_SPEND}H")
+
+
+def _number(value) -> Optional[float]:
+    """A finite float from a number or numeric string, else None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _quantity(value) -> int:
+    number = _number(value)
+    return max(int(number), 0) if number is not None else 1
+
+
+class UserFeatures:
+    """Fixed-size feature record for one user"""
+
+    __slots__ = ("counters", "last_seen", "sessions", "session_tag", "spend_cents")
+
+    def __init__(self):
+        self.counters = array("H", bytes(2 * (N_CATEGORIES + N_SPEND)))
+        self.last_seen = 0
+        self.sessions = 0
+        self.session_tag = 0
+        self.spend_cents = 0
+
+    def bump(self, slot: int, amount: int = 1):
+        self.counters[slot] = min(self.counters[slot] + amount, COUNTER_MAX)
+
+
+class UserFeatureStore:
+    """LRU-ordered map of user id -> UserFeatures with inactivity eviction"""
+
+    def __init__(self, ttl_seconds: float = 7 * 86400, max_users: int = 1_000_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.users: "OrderedDict[str, UserFeatures]" = OrderedDict()
+        self.category_slots: Dict[str, int] = {}
+        self.product_categories: Dict[str, int] = {}
+        self.product_prices: Dict[str, float] = {}
+        self.evicted = 0
+        self.updates = 0
+
+    def set_catalog(self, products: List[Dict]):
+        """Map catalog categories onto the fixed category slots"""
+        for product in products:
+            category = product.get("category") or (product.get("categories") or ["general"])[0]
+            self.product_categories[product["id"]] = self.category_slot(category)
+            price = product.get("price")
+            if isinstance(price, (int, float)):
+                self.product_prices[product["id"]] = float(price)
+
+    def category_slot(self, category: str) -> int:
+        slot = self.category_slots.get(category)
+        if slot is None:
+            if len(self.category_slots) < N_CATEGORIES:
+                slot = len(self.category_slots)
+            else:
+                # More categories than slots: share slots by hash
+                slot = zlib.crc32(category.encode("utf-8")) % N_CATEGORIES
+            self.category_slots[category] = slot
+        return slot
+
+    def _record(self, user_id: str, now: float) -> UserFeatures:
+        record = self.users.get(user_id)
+        if record is None:
+            record = self.users[user_id] = UserFeatures()
+            if len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.users.move_to_end(user_id)
+        record.last_seen = int(now)
+        return record
+
+    def update(self, event: Dict, now: Optional[float] = None) -> bool:
+        """Apply one /track event in O(1); returns False if it has no usable user id"""
+        user_id = event.get("user_id")
+        if not user_id:
+            return False
+        user_id = str(user_id)
+        try:
+            # The snapshot stores ids as length-prefixed UTF-8
+            if len(user_id.encode("utf-8")) > MAX_USER_ID_BYTES:
+                return False
+        except UnicodeEncodeError:
+            return False
+        now = time.time() if now is None else now
+        record = self._record(user_id, now)
+
+        session_id = event.get("session_id")
+        if session_id:
+            tag = zlib.crc32(str(session_id).encode("utf-8"))
+            if tag != record.session_tag:
+                record.session_tag = tag
+                record.sessions += 1
+
+        event_type = event.get("type")
+        weight = INTEREST_WEIGHTS.get(event_type) if isinstance(event_type, str) else None
+        lines = self._event_lines(event)
+        if weight:
+            category = event.get("category")
+            for product_id, _, _ in lines:
+                slot = self.product_categories.get(product_id)
+                if slot is None and isinstance(category, str) and category:
+                    slot = self.category_slot(category)
+                if slot is not None:
+                    record.bump(slot, weight)
+
+        if event_type == "purchase":
+            amount = _number(event.get("amount", event.get("value")))
+            if amount is None:
+                amount = sum(
+                    quantity * (price if price is not None else self.product_prices.get(product_id, 0.0))
+                    for product_id, quantity, price in lines
+                )
+            cents = int(round(amount * 100))
+            if cents > 0:
+                record.spend_cents = min(record.spend_cents + cents, SPEND_CENTS_MAX)
+                record.bump(N_CATEGORIES + bisect_right(SPEND_EDGES, amount))
+            elif cents < 0:
+                # A refund lowers lifetime spend, never below zero
+                record.spend_cents = max(record.spend_cents + cents, 0)
+
+        self.updates += 1
+        self.evict_inactive(now, limit=2)
+        return True
+
+    @staticmethod
+    def _event_lines(event: Dict) -> List[tuple]:
+        """(product_id, quantity, price or None) for each product in an event
+
+        Single-product events use `product_id` and `quantity`; baskets use
+        `items` (dicts with product_id, quantity and price) or `product_ids`.
+        """
+        items = event.get("items")
+        if isinstance(items, list) and items:
+            lines = []
+            for item in items:
+                product_id = product_key(item)
+                if product_id is None:
+                    continue
+                if isinstance(item, dict):
+                    price = _number(item.get("price"))
+                    lines.append((product_id, _quantity(item.get("quantity", 1)), price))
+                else:
+                    lines.append((product_id, 1, None))
+            return lines
+        product_ids = event.get("product_ids")
+        if product_ids:
+            if not isinstance(product_ids, list):
+                product_ids = [product_ids]
+            keys = (product_key(value) for value in product_ids)
+            return [(key, 1, None) for key in keys if key is not None]
+        product_id = product_key(event.get("product_id"))
+        return [(product_id, _quantity(event.get("quantity", 1)), None)] if product_id else []
+
+    def evict_inactive(self, now: Optional[float] = None, limit: Optional[int] = None) -> int:
+        """Evict users idle longer than the TTL, oldest first"""
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl_seconds
+        evicted = 0
+        while self.users and (limit is None or evicted < limit):
+            user_id, record = next(iter(self.users.items()))
+            if record.last_seen >= cutoff:
+                break
+            del self.users[user_id]
+            evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def get(self, user_id: str) -> Optional[UserFeatures]:
+        return self.users.get(user_id)
+
+    def features(self, user_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        """Readable feature summary for prompts, recommendations and cart rules"""
+        record = self.users.get(user_id)
+        if record is None:
+            return None
+        now = time.time() if now is None else now
+        names = {slot: name for name, slot in self.category_slots.items()}
+        category_counts = record.counters[:N_CATEGORIES]
+        top_categories = sorted(
+            ((count, names.get(slot, f"slot_{slot}")) for slot, count in enumerate(category_counts) if count),
+            reverse=True
+        )[:3]
+        spend_counts = record.counters[N_CATEGORIES:]
+        spend = record.spend_cents / 100
+        return {
+            "top_categories": [name for _, name in top_categories],
+            "category_counts": {name: count for count, name in top_categories},
+            "purchases": sum(spend_counts),
+            "lifetime_spend": round(spend, 2),
+            "typical_spend_bucket": self._spend_label(max(range(N_SPEND), key=lambda i: spend_counts[i]))
+            if any(spend_counts) else None,
+            "sessions": record.sessions,
+            "seconds_since_last_seen": max(int(now) - record.last_seen, 0),
+            "loyalty_tier": self.loyalty_tier(user_id),
+            "segment": self.segment(user_id)
+        }
+
+    @staticmethod
+    def _spend_label(bucket: int) -> str:
+        low = SPEND_EDGES[bucket - 1] if bucket > 0 else 0
+        return f"${low}+" if bucket == len(SPEND_EDGES) else f"${low}-{SPEND_EDGES[bucket]}"
+
+    def loyalty_tier(self, user_id: str) -> Optional[str]:
+        record = self.users.get(user_id)
+        if record is None:
+            return None
+        spend = record.spend_cents / 100
+        for tier, threshold in LOYALTY_THRESHOLDS:
+            if spend >= threshold:
+                return tier
+        return None
+
+    def segment(self, user_id: str) -> str:
+        """Smart-deal segment derived from purchase history"""
+        record = self.users.get(user_id)
+        if record is None or not any(record.counters[N_CATEGORIES:]):
+            return "new_customer"
+        return "premium" if record.spend_cents >= 300 * 100 else "regular"
+
+    def bytes_per_user(self, sample: int = 100) -> int:
+        """Approximate resident bytes per user from a sample of records"""
+        if not self.users:
+            return 0
+        total = 0
+        taken = 0
+        for user_id, record in self.users.items():
+            total += (sys.getsizeof(user_id) + sys.getsizeof(record) + sys.getsizeof(record.counters)
+                      + sys.getsizeof(record.last_seen) + sys.getsizeof(record.session_tag)
+                      + sys.getsizeof(record.spend_cents))
+            taken += 1
+            if taken >= sample:
+                break
+        # Plus the OrderedDict's per-entry hash slot and linked-list node (~100 bytes)
+        return total // taken + 100
+
+    def stats(self) -> Dict:
+        per_user = self.bytes_per_user()
+        return {
+            "users": len(self.users),
+            "updates": self.updates,
+            "evicted": self.evicted,
+            "category_slots_used": len(set(self.category_slots.values())),
+            "ttl_seconds": self.ttl_seconds,
+            "approx_bytes_per_user": per_user,
+            "approx_memory_bytes": per_user * len(self.users)
+        }
+
+    def snapshot(self, path: str, users: Optional[list] = None) -> int:
+        """Write records to a compact binary file; returns users written
+
+        Pass `users` (a list copy of `self.users.items()`) to serialize from
+        a worker thread while the event loop keeps mutating the store.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        users = list(self.users.items()) if users is None else users
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack("<I", len(users)))
+            for user_id, record in users:
+                encoded = user_id.encode("utf-8")
+                f.write(struct.pack("<H", len(encoded)))
+                f.write(encoded)
+                f.write(_RECORD.pack(record.last_seen, record.sessions, record.session_tag,
+                                     record.spend_cents, *record.counters))
+        os.replace(tmp_path, path)
+        return len(users)
+
+    def restore(self, path: str, now: Optional[float] = None) -> int:
+        if not os.path.exists(path):
+            return 0
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl_seconds
+        restored = 0
+        with open(path, "rb") as f:
+            if f.read(4) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a user feature snapshot")
+            (count,) = struct.unpack("<I", f.read(4))
+            for _ in range(count):
+                (length,) = struct.unpack("<H", f.read(2))
+                user_id = f.read(length).decode("utf-8")
+                fields = _RECORD.unpack(f.read(_RECORD.size))
+                if fields[0] < cutoff:
+                    continue
+                record = UserFeatures()
+                record.last_seen, record.sessions, record.session_tag, record.spend_cents = fields[:4]
+                record.counters = array("H", fields[4:])
+                self.users[user_id] = record
+                restored += 1
+        return restored
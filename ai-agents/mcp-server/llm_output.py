@@ -0,0 +1,213 @@
+"""Structured LLM output handling for the MCP server.
+
+Two layers make sure a paid generation ends up as a usable result:
+
+- a schema-constrained mode that asks Gemini for `application/json`
+  output matching a response schema, so the model can't wrap the JSON in
+  markdown or prose;
+- a tolerant, incremental JSON extractor that finds the first complete
+  top-level object in streamed text (skipping code fences and chatter) and
+  repairs common defects such as trailing commas.
+
+Per-endpoint counters record generations, parse failures, repairs and
+the output tokens wasted on generations that still had to be discarded.
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, Optional
+
+import google.generativeai as genai
+
+INSIGHTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "savings_score": {"type": "integer"},
+        "percentage_saved": {"type": "integer"},
+        "insights": {
+            "type": "array",
+            "items": {"type": "string"}
+        }
+    },
+    "required": ["savings_score", "percentage_saved", "insights"]
+}
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def json_generation_config(schema: Dict) -> Optional[Any]:
+    """Generation config for schema-constrained JSON, or None if the SDK lacks it"""
+    try:
+        return genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+    except TypeError:
+        return None
+
+
+class StreamingJSONExtractor:
+    """Incrementally locates the first complete top-level JSON object in a text stream"""
+
+    def __init__(self):
+        self.buffer = []
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.complete = False
+        self.text = ""
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; returns True once a whole object has been seen"""
+        for char in chunk:
+            if self.complete:
+                break
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.stack.append("}")
+                    self.buffer.append(char)
+                continue
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append("}" if char == "{" else "]")
+            elif char in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.complete = True
+        self.text = "".join(self.buffer)
+        return self.complete
+
+    def result(self) -> Optional[Dict]:
+        """Parse the captured object, repairing trailing commas if needed"""
+        if not self.started:
+            return None
+        text = self.text
+        if not self.complete:
+            # Truncated output: close any open string and brackets and try anyway
+            text += '"' if self.in_string else ""
+            text += "".join(reversed(self.stack))
+        for candidate in (text, _TRAILING_COMMA_RE.sub(r"\1", text)):
+            try:
+                value = json.loads(candidate)
+                return value if isinstance(value, dict) else None
+            except json.JSONDecodeError:
+                continue
+        return None
+
+
+def extract_json(text: str) -> Optional[Dict]:
+    """Extract the first JSON object from model text (fences, prose and all)"""
+    extractor = StreamingJSONExtractor()
+    extractor.feed(text)
+    return extractor.result()
+
+
+def validate_insights(data: Optional[Dict], fallback: Callable[[], Dict]) -> Optional[Dict]:
+    """Coerce an insights payload into shape, filling gaps from the fallback.
+
+    Returns None only when nothing usable was generated.
+    """
+    if not isinstance(data, dict):
+        return None
+    insights = [str(i).strip() for i in data.get("insights", []) if str(i).strip()] \
+        if isinstance(data.get("insights"), list) else []
+    if not insights:
+        return None
+
+    filler = fallback()
+    result = {}
+    for key, low, high in (("savings_score", 0, 100), ("percentage_saved", 0, 50)):
+        try:
+            result[key] = max(low, min(high, int(data.get(key))))
+        except (TypeError, ValueError):
+            result[key] = filler[key]
+    result["insights"] = (insights + [i for i in filler["insights"] if i not in insights])[:3]
+    return result
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1) if text else 0
+
+
+class LLMOutputStats:
+    """Per-endpoint generation, parse-failure and wasted-token counters"""
+
+    def __init__(self):
+        self.endpoints: Dict[str, Dict[str, int]] = {}
+
+    def _counters(self, endpoint: str) -> Dict[str, int]:
+        return self.endpoints.setdefault(endpoint, {
+            "generations": 0,
+            "parsed": 0,
+            "repaired": 0,
+            "parse_failures": 0,
+            "output_tokens": 0,
+            "wasted_tokens": 0
+        })
+
+    def record(self, endpoint: str, output_tokens: int, parsed: bool, repaired: bool = False):
+        counters = self._counters(endpoint)
+        counters["generations"] += 1
+        counters["output_tokens"] += output_tokens
+        if parsed:
+            counters["parsed"] += 1
+            if repaired:
+                counters["repaired"] += 1
+        else:
+            counters["parse_failures"] += 1
+            counters["wasted_tokens"] += output_tokens
+
+    def stats(self) -> Dict:
+        return {
+            endpoint: {
+                **counters,
+                "usable_rate": round(counters["parsed"] / counters["generations"], 4)
+                if counters["generations"] else 1.0
+            }
+            for endpoint, counters in self.endpoints.items()
+        }
+
+
+def response_output_tokens(response, text: str) -> int:
+    """Output tokens from usage metadata when the SDK reports it, else an estimate"""
+    usage = getattr(response, "usage_metadata", None)
+    count = getattr(usage, "candidates_token_count", 0) if usage else 0
+    return count or _estimate_tokens(text)
+
+
+def generate_json(model, prompt: str, endpoint: str, stats: LLMOutputStats,
+                  schema: Optional[Dict] = None) -> Optional[Dict]:
+    """Generate and parse a JSON object, streaming until the object is complete"""
+    config = json_generation_config(schema) if schema else None
+    if config is not None:
+        response = model.generate_content(prompt, generation_config=config, stream=True)
+    else:
+        response = model.generate_content(prompt, stream=True)
+
+    extractor = StreamingJSONExtractor()
+    chunks = []
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. safety-only) carry nothing to parse
+            continue
+        chunks.append(text)
+        if extractor.feed(text):
+            break
+
+    text = "".join(chunks)
+    data = extractor.result()
+    repaired = data is not None and (not extractor.complete or extractor.text.strip() != text.strip())
+    stats.record(endpoint, response_output_tokens(response, text), parsed=data is not None, repaired=repaired)
+    return data
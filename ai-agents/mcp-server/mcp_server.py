@@ -1,21 +1,38 @@
 import os
 import json
 import asyncio
+import time
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import google.generativeai as genai
 from kubernetes import client, config
+import httpx
+
+from catalog import PRODUCT_CATALOG, normalize_catalog_product
+from product_index import ProductSimilarityIndex
+from cart_rules import CartRulesEngine, load_rules
+from bundle_optimizer import BundleOptimizer
+from trending import TrendingTracker, WINDOWS, GLOBAL_REGION, event_product_ids
+from distinct_counters import DistinctCounters
+from feature_store import UserFeatureStore
+from llm_backend import create_backend
+from model_router import ModelRouter
+from prompt_templates import PromptRegistry
+from overload import BrownoutController
+from prewarm import InsightsPrewarmer
+from fast_json import EncodingMetricsMiddleware, MeteredORJSONResponse, PreSerialized, VersionedPayloads, encoding_stats
+from llm_output import INSIGHTS_SCHEMA, LLMOutputStats, generate_json, response_output_tokens, validate_insights
 
 # Initialize FastAPI
 app = FastAPI(
     title="MCP Server - AI Shopping Assistant",
     description="Provides AI-powered shopping insights and cart optimization",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=MeteredORJSONResponse
 )
 
 # Add CORS
@@ -26,16 +43,59 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(EncodingMetricsMiddleware)
 
 # Initialize Gemini
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+# LLM_BACKEND=fake runs without a key against a local stand-in
+llm_backend = create_backend(GEMINI_API_KEY)
+if llm_backend:
+    # Picks a Gemini tier per request class from latency SLOs and observed health
+    model_router = ModelRouter(backend=llm_backend)
 else:
-    model = None
+    model_router = None
     print("Warning: GEMINI_API_KEY not set, using fallback responses")
 
+# Ask Gemini for schema-constrained JSON where the SDK supports it
+LLM_STRUCTURED_OUTPUT = os.environ.get("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+llm_stats = LLMOutputStats()
+
+# Serve deterministic fallbacks instead of queueing LLM calls when overloaded
+brownout = BrownoutController(
+    max_inflight=int(os.environ.get("LLM_MAX_INFLIGHT", 16)),
+    latency_budget_ms=float(os.environ.get("LLM_LATENCY_BUDGET_MS", 3000))
+)
+
+# Fixed instructions live in the template prefix; only the variables change per request
+prompts = PromptRegistry()
+INSIGHTS_PROMPT = prompts.register(
+    "insights",
+    prefix="""
+Generate personalized shopping insights for the shopper described below.
+Return ONLY a JSON object with:
+- savings_score (integer 0-100)
+- percentage_saved (integer 0-50)
+- insights (array of exactly 3 actionable insights)
+
+Keep insights brief and actionable. No markdown, just plain JSON.
+""",
+    body="""
+User: {user_id}
+Shopper profile: {profile}
+"""
+)
+CHAT_PROMPT = prompts.register(
+    "chat",
+    prefix="""
+You are a helpful shopping assistant for an online boutique.
+Provide a brief, helpful response (max 150 characters).
+Be friendly, informative, and focused on helping with shopping.
+""",
+    body="""
+User message: "{message}"
+"""
+)
+
 # Try to load k8s config
 try:
     config.load_incluster_config()
@@ -49,8 +109,12 @@ except:
 
 # Request models
 class CartAnalysisRequest(BaseModel):
-    user_id: str
+    user_id: Optional[str] = None
     cart_items: list = []
+    loyalty_tier: Optional[str] = None
+
+class CartBatchRequest(BaseModel):
+    carts: List[CartAnalysisRequest]
 
 class ChatRequest(BaseModel):
     user_id: str
@@ -59,122 +123,262 @@ class ChatRequest(BaseModel):
 # Simple in-memory cache for demo purposes
 cache = {
     "decisions_count": 142,
-    "optimizations_count": 37,
-    "users_helped": 89
+    "optimizations_count": 37
 }
 
+# Unique users/sessions via HyperLogLog; snapshotted so counts survive restarts
+DISTINCT_STATE_PATH = os.environ.get("DISTINCT_STATE_PATH", "/tmp/mcp_distinct_counters.json")
+DISTINCT_SNAPSHOT_SECONDS = float(os.environ.get("DISTINCT_SNAPSHOT_SECONDS", 60))
+distinct_counters = DistinctCounters()
+
+async def snapshot_distinct_counters_periodically():
+    while True:
+        await asyncio.sleep(DISTINCT_SNAPSHOT_SECONDS)
+        try:
+            distinct_counters.snapshot(DISTINCT_STATE_PATH)
+        except Exception as e:
+            print(f"Distinct counter snapshot error: {e}")
+
+@app.on_event("startup")
+async def restore_distinct_counters():
+    try:
+        restored = distinct_counters.restore(DISTINCT_STATE_PATH)
+        print(f"Restored {restored} distinct-counter sketches from {DISTINCT_STATE_PATH}")
+    except Exception as e:
+        print(f"Could not restore distinct counters: {e}")
+    asyncio.create_task(snapshot_distinct_counters_periodically())
+
+@app.on_event("shutdown")
+async def save_distinct_counters():
+    try:
+        distinct_counters.snapshot(DISTINCT_STATE_PATH)
+    except Exception as e:
+        print(f"Distinct counter snapshot error: {e}")
+
+# Per-user features (category interest, spend, recency, sessions) from /track
+USER_FEATURES_PATH = os.environ.get("USER_FEATURES_PATH", "/tmp/mcp_user_features.bin")
+USER_FEATURES_SNAPSHOT_SECONDS = float(os.environ.get("USER_FEATURES_SNAPSHOT_SECONDS", 300))
+feature_store = UserFeatureStore(
+    ttl_seconds=float(os.environ.get("USER_FEATURES_TTL_SECONDS", 7 * 86400)),
+    max_users=int(os.environ.get("USER_FEATURES_MAX_USERS", 1_000_000))
+)
+
+async def snapshot_user_features():
+    # Copy the entries on the event loop, serialize them off it
+    users = list(feature_store.users.items())
+    return await asyncio.to_thread(feature_store.snapshot, USER_FEATURES_PATH, users)
+
+async def maintain_user_features_periodically():
+    """Evict inactive users and snapshot the store to disk"""
+    while True:
+        await asyncio.sleep(USER_FEATURES_SNAPSHOT_SECONDS)
+        try:
+            feature_store.evict_inactive()
+            await snapshot_user_features()
+        except Exception as e:
+            print(f"User feature snapshot error: {e}")
+
+@app.on_event("startup")
+async def restore_user_features():
+    try:
+        restored = feature_store.restore(USER_FEATURES_PATH)
+        print(f"Restored {restored} user feature records from {USER_FEATURES_PATH}")
+    except Exception as e:
+        print(f"Could not restore user features: {e}")
+    asyncio.create_task(maintain_user_features_periodically())
+
+@app.on_event("shutdown")
+async def save_user_features():
+    try:
+        await snapshot_user_features()
+    except Exception as e:
+        print(f"User feature snapshot error: {e}")
+
+# Content-based similarity index for cold-start recommendations
+PRODUCT_CATALOG_URL = os.environ.get("PRODUCT_CATALOG_URL", "")
+similarity_index = ProductSimilarityIndex(
+    approximate_threshold=int(os.environ.get("SIMILARITY_APPROX_THRESHOLD", 5000))
+)
+
+async def load_catalog_products() -> list:
+    """Fetch catalog products from the product-catalog MCP (ProductCatalogService)"""
+    if not PRODUCT_CATALOG_URL:
+        return []
+    try:
+        async with httpx.AsyncClient() as http_client:
+            response = await http_client.post(f"{PRODUCT_CATALOG_URL}/list_products", timeout=10.0)
+            response.raise_for_status()
+            data = response.json()
+    except Exception as e:
+        print(f"Could not load product catalog from {PRODUCT_CATALOG_URL}: {e}")
+        return []
+
+    return [normalize_catalog_product(p) for p in data.get("products", [])]
+
+# Cart rules are compiled against the catalog at startup
+cart_rules = CartRulesEngine(PRODUCT_CATALOG, load_rules())
+
+# Streaming heavy hitters per region over sliding windows, fed from /track
+trending = TrendingTracker()
+
+# Smart-deal bundles are precomputed per segment and served from memory
+bundle_optimizer = BundleOptimizer(similarity_index=similarity_index)
+# Encoded smart-deal payloads per segment, reused until the segment's bundles change
+deal_payloads = VersionedPayloads()
+
+# Per-user encoded responses: repeat widget opens get a 304 without recomputation
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 50000))
+INSIGHTS_TTL_SECONDS = float(os.environ.get("INSIGHTS_TTL_SECONDS", 300))
+INSIGHTS_FALLBACK_TTL_SECONDS = float(os.environ.get("INSIGHTS_FALLBACK_TTL_SECONDS", 30))
+RECOMMENDATIONS_TTL_SECONDS = float(os.environ.get("RECOMMENDATIONS_TTL_SECONDS", 60))
+SMART_DEALS_MAX_AGE = 300
+insights_payloads = VersionedPayloads(max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+recommendation_payloads = VersionedPayloads(max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+def cache_control(max_age: float) -> Dict[str, str]:
+    return {"Cache-Control": f"private, max-age={max(int(max_age), 0)}"}
+
+async def refresh_bundles_periodically():
+    """Rebuild each segment's bundles when its cache entry expires"""
+    while True:
+        await asyncio.sleep(max(bundle_optimizer.seconds_until_next_expiry(), 1.0))
+        try:
+            refreshed = bundle_optimizer.refresh_expired()
+            if refreshed:
+                print(f"Refreshed smart-deal bundles for: {', '.join(refreshed)}")
+        except Exception as e:
+            print(f"Bundle refresh error: {e}")
+
+@app.on_event("startup")
+async def initialize_catalog():
+    catalog_products = await load_catalog_products()
+    known_ids = {p["id"] for p in catalog_products}
+    products = catalog_products + [p for p in PRODUCT_CATALOG if p["id"] not in known_ids]
+    similarity_index.build(products)
+    print(f"Similarity index built: {similarity_index.stats()}")
+    cart_rules.compile(products, load_rules())
+    print(f"Cart rules compiled: {len(cart_rules.bundle_names)} bundles, "
+          f"{len(cart_rules.bulk_min_quantity)} bulk tiers, {len(cart_rules.loyalty_tiers)} loyalty tiers")
+    bundle_optimizer.set_catalog(products)
+    feature_store.set_catalog(products)
+    bundle_optimizer.refresh()
+    asyncio.create_task(refresh_bundles_periodically())
+
+# Constant for the life of the process: encoded once, served with an ETag
+ROOT_PAYLOAD = PreSerialized({
+    "service": "MCP Server",
+    "status": "running",
+    "version": "1.0.0",
+    "ai_enabled": bool(model_router)
+})
+
 @app.get("/")
-async def root():
-    return {
-        "service": "MCP Server",
-        "status": "running",
-        "version": "1.0.0",
-        "ai_enabled": bool(model)
-    }
+async def root(request: Request):
+    return ROOT_PAYLOAD.response(request)
 
 @app.get("/health")
 async def health():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "ai_model": "gemini-1.5-flash" if model else "fallback",
+        "ai_model": "routed" if model_router else "fallback",
         "cache_size": len(cache)
     }
 
-@app.post("/analyze-cart/{user_id}")
-async def analyze_cart(user_id: str):
-    """Analyze cart and provide optimization suggestions"""
+def format_cart_analysis(user_id: str, analysis: Dict) -> Dict:
+    """Attach request metadata to a rules-engine result"""
+    now = datetime.now().timestamp()
+    return {
+        "user_id": user_id,
+        **analysis,
+        "optimization_id": f"opt_{user_id}_{now}",
+        "expires_at": now + 3600  # 1 hour
+    }
+
+@app.post("/analyze-cart/batch")
+async def analyze_cart_batch(request: CartBatchRequest):
+    """Analyze many carts in a single vectorized pass"""
     
-    # Simulate cart analysis with intelligent optimizations
-    optimizations = [
-        {
-            "type": "shipping",
-            "message": "Add 1 more item for free shipping!",
-            "savings": 0,
-            "threshold": 50,
-            "action": "add_item"
-        },
-        {
-            "type": "bundle",
-            "message": "Bundle these items and save 15%!",
-            "savings": 25.99,
-            "discount": 15,
-            "action": "create_bundle"
-        },
-        {
-            "type": "bulk",
-            "message": "You qualify for our bulk discount!",
-            "savings": 35.50,
-            "discount": 20,
-            "action": "apply_bulk_discount"
-        },
-        {
-            "type": "loyalty",
-            "message": "Premium member discount applied!",
-            "savings": 45.00,
-            "discount": 25,
-            "action": "apply_loyalty_discount"
-        }
+    carts = [cart.model_dump() for cart in request.carts]
+    for cart in carts:
+        if not cart["loyalty_tier"] and cart["user_id"]:
+            cart["loyalty_tier"] = feature_store.loyalty_tier(cart["user_id"])
+    analyses = cart_rules.evaluate_batch(carts)
+    results = [
+        format_cart_analysis(cart.user_id or "anonymous", analysis)
+        for cart, analysis in zip(request.carts, analyses)
     ]
     
-    # Simulate different cart scenarios
-    import random
-    cart_scenario = random.choice(optimizations)
-    
     # Update cache
-    cache["optimizations_count"] = cache.get("optimizations_count", 0) + 1
+    cache["optimizations_count"] = cache.get("optimizations_count", 0) + sum(
+        1 for r in results if r["optimization_available"])
     
     return {
-        "user_id": user_id,
-        "optimization_available": True,
-        "optimization_type": cart_scenario["type"],
-        "message": cart_scenario["message"],
-        "potential_savings": cart_scenario["savings"],
-        "optimization_id": f"opt_{user_id}_{datetime.now().timestamp()}",
-        "confidence_score": random.uniform(0.8, 0.95),
-        "action_required": cart_scenario["action"],
-        "expires_at": datetime.now().timestamp() + 3600  # 1 hour
+        "results": results,
+        "total_carts": len(results),
+        "optimizable_carts": sum(1 for r in results if r["optimization_available"])
     }
 
+@app.post("/analyze-cart/{user_id}")
+async def analyze_cart(user_id: str, request: Optional[CartAnalysisRequest] = None):
+    """Analyze cart and provide optimization suggestions"""
+    
+    request = request or CartAnalysisRequest()
+    loyalty_tier = request.loyalty_tier or feature_store.loyalty_tier(user_id)
+    analysis = cart_rules.evaluate(request.cart_items, loyalty_tier)
+    
+    # Update cache
+    if analysis["optimization_available"]:
+        cache["optimizations_count"] = cache.get("optimizations_count", 0) + 1
+    
+    return format_cart_analysis(user_id, analysis)
+
 @app.get("/insights/{user_id}")
-async def get_insights(user_id: str):
+async def get_insights(user_id: str, request: Request):
     """Get AI-powered shopping insights"""
     
-    if model:
+    # Count unique users, not requests
+    distinct_counters.add("users_helped", user_id)
+    
+    payload = insights_payloads.peek(user_id)
+    prewarmer.record_request(user_id, cache_hit=payload is not None)
+    if payload is None:
+        insights_data, from_model = await generate_insights(user_id)
+        payload = store_insights(user_id, insights_data, from_model)
+    return payload.response(request, headers=cache_control(insights_payloads.seconds_left(user_id)))
+
+def store_insights(user_id: str, insights_data: Dict, from_model: bool) -> PreSerialized:
+    return insights_payloads.put(user_id, None, {
+        **insights_data,
+        "user_id": user_id,
+        "generated_at": datetime.now().isoformat()
+    }, ttl_seconds=INSIGHTS_TTL_SECONDS if from_model else INSIGHTS_FALLBACK_TTL_SECONDS)
+
+async def generate_insights(user_id: str, endpoint: str = "insights") -> tuple:
+    """Insights for a user and whether they came from the model (False for fallbacks)"""
+    
+    features = feature_store.features(user_id)
+    
+    if model_router and brownout.admit(endpoint):
         try:
-            prompt = f"""
-            Generate personalized shopping insights for user {user_id}.
-            Return ONLY a JSON object with:
-            - savings_score (integer 0-100)
-            - percentage_saved (integer 0-50)
-            - insights (array of exactly 3 actionable insights)
-            
-            Keep insights brief and actionable. No markdown, just plain JSON.
-            """
+            profile = json.dumps(features) if features else "new shopper, no history yet"
+            prompt = INSIGHTS_PROMPT.render(user_id=user_id, profile=profile)
             
-            response = model.generate_content(prompt)
-            # Try to parse AI response
-            try:
-                insights_data = json.loads(response.text.strip())
-            except:
-                # Fallback if parsing fails
-                insights_data = generate_fallback_insights()
+            with brownout.track(), model_router.route("insights", INSIGHTS_PROMPT) as call:
+                data = await asyncio.to_thread(
+                    generate_json, call, prompt, endpoint, llm_stats,
+                    INSIGHTS_SCHEMA if LLM_STRUCTURED_OUTPUT else None
+                )
+            # Repair partial output instead of discarding the generation
+            insights_data = validate_insights(data, lambda: generate_fallback_insights(features))
+            if insights_data is not None:
+                return insights_data, True
         except Exception as e:
             print(f"Gemini API error: {e}")
-            insights_data = generate_fallback_insights()
-    else:
-        insights_data = generate_fallback_insights()
     
-    # Update cache
-    cache["users_helped"] = cache.get("users_helped", 0) + 1
-    
-    return {
-        **insights_data,
-        "user_id": user_id,
-        "generated_at": datetime.now().isoformat()
-    }
+    return generate_fallback_insights(features), False
 
-def generate_fallback_insights():
+def generate_fallback_insights(features: Optional[Dict] = None):
     """Generate fallback insights when AI is unavailable"""
     import random
     
@@ -192,68 +396,100 @@ def generate_fallback_insights():
         "Early bird discounts are perfect for you"
     ]
     
+    insights = random.sample(insight_options, 3)
+    if features and features["top_categories"]:
+        insights[0] = f"You save most on {features['top_categories'][0]} purchases"
+    
     return {
         "savings_score": random.choice(scores),
         "percentage_saved": random.choice(savings),
-        "insights": random.sample(insight_options, 3)
+        "insights": insights
     }
 
+# Generate insights ahead of the widget click for engaged shoppers
+PREWARM_BUDGET_SHARE = float(os.environ.get("PREWARM_BUDGET_SHARE", 0.25))
+PREWARM_MIN_FRESH_SECONDS = 60
+
+async def prewarm_insights(user_id: str) -> bool:
+    insights_data, from_model = await generate_insights(user_id, endpoint="insights_prewarm")
+    if not from_model:
+        return False   # shed by brownout or failed; leave it to the on-demand path
+    store_insights(user_id, insights_data, from_model)
+    return True
+
+prewarmer = InsightsPrewarmer(
+    warm=prewarm_insights,
+    is_fresh=lambda user_id: insights_payloads.seconds_left(user_id) > PREWARM_MIN_FRESH_SECONDS,
+    workers=int(os.environ.get("PREWARM_WORKERS", 2)),
+    budget_slots=max(1, int(PREWARM_BUDGET_SHARE * brownout.max_inflight)),
+    queue_size=int(os.environ.get("PREWARM_QUEUE_SIZE", 1000)),
+    trigger_score=int(os.environ.get("PREWARM_TRIGGER_SCORE", 3))
+)
+
+@app.on_event("startup")
+async def start_prewarmer():
+    if model_router:
+        prewarmer.start()
+
+@app.on_event("shutdown")
+async def stop_prewarmer():
+    await prewarmer.stop()
+
 @app.get("/recommendations/{user_id}")
-async def get_recommendations(user_id: str):
+async def get_recommendations(user_id: str, request: Request, similar_to: Optional[str] = None,
+                              region: Optional[str] = None):
     """Get personalized product recommendations"""
     
-    # Enhanced product catalog
-    products = [
-        {
-            "id": "OLJCESPC7Z",
-            "name": "Vintage Camera Lens",
-            "price": 49.99,
-            "image": "/static/img/products/camera-lens.jpg",
-            "reason": "Based on your photography interests",
-            "match_score": 95,
-            "category": "photography"
-        },
-        {
-            "id": "66VCHSJNUP",
-            "name": "Vintage Record Player",
-            "price": 129.99,
-            "image": "/static/img/products/record-player.jpg",
-            "reason": "Customers also bought",
-            "match_score": 87,
-            "category": "music"
-        },
-        {
-            "id": "1YMWWN1N4O",
-            "name": "Home Barista Kit",
-            "price": 89.99,
-            "image": "/static/img/products/barista-kit.jpg",
-            "reason": "Trending in your area",
-            "match_score": 82,
-            "category": "kitchen"
-        },
-        {
-            "id": "2ZYFJ3GM2N",
-            "name": "Artisan Coffee Beans",
-            "price": 24.99,
-            "image": "/static/img/products/coffee-beans.jpg",
-            "reason": "Perfect with your recent purchases",
-            "match_score": 89,
-            "category": "consumables"
-        },
-        {
-            "id": "9SIQT8TOJO",
-            "name": "Vintage Typewriter",
-            "price": 199.99,
-            "image": "/static/img/products/typewriter.jpg",
-            "reason": "Based on browsing history",
-            "match_score": 78,
-            "category": "vintage"
-        }
+    # Reuse the encoded list until the shopper does something new or it ages out
+    key = (user_id, similar_to, region)
+    record = feature_store.get(user_id)
+    version = record.last_seen if record else 0
+    payload = recommendation_payloads.peek(key, version)
+    if payload is None:
+        payload = recommendation_payloads.put(
+            key, version, build_recommendations(user_id, similar_to, region),
+            ttl_seconds=RECOMMENDATIONS_TTL_SECONDS
+        )
+    return payload.response(request, headers={"Cache-Control": "private, no-cache"})
+
+def build_recommendations(user_id: str, similar_to: Optional[str], region: Optional[str]) -> Dict:
+    """Similar items, else trending, favourite-category and random picks"""
+    # Content-based recommendations for cold-start users browsing a product
+    if similar_to:
+        recommendations = similar_products(similar_to, 4)
+        if recommendations:
+            return {
+                "user_id": user_id,
+                "recommendations": recommendations,
+                "total_count": len(recommendations),
+                "algorithm": "content_similarity_tfidf"
+            }
+    
+    # Products actually trending in the shopper's region lead the list
+    trending_ids = [item["product_id"] for item in trending.top(region or GLOBAL_REGION, "1h", 4)["items"]]
+    catalog_by_id = {p["id"]: p for p in PRODUCT_CATALOG}
+    recommendations = [
+        {**catalog_by_id[pid], "reason": "Trending in your area"}
+        for pid in trending_ids if pid in catalog_by_id
     ]
     
-    # Return randomized recommendations
+    # Then products from the shopper's favourite categories
+    features = feature_store.features(user_id)
+    if features:
+        for category in features["top_categories"]:
+            for product in PRODUCT_CATALOG:
+                if len(recommendations) < 4 and product["category"] == category and \
+                        product["id"] not in {r["id"] for r in recommendations}:
+                    recommendations.append({**product, "reason": f"Based on your {category} interests"})
+    
+    # Fill the rest with randomized recommendations
     import random
-    recommendations = random.sample(products, min(4, len(products)))
+    chosen_ids = {r["id"] for r in recommendations}
+    products = [p for p in PRODUCT_CATALOG if p["id"] not in chosen_ids]
+    for product in random.sample(products, min(4 - len(recommendations), len(products))):
+        if product["reason"] == "Trending in your area":
+            product = {**product, "reason": "Popular with shoppers like you"}
+        recommendations.append(product)
     
     return {
         "user_id": user_id,
@@ -262,62 +498,97 @@ async def get_recommendations(user_id: str):
         "algorithm": "collaborative_filtering_v2"
     }
 
+def similar_products(product_id: str, k: int) -> list:
+    """Format similarity index neighbours as recommendation entries"""
+    position = similarity_index.positions.get(product_id)
+    if position is None:
+        return []
+    anchor = similarity_index.products[position]
+    
+    recommendations = []
+    for match in similarity_index.similar_to(product_id, k):
+        product = match["product"]
+        recommendations.append({
+            "id": product["id"],
+            "name": product.get("name", ""),
+            "price": product.get("price", 0),
+            "image": product.get("image", ""),
+            "reason": f"Similar to {anchor.get('name', product_id)}",
+            "match_score": int(round(max(match["score"], 0) * 100)),
+            "category": product.get("category", "general")
+        })
+    return recommendations
+
+@app.get("/similar/{product_id}")
+async def get_similar_products(product_id: str, k: int = 4):
+    """Get products similar to product_id from catalog text"""
+    
+    if product_id not in similarity_index.positions:
+        raise HTTPException(status_code=404, detail=f"Product '{product_id}' not found")
+    
+    similar = similar_products(product_id, max(1, min(k, 50)))
+    return {
+        "product_id": product_id,
+        "similar": similar,
+        "total_count": len(similar),
+        "algorithm": "content_similarity_tfidf"
+    }
+
 @app.get("/smart-deals/{user_id}")
-async def get_smart_deals(user_id: str):
+async def get_smart_deals(user_id: str, request: Request, segment: Optional[str] = None):
     """Get AI-negotiated deals and bundles"""
     
-    deals = [
-        {
-            "bundle_name": "Photography Starter Pack",
-            "description": "Camera + Lens + Tripod",
-            "items": ["Camera", "Vintage Lens", "Professional Tripod"],
-            "original_price": 299.99,
-            "ai_price": 219.99,
-            "discount": 27,
-            "expires_in": "2 hours"
-        },
-        {
-            "bundle_name": "Home Office Setup",
-            "description": "Desk Lamp + Organizer + Plant",
-            "items": ["LED Desk Lamp", "Bamboo Organizer", "Succulent Plant"],
-            "original_price": 149.99,
-            "ai_price": 99.99,
-            "discount": 33,
-            "expires_in": "4 hours"
-        },
-        {
-            "bundle_name": "Coffee Enthusiast Bundle",
-            "description": "Barista Kit + Premium Beans + Grinder",
-            "items": ["Barista Kit", "Artisan Beans", "Manual Grinder"],
-            "original_price": 179.99,
-            "ai_price": 129.99,
-            "discount": 28,
-            "expires_in": "6 hours"
-        }
-    ]
+    segment = bundle_optimizer.resolve(segment or feature_store.segment(user_id))
+    
+    # Deals only change when the segment is rebuilt or its expires_in label ticks over
+    version = bundle_optimizer.version(segment)
+    payload = deal_payloads.peek(segment, version) if version else None
+    if payload is None:
+        bundles = bundle_optimizer.get(segment)
+        expires_in = bundles["deals"][0]["expires_in"] if bundles["deals"] else ""
+        payload = deal_payloads.put(segment, (bundles["generated_at"], expires_in), {
+            "segment": bundles["segment"],
+            "deals": bundles["deals"],
+            "total_savings": bundles["total_savings"],
+            "ai_negotiated": True,
+            "expires_at": bundles["expires_at"]
+        })
+    
+    seconds_left = bundle_optimizer.cache[segment]["expires_at"] - time.time()
+    return payload.response(request, headers=cache_control(min(seconds_left, SMART_DEALS_MAX_AGE)),
+                            extra={"user_id": user_id})
+
+@app.get("/trending")
+async def get_trending(region: str = GLOBAL_REGION, window: str = "1h", k: int = 10):
+    """Top trending products for a region over a sliding window"""
+    
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Unknown window '{window}', use one of {list(WINDOWS)}")
+    
+    result = trending.top(region, window, max(1, min(k, 50)))
+    catalog_by_id = {p["id"]: p for p in PRODUCT_CATALOG}
+    for item in result["items"]:
+        product = catalog_by_id.get(item["product_id"])
+        if product:
+            item["name"] = product["name"]
     
     return {
-        "user_id": user_id,
-        "deals": deals,
-        "total_savings": sum(deal["original_price"] - deal["ai_price"] for deal in deals),
-        "ai_negotiated": True
+        **result,
+        "error_bound": round(result["error_bound"], 2),
+        "stats": trending.stats()
     }
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
     """AI-powered chat assistant"""
     
-    if model:
+    if model_router and brownout.admit("chat"):
         try:
-            prompt = f"""
-            You are a helpful shopping assistant for an online boutique.
-            User message: "{request.message}"
+            prompt = CHAT_PROMPT.render(message=request.message)
             
-            Provide a brief, helpful response (max 150 characters).
-            Be friendly, informative, and focused on helping with shopping.
-            """
-            
-            response = model.generate_content(prompt)
+            with brownout.track(), model_router.route("chat", CHAT_PROMPT) as call:
+                response = await asyncio.to_thread(call.generate_content, prompt)
+            llm_stats.record("chat", response_output_tokens(response, response.text), parsed=True)
             return {
                 "user_id": request.user_id,
                 "response": response.text[:150],
@@ -366,11 +637,23 @@ async def track_event(event: dict):
     # In a real implementation, this would go to analytics service
     print(f"Event tracked: {event_data}")
     
+    # Feed the trending tracker and the user's feature record
+    trending.record_event(event)
+    feature_store.update(event)
+    if model_router:
+        prewarmer.observe(event)
+    
+    distinct_counters.add("sessions", event.get("session_id"))
+    
     # Update cache counters
     if event.get("type") == "optimization_applied":
         cache["optimizations_count"] = cache.get("optimizations_count", 0) + 1
+        distinct_counters.add("optimized_users", event.get("user_id"))
     elif event.get("type") == "ai_decision":
         cache["decisions_count"] = cache.get("decisions_count", 0) + 1
+    elif event.get("type") == "purchase":
+        # Feed co-purchase affinity for the bundle optimizer
+        bundle_optimizer.affinity.record(event_product_ids(event))
     
     return {"status": "tracked", "event_id": f"evt_{datetime.now().timestamp()}"}
 
@@ -401,41 +684,91 @@ async def get_metrics():
         **k8s_metrics,
         "ai_decisions_made": cache.get("decisions_count", 142),
         "optimizations_applied": cache.get("optimizations_count", 37),
-        "users_helped": cache.get("users_helped", 89),
-        "ai_model_available": bool(model),
+        "users_helped": distinct_counters.count("users_helped", "hour", periods=24),
+        "distinct_counts": {
+            **distinct_counters.summary(),
+            "sketch_stats": distinct_counters.stats()
+        },
+        "ai_model_available": bool(model_router),
         "uptime": "operational",
         "cache_stats": {
             "size": len(cache),
             "keys": list(cache.keys())
+        },
+        "similarity_index": similarity_index.stats(),
+        "bundle_optimizer": bundle_optimizer.stats(),
+        "trending": trending.stats(),
+        "user_features": feature_store.stats(),
+        "model_routing": model_router.stats() if model_router else None,
+        "prompt_templates": prompts.stats(),
+        "brownout": brownout.stats(),
+        "insights_prewarm": prewarmer.stats(),
+        "json_encoding": {
+            "routes": encoding_stats.stats(),
+            "smart_deal_payloads": deal_payloads.stats(),
+            "insights_payloads": insights_payloads.stats(),
+            "recommendation_payloads": recommendation_payloads.stats()
+        },
+        "llm_output": {
+            "structured_mode": LLM_STRUCTURED_OUTPUT,
+            "endpoints": llm_stats.stats()
         }
     }
 
+@app.get("/users/{user_id}/features")
+async def get_user_features(user_id: str):
+    """Per-user features accumulated from tracked events"""
+    features = feature_store.features(user_id)
+    if features is None:
+        raise HTTPException(status_code=404, detail=f"No tracked activity for user '{user_id}'")
+    return {"user_id": user_id, **features}
+
+@app.get("/metrics/distinct/state")
+async def export_distinct_state():
+    """Export HyperLogLog sketches so other replicas can merge them"""
+    return distinct_counters.export_state()
+
+@app.post("/metrics/distinct/merge")
+async def merge_distinct_state(state: dict):
+    """Merge HyperLogLog sketches exported by another replica"""
+    try:
+        merged = distinct_counters.merge_state(state)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "merged", "sketches_merged": merged}
+
+STATUS_PAYLOAD = PreSerialized({
+    "service": "MCP Server",
+    "status": "healthy",
+    "version": "1.0.0",
+    "ai_enabled": bool(model_router),
+    "features": {
+        "cart_optimization": True,
+        "personalized_recommendations": True,
+        "content_similarity": True,
+        "smart_deals": True,
+        "chat_assistant": True,
+        "event_tracking": True,
+        "metrics_collection": True
+    },
+    "endpoints": {
+        "health": "/health",
+        "insights": "/insights/{user_id}",
+        "cart_analysis": "/analyze-cart/{user_id}",
+        "cart_analysis_batch": "/analyze-cart/batch",
+        "recommendations": "/recommendations/{user_id}",
+        "similar_products": "/similar/{product_id}",
+        "smart_deals": "/smart-deals/{user_id}",
+        "trending": "/trending",
+        "chat": "/chat",
+        "metrics": "/metrics"
+    }
+})
+
 @app.get("/status")
-async def get_status():
+async def get_status(request: Request):
     """Detailed service status"""
-    return {
-        "service": "MCP Server",
-        "status": "healthy",
-        "version": "1.0.0",
-        "ai_enabled": bool(model),
-        "features": {
-            "cart_optimization": True,
-            "personalized_recommendations": True,
-            "smart_deals": True,
-            "chat_assistant": True,
-            "event_tracking": True,
-            "metrics_collection": True
-        },
-        "endpoints": {
-            "health": "/health",
-            "insights": "/insights/{user_id}",
-            "cart_analysis": "/analyze-cart/{user_id}",
-            "recommendations": "/recommendations/{user_id}",
-            "smart_deals": "/smart-deals/{user_id}",
-            "chat": "/chat",
-            "metrics": "/metrics"
-        }
-    }
+    return STATUS_PAYLOAD.response(request)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
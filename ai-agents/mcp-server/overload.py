@@ -0,0 +1,124 @@
+"""Brownout controller that sheds LLM work to fast fallbacks under overload.
+
+Load is the larger of two ratios: LLM calls in flight over the allowed
+queue depth, and the rolling p95 LLM latency over the latency budget.
+Each endpoint has a priority. Low-priority endpoints switch to their
+deterministic fallback at a lower load than high-priority ones, so the
+most valuable LLM traffic is kept longest.
+
+Switching uses hysteresis. An endpoint enters brownout when load reaches
+its enter threshold and leaves only after load has dropped below a lower
+exit threshold and it has stayed degraded for a minimum dwell time. This
+stops endpoints flapping around one threshold. Latency samples age out of
+the window, so an endpoint that sends no LLM traffic while browned out
+still sees its load fall and recovers.
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Higher priority = kept on the LLM longer under load
+ENDPOINT_PRIORITIES = {
+    "insights_prewarm": 0,
+    "insights": 1,
+    "chat": 2
+}
+
+
+class BrownoutController:
+    """Tracks LLM queue depth and latency and decides per request whether to degrade"""
+
+    def __init__(self, max_inflight: int = 16, latency_budget_ms: float = 3000,
+                 priorities: Optional[Dict[str, int]] = None, window_seconds: float = 30,
+                 base_enter: float = 0.6, step: float = 0.2, hysteresis: float = 0.3,
+                 min_dwell_seconds: float = 10):
+        self.max_inflight = max_inflight
+        self.latency_budget_ms = latency_budget_ms
+        self.priorities = priorities or ENDPOINT_PRIORITIES
+        self.window_seconds = window_seconds
+        self.base_enter = base_enter
+        self.step = step
+        self.hysteresis = hysteresis
+        self.min_dwell_seconds = min_dwell_seconds
+        self.inflight = 0
+        self.latencies = deque(maxlen=1000)   # (timestamp, latency_ms)
+        self.browned_out: Dict[str, float] = {}   # endpoint -> time it entered brownout
+        self.requests: Dict[str, int] = {}
+        self.degraded: Dict[str, int] = {}
+        self.transitions = 0
+
+    def thresholds(self, endpoint: str) -> tuple:
+        """(enter, exit) load thresholds for an endpoint's priority"""
+        enter = self.base_enter + self.step * self.priorities.get(endpoint, 1)
+        return enter, enter - self.hysteresis
+
+    def p95_ms(self, now: Optional[float] = None) -> float:
+        cutoff = (time.time() if now is None else now) - self.window_seconds
+        while self.latencies and self.latencies[0][0] < cutoff:
+            self.latencies.popleft()
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(latency for _, latency in self.latencies)
+        return ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)]
+
+    def load(self, now: Optional[float] = None) -> float:
+        return max(self.inflight / self.max_inflight, self.p95_ms(now) / self.latency_budget_ms)
+
+    def admit(self, endpoint: str, now: Optional[float] = None) -> bool:
+        """True to call the LLM, False to serve the endpoint's fallback"""
+        now = time.time() if now is None else now
+        load = self.load(now)
+        enter, exit_ = self.thresholds(endpoint)
+        since = self.browned_out.get(endpoint)
+        if since is None and load >= enter:
+            self.browned_out[endpoint] = now
+            self.transitions += 1
+            print(f"Brownout: {endpoint} degraded to fallback (load {load:.2f})")
+        elif since is not None and load <= exit_ and now - since >= self.min_dwell_seconds:
+            del self.browned_out[endpoint]
+            self.transitions += 1
+            print(f"Brownout: {endpoint} restored (load {load:.2f})")
+
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if endpoint in self.browned_out:
+            self.degraded[endpoint] = self.degraded.get(endpoint, 0) + 1
+            return False
+        return True
+
+    @contextmanager
+    def track(self):
+        """Count an LLM call as in flight and record its latency"""
+        self.inflight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self.latencies.append((time.time(), (time.perf_counter() - start) * 1000))
+
+    def stats(self) -> Dict:
+        total_requests = sum(self.requests.values())
+        total_degraded = sum(self.degraded.values())
+        return {
+            "load": round(self.load(), 3),
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "p95_latency_ms": round(self.p95_ms(), 1),
+            "latency_budget_ms": self.latency_budget_ms,
+            "transitions": self.transitions,
+            "degraded_share": round(total_degraded / total_requests, 4) if total_requests else 0.0,
+            "endpoints": {
+                endpoint: {
+                    "priority": self.priorities.get(endpoint, 1),
+                    "enter_load": round(self.thresholds(endpoint)[0], 2),
+                    "exit_load": round(self.thresholds(endpoint)[1], 2),
+                    "browned_out": endpoint in self.browned_out,
+                    "requests": requests,
+                    "degraded": self.degraded.get(endpoint, 0),
+                    "degraded_share": round(self.degraded.get(endpoint, 0) / requests, 4)
+                }
+                for endpoint, requests in self.requests.items()
+            }
+        }
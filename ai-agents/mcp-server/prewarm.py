@@ -0,0 +1,154 @@
+"""Background pre-warming of `/insights` for shoppers likely to open the widget.
+
+`/track` events feed a per-user engagement score (page views count 1,
+product views 1, cart adds 3). Scores decay after a window of inactivity.
+When a user's score reaches the trigger and they have no fresh insights,
+the user is queued. A small pool of background workers drains the bounded
+queue and generates insights ahead of the click.
+
+Warming may hold at most a configured share of the LLM's in-flight
+capacity. It also runs at the lowest brownout priority, so it is the
+first thing shed when on-demand traffic needs the model.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Engagement that suggests the shopper is about to open the widget
+ENGAGEMENT_WEIGHTS = {
+    "page_view": 1,
+    "product_view": 1,
+    "add_to_cart": 3
+}
+
+
+class InsightsPrewarmer:
+    """Scores /track activity and warms insights on a bounded worker pool"""
+
+    def __init__(self, warm: Callable[[str], Awaitable[bool]], is_fresh: Callable[[str], bool],
+                 workers: int = 2, budget_slots: int = 1, queue_size: int = 1000,
+                 trigger_score: int = 3, score_window_seconds: float = 600,
+                 max_tracked_users: int = 100000):
+        self.warm = warm
+        self.is_fresh = is_fresh
+        self.workers = workers
+        self.budget_slots = budget_slots
+        self.trigger_score = trigger_score
+        self.score_window_seconds = score_window_seconds
+        self.max_tracked_users = max_tracked_users
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.queued = set()
+        self.scores: "OrderedDict[str, List[float]]" = OrderedDict()   # user -> [score, last event time]
+        self.pending: "OrderedDict[str, float]" = OrderedDict()        # warmed, not yet served
+        self.slots = asyncio.Semaphore(budget_slots)
+        self.tasks: List[asyncio.Task] = []
+        self.warm_inflight = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.warmed = 0
+        self.skipped = 0
+        self.requests = 0
+        self.warm_hits = 0
+        self.warm_expired = 0
+
+    def observe(self, event: Dict, now: Optional[float] = None) -> bool:
+        """Score a /track event; returns True if it queued the user for warming"""
+        event_type = event.get("type")
+        user_id = event.get("user_id")
+        if not isinstance(event_type, str) or not isinstance(user_id, (str, int)) or isinstance(user_id, bool):
+            return False
+        weight = ENGAGEMENT_WEIGHTS.get(event_type)
+        # Keyed as /insights/{user_id} sees it, like the feature store
+        user_id = str(user_id)
+        if not weight or not user_id:
+            return False
+        now = time.time() if now is None else now
+        entry = self.scores.get(user_id)
+        if entry is None or now - entry[1] > self.score_window_seconds:
+            entry = self.scores[user_id] = [0.0, now]
+            if len(self.scores) > self.max_tracked_users:
+                self.scores.popitem(last=False)
+        else:
+            self.scores.move_to_end(user_id)
+        entry[0] += weight
+        entry[1] = now
+
+        if entry[0] < self.trigger_score or user_id in self.queued or self.is_fresh(user_id):
+            return False
+        try:
+            self.queue.put_nowait(user_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.queued.add(user_id)
+        entry[0] = 0.0
+        self.enqueued += 1
+        return True
+
+    def record_request(self, user_id: str, cache_hit: bool):
+        """Account an /insights request against the warmed set"""
+        self.requests += 1
+        warmed = self.pending.pop(user_id, None)
+        if warmed is None:
+            return
+        if cache_hit:
+            self.warm_hits += 1
+        else:
+            self.warm_expired += 1
+
+    async def _worker(self):
+        while True:
+            user_id = await self.queue.get()
+            try:
+                if self.is_fresh(user_id):
+                    self.skipped += 1
+                    continue
+                async with self.slots:
+                    self.warm_inflight += 1
+                    try:
+                        warmed = await self.warm(user_id)
+                    finally:
+                        self.warm_inflight -= 1
+                if warmed:
+                    self.warmed += 1
+                    self.pending[user_id] = time.time()
+                    self.pending.move_to_end(user_id)
+                    if len(self.pending) > self.max_tracked_users:
+                        self.pending.popitem(last=False)
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                print(f"Insights pre-warm error for {user_id}: {e}")
+            finally:
+                self.queued.discard(user_id)
+                self.queue.task_done()
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "budget_slots": self.budget_slots,
+            "warm_inflight": self.warm_inflight,
+            "queue_depth": self.queue.qsize(),
+            "tracked_users": len(self.scores),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "warmed": self.warmed,
+            "skipped": self.skipped,
+            "warm_hits": self.warm_hits,
+            "warm_expired": self.warm_expired,
+            # Share of /insights requests answered from a pre-warmed entry
+            "warm_hit_rate": round(self.warm_hits / self.requests, 4) if self.requests else 0.0,
+            # Share of warmed entries that were actually used
+            "warm_utilization": round(self.warm_hits / self.warmed, 4) if self.warmed else 0.0
+        }
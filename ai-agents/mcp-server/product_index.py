@@ -0,0 +1,265 @@
+"""Content-based product similarity index for cold-start recommendations.
+
+Products are embedded from their catalog text (name, description and
+categories) as hashed TF-IDF vectors stored in a single float32 matrix.
+"Similar to X" is one matrix-vector product followed by a partial sort,
+so no per-query Python loop over the catalog is needed.
+
+For large catalogs an optional random-hyperplane LSH index narrows the
+candidate set before the exact cosine re-rank.
+"""
+
+import math
+import re
+import time
+import zlib
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Field weights applied to term frequencies before IDF scaling
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+CATEGORY_WEIGHT = 3.0
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _bucket(token: str, dim: int) -> int:
+    # crc32 is stable across processes, unlike the builtin hash()
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+
+def product_price(product: Dict) -> float:
+    """Return a float price for either catalog shape (price or price_usd money)"""
+    price = product.get("price")
+    if isinstance(price, (int, float)):
+        return float(price)
+    money = product.get("price_usd") or price or {}
+    return money.get("units", 0) + money.get("nanos", 0) / 1e9
+
+
+class ProductSimilarityIndex:
+    """Hashed TF-IDF embeddings with exact and approximate cosine top-k"""
+
+    def __init__(self, dim: int = 256, approximate_threshold: int = 5000,
+                 lsh_tables: int = 4, lsh_bits: int = 8, seed: int = 7):
+        self.dim = dim
+        self.approximate_threshold = approximate_threshold
+        self.lsh_tables = lsh_tables
+        self.lsh_bits = lsh_bits
+        self.seed = seed
+
+        self.product_ids: List[str] = []
+        self.products: List[Dict] = []
+        self.positions: Dict[str, int] = {}
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.idf = np.ones(dim, dtype=np.float32)
+
+        self.planes: Optional[np.ndarray] = None
+        self.plane_weights = 1 << np.arange(lsh_bits, dtype=np.int64)
+        self.buckets: List[Dict[int, np.ndarray]] = []
+
+        self.build_seconds = 0.0
+        self.query_count = 0
+        self.latencies = deque(maxlen=1024)
+
+    def _term_vector(self, product: Dict) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        fields = (
+            (product.get("name", ""), NAME_WEIGHT),
+            (product.get("description", ""), DESCRIPTION_WEIGHT),
+            (" ".join(product.get("categories", [])) or product.get("category", ""), CATEGORY_WEIGHT),
+        )
+        for text, weight in fields:
+            for token in _tokens(text):
+                vector[_bucket(token, self.dim)] += weight
+        return vector
+
+    def build(self, products: List[Dict]) -> "ProductSimilarityIndex":
+        """(Re)build the index from a list of catalog products"""
+        start = time.perf_counter()
+
+        self.products = [p for p in products if p.get("id")]
+        self.product_ids = [p["id"] for p in self.products]
+        self.positions = {pid: i for i, pid in enumerate(self.product_ids)}
+
+        tf = np.zeros((len(self.products), self.dim), dtype=np.float32)
+        for i, product in enumerate(self.products):
+            tf[i] = self._term_vector(product)
+
+        # Smoothed IDF over hashed columns
+        doc_freq = np.count_nonzero(tf, axis=0)
+        n_docs = max(len(self.products), 1)
+        self.idf = (np.log((1 + n_docs) / (1 + doc_freq)) + 1).astype(np.float32)
+
+        matrix = np.log1p(tf) * self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+        if len(self.products) >= self.approximate_threshold:
+            self._build_lsh()
+        else:
+            self.planes = None
+            self.buckets = []
+
+        self.build_seconds = time.perf_counter() - start
+        return self
+
+    def _build_lsh(self):
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal(
+            (self.lsh_tables, self.dim, self.lsh_bits)).astype(np.float32)
+
+        self.buckets = []
+        for table in range(self.lsh_tables):
+            keys = ((self.matrix @ self.planes[table]) > 0) @ self.plane_weights
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+            groups = np.split(order, boundaries)
+            self.buckets.append({int(keys[g[0]]): g for g in groups if len(g)})
+
+    def _lsh_candidates(self, vector: np.ndarray) -> np.ndarray:
+        found = []
+        for table in range(self.lsh_tables):
+            key = int(((vector @ self.planes[table]) > 0) @ self.plane_weights)
+            bucket = self.buckets[table].get(key)
+            if bucket is not None:
+                found.append(bucket)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def _top_k(self, vector: np.ndarray, k: int, exclude: Optional[int] = None,
+               approximate: Optional[bool] = None) -> List[Dict]:
+        start = time.perf_counter()
+        if approximate is None:
+            approximate = self.planes is not None
+
+        candidates = None
+        if approximate and self.planes is not None:
+            candidates = self._lsh_candidates(vector)
+            # Too few neighbours in the buckets: fall back to the exact scan
+            if len(candidates) <= k:
+                candidates = None
+
+        if candidates is None:
+            scores = self.matrix @ vector
+            index_map = None
+        else:
+            scores = self.matrix[candidates] @ vector
+            index_map = candidates
+
+        if exclude is not None:
+            if index_map is None:
+                scores[exclude] = -np.inf
+            else:
+                scores[index_map == exclude] = -np.inf
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            if not np.isfinite(scores[i]):
+                continue
+            position = int(index_map[i]) if index_map is not None else int(i)
+            results.append({
+                "product": self.products[position],
+                "score": float(scores[i])
+            })
+
+        self.query_count += 1
+        self.latencies.append(time.perf_counter() - start)
+        return results
+
+    def similar_to(self, product_id: str, k: int = 4,
+                   approximate: Optional[bool] = None) -> List[Dict]:
+        """Return the k products most similar to product_id (excluding itself)"""
+        position = self.positions.get(product_id)
+        if position is None:
+            return []
+        return self._top_k(self.matrix[position], k, exclude=position, approximate=approximate)
+
+    def search(self, text: str, k: int = 4) -> List[Dict]:
+        """Return the k products closest to a free-text query"""
+        vector = np.log1p(self._term_vector({"description": text})) * self.idf
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return []
+        return self._top_k((vector / norm).astype(np.float32), k)
+
+    def memory_bytes(self) -> int:
+        total = self.matrix.nbytes + self.idf.nbytes
+        if self.planes is not None:
+            total += self.planes.nbytes
+            total += sum(g.nbytes for table in self.buckets for g in table.values())
+        return total
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(math.ceil(p * len(latencies))) - 1)] * 1000
+
+        return {
+            "products": len(self.product_ids),
+            "dimensions": self.dim,
+            "approximate_index": self.planes is not None,
+            "build_time_ms": round(self.build_seconds * 1000, 3),
+            "memory_bytes": self.memory_bytes(),
+            "queries": self.query_count,
+            "query_latency_ms": {
+                "p50": round(percentile(0.50), 4),
+                "p99": round(percentile(0.99), 4),
+                "max": round(latencies[-1] * 1000, 4) if latencies else 0.0
+            }
+        }
+
+
+def benchmark(n_products: int = 10000, queries: int = 1000, approximate: Optional[bool] = None) -> Dict:
+    """Build an index over a synthetic catalog and report build/memory/latency"""
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    categories = ["accessories", "clothing", "footwear", "home", "kitchen",
+                  "music", "photography", "vintage", "beauty", "outdoor"]
+
+    products = []
+    for i in range(n_products):
+        words = rng.choice(vocabulary, size=12)
+        products.append({
+            "id": f"P{i:06d}",
+            "name": " ".join(words[:3]),
+            "description": " ".join(words[3:]),
+            "categories": [categories[i % len(categories)]]
+        })
+
+    index = ProductSimilarityIndex().build(products)
+    if approximate is False:
+        index.planes = None
+        index.buckets = []
+
+    ids = rng.choice(index.product_ids, size=queries)
+    for product_id in ids:
+        index.similar_to(str(product_id), k=10)
+    return index.stats()
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps({
+        "exact": benchmark(approximate=False),
+        "approximate": benchmark(approximate=True)
+    }, indent=2))
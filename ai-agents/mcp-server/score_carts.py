@@ -0,0 +1,260 @@
+"""Offline bulk cart scoring with the `/analyze-cart` rules engine.
+
+Streams saved cart snapshots from a JSONL or CSV file, scores them in
+chunks across a process pool and writes one JSON result per cart as soon
+as each chunk completes. At most `workers * 2` chunks are in flight, so
+memory stays bounded no matter how large the input is.
+
+Input formats:
+
+- JSONL: one cart per line, e.g.
+  {"user_id": "u1", "cart_items": [{"product_id": "OLJCESPC7Z", "quantity": 2}], "loyalty_tier": "gold"}
+- CSV with a `cart_items` column holding the JSON item list, or
+- CSV with one row per line item (`cart_id` or `user_id`, `product_id`,
+  `quantity`, optional `price` and `loyalty_tier`). Rows of the same cart
+  must be adjacent, as in a snapshot export sorted by cart.
+
+A cart that cannot be scored (malformed JSON, not an object, an item list
+that is not a list) gets an error record (`cart_id`, `user_id`, `error`)
+in the output and is counted under `errors`. The rest of the run carries
+on. Unreadable items inside a cart are skipped by the rules engine and
+counted in the cart's `skipped_items`.
+
+Usage:
+    python score_carts.py abandoned_carts.jsonl -o scored.jsonl --workers 8
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional
+
+from cart_rules import CartRulesEngine, load_rules
+from catalog import PRODUCT_CATALOG, load_catalog_file
+
+# Per-process engine, built once by the pool initializer
+_engine: Optional[CartRulesEngine] = None
+
+
+def _init_worker(catalog_path: Optional[str], rules_path: Optional[str]):
+    global _engine
+    products = load_catalog_file(catalog_path) if catalog_path else PRODUCT_CATALOG
+    _engine = CartRulesEngine(products, load_rules(rules_path))
+
+
+def score_chunk(carts: List) -> tuple:
+    """Score a chunk of carts; returns (json lines, carts scored, optimizable, savings, errors)
+
+    JSONL input arrives as raw lines so parsing happens in the workers
+    rather than in the single reader process. Each cart is checked on its
+    own, and a bad one becomes an error record instead of failing the chunk.
+    """
+    entries = [_parse_cart(c) for c in carts]
+    valid = [cart for cart, error in entries if error is None]
+    try:
+        analyses = iter(_engine.evaluate_batch(valid))
+    except Exception:
+        # Find the culprits one cart at a time
+        analyses = iter([_evaluate_one(cart) for cart in valid])
+    lines = []
+    scored = optimizable = errors = 0
+    savings = 0.0
+    for cart, error in entries:
+        analysis = next(analyses) if error is None else error
+        if isinstance(analysis, str):
+            errors += 1
+            lines.append(json.dumps(_error_record(cart, analysis)))
+            continue
+        record = {
+            "cart_id": cart.get("cart_id") or cart.get("user_id"),
+            "user_id": cart.get("user_id"),
+            **analysis
+        }
+        lines.append(json.dumps(record))
+        scored += 1
+        if analysis["optimization_available"]:
+            optimizable += 1
+            savings += analysis["potential_savings"]
+    return "\n".join(lines) + "\n", scored, optimizable, savings, errors
+
+
+def _evaluate_one(cart: Dict):
+    """A cart's analysis, or the error message if it cannot be scored"""
+    try:
+        return _engine.evaluate_batch([cart])[0]
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def _parse_cart(raw) -> tuple:
+    """(cart, None) for a usable cart, else (what was read, error message)"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            return None, f"malformed JSON: {e}"
+    if not isinstance(raw, dict):
+        return None, f"cart must be a JSON object, not {type(raw).__name__}"
+    items = raw.get("cart_items")
+    if isinstance(items, str):
+        # CSV cart_items column, parsed here rather than in the reader
+        try:
+            items = json.loads(items or "[]")
+        except json.JSONDecodeError as e:
+            return raw, f"malformed cart_items: {e}"
+        raw = {**raw, "cart_items": items}
+    if items is not None and not isinstance(items, list):
+        return raw, f"cart_items must be a list, not {type(items).__name__}"
+    return raw, None
+
+
+def _error_record(cart: Optional[Dict], error: str) -> Dict:
+    cart = cart or {}
+    return {
+        "cart_id": cart.get("cart_id") or cart.get("user_id"),
+        "user_id": cart.get("user_id"),
+        "error": error
+    }
+
+
+def _read_jsonl(f) -> Iterator[str]:
+    for line in f:
+        if line.strip():
+            yield line
+
+
+def _read_csv(f) -> Iterator[Dict]:
+    reader = csv.DictReader(f)
+    fields = reader.fieldnames or []
+
+    if "cart_items" in fields:
+        # cart_items stays a JSON string; workers parse and validate it
+        yield from reader
+        return
+
+    key_field = "cart_id" if "cart_id" in fields else "user_id"
+    cart = None
+    for row in reader:
+        key = row.get(key_field)
+        if cart is None or cart[key_field] != key:
+            if cart is not None:
+                yield cart
+            cart = {
+                key_field: key,
+                "user_id": row.get("user_id", key),
+                "loyalty_tier": row.get("loyalty_tier") or None,
+                "cart_items": []
+            }
+        # Raw strings; the rules engine parses them and skips unreadable items
+        item = {"product_id": row.get("product_id"), "quantity": row.get("quantity") or 1}
+        if row.get("price"):
+            item["price"] = row["price"]
+        cart["cart_items"].append(item)
+    if cart is not None:
+        yield cart
+
+
+def read_carts(f, input_format: str) -> Iterator:
+    return _read_csv(f) if input_format == "csv" else _read_jsonl(f)
+
+
+def chunked(carts: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for cart in carts:
+        chunk.append(cart)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(input_path: str, output_path: str = "-", input_format: str = "auto",
+        workers: Optional[int] = None, chunk_size: int = 2000,
+        catalog_path: Optional[str] = None, rules_path: Optional[str] = None,
+        progress_interval: float = 5.0) -> Dict:
+    """Score every cart in input_path and write JSONL results to output_path"""
+    if input_format == "auto":
+        input_format = "csv" if input_path.endswith(".csv") else "jsonl"
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+
+    stats = {"carts": 0, "optimizable": 0, "potential_savings": 0.0, "errors": 0}
+    started = time.perf_counter()
+    last_report = started
+
+    def report(final: bool = False):
+        elapsed = time.perf_counter() - started
+        rate = stats["carts"] / elapsed if elapsed > 0 else 0.0
+        label = "done" if final else "progress"
+        print(f"[{label}] {stats['carts']} carts scored in {elapsed:.1f}s "
+              f"({rate:,.0f} carts/s), {stats['optimizable']} optimizable, {stats['errors']} errors",
+              file=sys.stderr)
+
+    with open(input_path, newline="") as source, \
+            (nullcontext(sys.stdout) if output_path == "-" else open(output_path, "w")) as sink, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(catalog_path, rules_path)) as pool:
+        pending = deque()
+
+        def drain_one():
+            nonlocal last_report
+            future = pending.popleft()
+            lines, n_carts, optimizable, savings, errors = future.result()
+            sink.write(lines)
+            stats["carts"] += n_carts
+            stats["errors"] += errors
+            stats["optimizable"] += optimizable
+            stats["potential_savings"] += savings
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                sink.flush()
+                report()
+                last_report = now
+
+        for chunk in chunked(read_carts(source, input_format), chunk_size):
+            # Backpressure: never queue more than max_in_flight chunks
+            if len(pending) >= max_in_flight:
+                drain_one()
+            pending.append(pool.submit(score_chunk, chunk))
+
+        while pending:
+            drain_one()
+
+    elapsed = time.perf_counter() - started
+    report(final=True)
+    return {
+        **stats,
+        "potential_savings": round(stats["potential_savings"], 2),
+        "elapsed_seconds": round(elapsed, 3),
+        "carts_per_second": round(stats["carts"] / elapsed, 1) if elapsed > 0 else 0.0,
+        "workers": workers,
+        "chunk_size": chunk_size
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Score saved carts with the MCP cart-analysis rules")
+    parser.add_argument("input", help="cart snapshot file (.jsonl or .csv)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output path (default: stdout)")
+    parser.add_argument("--format", choices=["auto", "jsonl", "csv"], default="auto")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="carts per worker task")
+    parser.add_argument("--catalog", default=None, help="catalog JSON (product list or /list_products dump)")
+    parser.add_argument("--rules", default=None, help="cart rules JSON (default: CART_RULES_FILE or built-in)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    summary = run(args.input, args.output, args.format, args.workers, args.chunk_size,
+                  args.catalog, args.rules, args.progress_interval)
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
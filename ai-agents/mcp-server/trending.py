@@ -0,0 +1,275 @@
+"""Sliding-window trending-products tracker fed from `/track` events.
+
+Each (region, window) pair is split into fixed time buckets. Every bucket
+holds a Count-Min Sketch for frequency estimates and a Space-Saving
+summary for heavy-hitter candidates, so memory per window is constant
+and an update touches one bucket: O(depth) sketch cells plus an O(1)
+stream-summary move per unit of weight.
+
+A window's top-k is the union of its live buckets' Space-Saving
+candidates ranked by their summed Count-Min estimates. With width w and
+depth d the estimates overcount by at most (e / w) * N with probability
+1 - e^-d, where N is the event weight seen in the window.
+"""
+
+import math
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# window name -> (length in seconds, number of buckets)
+WINDOWS = {
+    "5m": (5 * 60, 10),
+    "1h": (60 * 60, 12),
+    "24h": (24 * 60 * 60, 24)
+}
+
+# Event types that count towards trending and their weights
+EVENT_WEIGHTS = {
+    "page_view": 1,
+    "product_view": 1,
+    "add_to_cart": 3,
+    "purchase": 5
+}
+
+GLOBAL_REGION = "all"
+
+_PRIME = (1 << 31) - 1
+
+
+def product_key(value) -> Optional[str]:
+    """A product id as a string: ids may arrive as strings, numbers or item dicts"""
+    if isinstance(value, dict):
+        value = value.get("product_id") or value.get("id")
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return None
+    return str(value) if value != "" else None
+
+
+def event_product_ids(event: Dict) -> List[str]:
+    """Product ids in a /track event: `product_ids` (a list, or a single id), else
+    `product_id` plus the ids in `items`"""
+    product_ids = event.get("product_ids")
+    if not product_ids:
+        items = event.get("items")
+        product_ids = [event.get("product_id")] + (items if isinstance(items, list) else [])
+    elif not isinstance(product_ids, list):
+        product_ids = [product_ids]
+    keys = (product_key(value) for value in product_ids)
+    return [key for key in keys if key is not None]
+
+
+class SpaceSaving:
+    """Space-Saving top-k over a stream-summary: O(1) per unit increment"""
+
+    __slots__ = ("capacity", "counts", "errors", "buckets", "min_count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.buckets: Dict[int, Dict[str, None]] = {}   # count -> ordered set of items
+        self.min_count = 0
+
+    def _move(self, item: str, old: int, new: int):
+        bucket = self.buckets[old]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[old]
+            if old == self.min_count:
+                self.min_count = new
+        self.buckets.setdefault(new, {})[item] = None
+        self.counts[item] = new
+
+    def add(self, item: str):
+        count = self.counts.get(item)
+        if count is not None:
+            self._move(item, count, count + 1)
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = 1
+            self.errors[item] = 0
+            self.buckets.setdefault(1, {})[item] = None
+            self.min_count = 1
+        else:
+            # Replace an item with the minimum count; it inherits that count as error
+            bucket = self.buckets[self.min_count]
+            evicted = next(iter(bucket))
+            count = self.counts.pop(evicted)
+            del self.errors[evicted]
+            self.counts[item] = count
+            self.errors[item] = count
+            bucket[item] = None
+            del bucket[evicted]
+            self._move(item, count, count + 1)
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+        self.buckets.clear()
+        self.min_count = 0
+
+
+class _Bucket:
+    __slots__ = ("epoch", "sketch", "heavy", "total")
+
+    def __init__(self, depth: int, width: int, capacity: int):
+        self.epoch = -1
+        self.sketch = np.zeros((depth, width), dtype=np.int32)
+        self.heavy = SpaceSaving(capacity)
+        self.total = 0
+
+    def reset(self, epoch: int):
+        self.epoch = epoch
+        self.sketch.fill(0)
+        self.heavy.clear()
+        self.total = 0
+
+
+class SketchHasher:
+    """Pairwise-independent row hashes shared by every sketch of a tracker"""
+
+    def __init__(self, width: int, depth: int, seed: int):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.a = rng.integers(1, _PRIME, size=depth, dtype=np.int64)
+        self.b = rng.integers(0, _PRIME, size=depth, dtype=np.int64)
+
+    def columns(self, item: str) -> np.ndarray:
+        key = zlib.crc32(item.encode("utf-8")) % _PRIME
+        return ((self.a * key + self.b) % _PRIME) % self.width
+
+
+class SlidingHeavyHitters:
+    """Count-Min Sketch + Space-Saving over a bucketed sliding window"""
+
+    def __init__(self, length_seconds: int, n_buckets: int, width: int, depth: int,
+                 capacity: int, hasher: "SketchHasher"):
+        self.bucket_seconds = length_seconds / n_buckets
+        self.buckets = [_Bucket(depth, width, capacity) for _ in range(n_buckets)]
+        self.width = width
+        self.rows = np.arange(depth)
+        self.hasher = hasher
+
+    def add(self, item: str, columns: np.ndarray, weight: int, now: float):
+        epoch = int(now // self.bucket_seconds)
+        bucket = self.buckets[epoch % len(self.buckets)]
+        if bucket.epoch != epoch:
+            bucket.reset(epoch)
+        bucket.sketch[self.rows, columns] += weight
+        bucket.total += weight
+        for _ in range(weight):
+            bucket.heavy.add(item)
+
+    def _live(self, now: float) -> List[_Bucket]:
+        current = int(now // self.bucket_seconds)
+        oldest = current - len(self.buckets) + 1
+        return [b for b in self.buckets if oldest <= b.epoch <= current]
+
+    def top(self, k: int, now: float) -> Dict:
+        live = self._live(now)
+        candidates = set()
+        for bucket in live:
+            candidates.update(bucket.heavy.counts)
+
+        estimates = []
+        for item in candidates:
+            columns = self.hasher.columns(item)
+            estimate = sum(int(b.sketch[self.rows, columns].min()) for b in live)
+            estimates.append((estimate, item))
+        estimates.sort(reverse=True)
+
+        total = sum(b.total for b in live)
+        return {
+            "items": [{"product_id": item, "score": estimate} for estimate, item in estimates[:k]],
+            "total_weight": total,
+            "error_bound": math.e / self.width * total
+        }
+
+    def memory_bytes(self) -> int:
+        return sum(b.sketch.nbytes for b in self.buckets)
+
+
+class TrendingTracker:
+    """Per-region trending products over 5-minute, 1-hour and 24-hour windows"""
+
+    def __init__(self, width: int = 1024, depth: int = 4, capacity: int = 64,
+                 max_regions: int = 32, seed: int = 11):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.max_regions = max_regions
+        self.hasher = SketchHasher(width, depth, seed)
+        self.regions: Dict[str, Dict[str, SlidingHeavyHitters]] = {}
+        self.updates = 0
+
+    def _region(self, region: str) -> Dict[str, SlidingHeavyHitters]:
+        windows = self.regions.get(region)
+        if windows is None:
+            if len(self.regions) >= self.max_regions:
+                # Bound memory: regions beyond the cap only feed the global view
+                return {}
+            windows = {
+                name: SlidingHeavyHitters(length, n_buckets, self.width, self.depth,
+                                          self.capacity, self.hasher)
+                for name, (length, n_buckets) in WINDOWS.items()
+            }
+            self.regions[region] = windows
+        return windows
+
+    def record(self, product_id: str, region: Optional[str] = None, weight: int = 1,
+               now: Optional[float] = None):
+        now = time.time() if now is None else now
+        columns = self.hasher.columns(product_id)
+        targets = [GLOBAL_REGION]
+        if region and region != GLOBAL_REGION:
+            targets.append(region)
+        for name in targets:
+            for window in self._region(name).values():
+                window.add(product_id, columns, weight, now)
+        self.updates += 1
+
+    def record_event(self, event: Dict) -> int:
+        """Feed a /track event; returns the number of products recorded"""
+        event_type = event.get("type")
+        if not isinstance(event_type, str):
+            return 0
+        weight = EVENT_WEIGHTS.get(event_type)
+        if not weight:
+            return 0
+        region = event.get("region")
+        if not isinstance(region, str):
+            region = None
+        product_ids = event_product_ids(event)
+        for product_id in product_ids:
+            self.record(product_id, region, weight)
+        return len(product_ids)
+
+    def top(self, region: str = GLOBAL_REGION, window: str = "1h", k: int = 10) -> Dict:
+        windows = self.regions.get(region) or self.regions.get(GLOBAL_REGION)
+        result = {"items": [], "total_weight": 0, "error_bound": 0.0}
+        if windows and window in windows:
+            result = windows[window].top(k, time.time())
+        return {"region": region, "window": window, **result}
+
+    def memory_bytes(self) -> int:
+        return sum(w.memory_bytes() for windows in self.regions.values() for w in windows.values())
+
+    def stats(self) -> Dict:
+        return {
+            "regions": len(self.regions),
+            "windows": list(WINDOWS),
+            "updates": self.updates,
+            "memory_bytes": self.memory_bytes(),
+            "memory_bytes_per_window": {
+                name: n_buckets * self.width * self.depth * 4 for name, (_, n_buckets) in WINDOWS.items()
+            },
+            "sketch": {
+                "width": self.width,
+                "depth": self.depth,
+                "epsilon": round(math.e / self.width, 6),
+                "delta": round(math.exp(-self.depth), 6),
+                "top_k_capacity": self.capacity
+            }
+        }
@@ -0,0 +1,138 @@
+"""Prompt templates that separate fixed instructions from per-request variables.
+
+A template's static prefix is attached to a per-template model client
+instead of being rebuilt into every prompt string:
+
+- as Gemini cached content when the prefix is long enough for the
+  provider's context cache (cached tokens are billed at a discount and
+  skip re-processing);
+- otherwise as the model's system instruction, which keeps the prefix
+  byte-identical across requests;
+- or inlined ahead of the variables on SDKs without system instructions.
+
+Each template counts calls, prompt, cached and output tokens, and latency,
+so the savings are visible per template in `/metrics`.
+"""
+
+import datetime
+import inspect
+import time
+from typing import Dict, Optional
+
+import google.generativeai as genai
+
+# Gemini only caches contexts of at least this many tokens
+MIN_CACHE_TOKENS = 32768
+CACHE_TTL_SECONDS = 3600
+
+SYSTEM_INSTRUCTION_SUPPORTED = "system_instruction" in inspect.signature(genai.GenerativeModel.__init__).parameters
+CACHING_SUPPORTED = hasattr(genai, "caching") and hasattr(genai.GenerativeModel, "from_cached_content")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1) if text else 0
+
+
+class PromptTemplate:
+    """Static instruction prefix plus a `str.format` body for request variables"""
+
+    def __init__(self, name: str, prefix: str, body: str,
+                 min_cache_tokens: int = MIN_CACHE_TOKENS, cache_ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.prefix = prefix.strip()
+        self.body = body.strip()
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.min_cache_tokens = min_cache_tokens
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.clients: Dict[str, tuple] = {}   # model name -> (client, expires_at)
+        self.mode = self._mode()
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.latency_ms = 0.0
+
+    def _mode(self) -> str:
+        if CACHING_SUPPORTED and self.prefix_tokens >= self.min_cache_tokens:
+            return "cached_content"
+        return "system_instruction" if SYSTEM_INSTRUCTION_SUPPORTED else "inline"
+
+    def render(self, **variables) -> str:
+        """Per-request prompt content; the prefix is only inlined when it can't be sent separately"""
+        content = self.body.format(**variables)
+        return f"{self.prefix}\n\n{content}" if self.mode == "inline" else content
+
+    def client(self, model_name: str, backend=None):
+        """Model client carrying this template's prefix, recreated when its cache expires"""
+        entry = self.clients.get(model_name)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        expires_at = float("inf")
+        if self.mode == "cached_content" and not getattr(backend, "supports_caching", True):
+            # Offline and recording backends take the prefix as a system instruction
+            self.mode = "system_instruction"
+        if self.mode == "cached_content":
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{model_name}",
+                    display_name=self.name,
+                    system_instruction=self.prefix,
+                    ttl=datetime.timedelta(seconds=self.cache_ttl_seconds)
+                )
+                client = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                # Refresh a little before the provider drops the cache
+                expires_at = time.time() + self.cache_ttl_seconds * 0.9
+            except Exception as e:
+                print(f"Context cache unavailable for template {self.name}: {e}")
+                self.mode = "system_instruction" if SYSTEM_INSTRUCTION_SUPPORTED else "inline"
+                return self.client(model_name, backend)
+        elif backend is not None:
+            client = backend.model(model_name, self.prefix if self.mode == "system_instruction" else None)
+        elif self.mode == "system_instruction":
+            client = genai.GenerativeModel(model_name, system_instruction=self.prefix)
+        else:
+            client = genai.GenerativeModel(model_name)
+        self.clients[model_name] = (client, expires_at)
+        return client
+
+    def record(self, response, latency_ms: float, ok: bool = True):
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.latency_ms += latency_ms
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens += getattr(usage, "prompt_token_count", 0)
+            self.cached_tokens += getattr(usage, "cached_content_token_count", 0)
+            self.output_tokens += getattr(usage, "candidates_token_count", 0)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "static_prefix_tokens": self.prefix_tokens,
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0,
+            "avg_latency_ms": round(self.latency_ms / self.calls, 1) if self.calls else 0
+        }
+
+
+class PromptRegistry:
+    """Named prompt templates for one service"""
+
+    def __init__(self):
+        self.templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, prefix: str, body: str, **options) -> PromptTemplate:
+        template = self.templates[name] = PromptTemplate(name, prefix, body, **options)
+        return template
+
+    def get(self, name: str) -> Optional[PromptTemplate]:
+        return self.templates.get(name)
+
+    def stats(self) -> Dict:
+        return {name: template.stats() for name, template in self.templates.items()}
@@ -10,6 +10,9 @@ if [ -f .env ]; then
     source .env
 fi
 
+# Shared helper modules are copied into each image's directory; refuse stale copies
+"$(dirname "$0")/check-shared-modules.sh"
+
 # Configure Docker auth
 gcloud auth configure-docker gcr.io --quiet
 
@@ -0,0 +1,38 @@
+#!/bin/bash
+# check-shared-modules.sh - Fail when copies of the shared LLM/JSON helpers diverge
+#
+# Each image is built from its own directory, so the shared helper modules
+# are copied into every tree that needs them. ai-agents/ holds the source
+# copy. Edit it, then run this script with --sync to update the others.
+
+set -e
+
+ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)"
+SOURCE="$ROOT/ai-agents"
+
+# module -> directories holding a copy
+declare -A COPIES=(
+    [fast_json.py]="ai-agents/mcp-server"
+    [llm_backend.py]="ai-agents/mcp-server boutique-ai-platform/agents"
+    [model_router.py]="ai-agents/mcp-server boutique-ai-platform/agents"
+    [prompt_templates.py]="ai-agents/mcp-server boutique-ai-platform/agents"
+)
+
+status=0
+for module in "${!COPIES[@]}"; do
+    for dir in ${COPIES[$module]}; do
+        copy="$ROOT/$dir/$module"
+        if [ "$1" == "--sync" ]; then
+            cp "$SOURCE/$module" "$copy"
+        elif ! cmp -s "$SOURCE/$module" "$copy"; then
+            echo "Out of sync: $dir/$module differs from ai-agents/$module"
+            status=1
+        fi
+    done
+done
+
+if [ $status -ne 0 ]; then
+    echo "Run ai-agents/scripts/check-shared-modules.sh --sync after editing the ai-agents/ copy."
+    exit 1
+fi
+echo "Shared modules in sync."
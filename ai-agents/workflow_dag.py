@@ -0,0 +1,150 @@
+"""Workflow templates compiled into dependency graphs and run concurrently.
+
+A template lists its agents and, optionally, `depends_on`: for each agent,
+the agents whose results it needs. Agents with no dependencies start
+immediately. Every other agent starts as soon as all of its dependencies
+have finished. The workflow therefore takes as long as its critical path,
+not the sum of its steps.
+
+Templates are compiled once at startup. Compilation rejects unknown
+agents, agents listed twice, unknown dependencies and cycles. Each step runs under a timeout
+(the template's `step_timeout_seconds`, or the default). A step that fails
+or times out cancels the steps still running and fails the workflow.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+class WorkflowStep:
+    __slots__ = ("agent", "index", "depends_on", "dependents")
+
+    def __init__(self, agent: str, index: int, depends_on: List[str]):
+        self.agent = agent
+        self.index = index              # position in the template's agent list
+        self.depends_on = depends_on
+        self.dependents: List[str] = []
+
+
+class StepTimeout(Exception):
+    def __init__(self, agent: str, timeout_seconds: float):
+        super().__init__(f"Step '{agent}' timed out after {timeout_seconds}s")
+        self.agent = agent
+        self.timeout_seconds = timeout_seconds
+
+
+class WorkflowDAG:
+    """A compiled workflow template"""
+
+    def __init__(self, name: str, steps: Dict[str, WorkflowStep], step_timeout_seconds: float):
+        self.name = name
+        self.steps = steps
+        self.step_timeout_seconds = step_timeout_seconds
+        self.roots = [agent for agent, step in steps.items() if not step.depends_on]
+        self.depth = self._depth()
+
+    @classmethod
+    def compile(cls, name: str, template: Dict, known_agents: Iterable[str],
+                default_timeout_seconds: float = 10.0) -> "WorkflowDAG":
+        known = set(known_agents)
+        order = template["agents"]
+        depends_on = template.get("depends_on", {})
+        steps: Dict[str, WorkflowStep] = {}
+        for index, agent in enumerate(order):
+            if agent not in known:
+                raise ValueError(f"Workflow '{name}': unknown agent '{agent}'")
+            if agent in steps:
+                # Steps are keyed by agent, so a second entry would replace the first
+                raise ValueError(f"Workflow '{name}': agent '{agent}' is listed more than once")
+            steps[agent] = WorkflowStep(agent, index, list(depends_on.get(agent, [])))
+        for agent, deps in depends_on.items():
+            if agent not in steps:
+                raise ValueError(f"Workflow '{name}': dependencies declared for '{agent}', which is not a step")
+            for dep in deps:
+                if dep not in steps:
+                    raise ValueError(f"Workflow '{name}': '{agent}' depends on unknown step '{dep}'")
+                steps[dep].dependents.append(agent)
+
+        # Kahn's algorithm: any step left unvisited is on a cycle
+        remaining = {agent: len(step.depends_on) for agent, step in steps.items()}
+        ready = [agent for agent, count in remaining.items() if count == 0]
+        visited = 0
+        while ready:
+            agent = ready.pop()
+            visited += 1
+            for dependent in steps[agent].dependents:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if visited != len(steps):
+            cyclic = sorted(agent for agent, count in remaining.items() if count > 0)
+            raise ValueError(f"Workflow '{name}': dependency cycle through {cyclic}")
+
+        return cls(name, steps, template.get("step_timeout_seconds", default_timeout_seconds))
+
+    def _depth(self) -> int:
+        """Number of steps on the longest dependency chain"""
+        depth: Dict[str, int] = {}
+
+        def visit(agent: str) -> int:
+            if agent not in depth:
+                step = self.steps[agent]
+                depth[agent] = 1 + max((visit(dep) for dep in step.depends_on), default=0)
+            return depth[agent]
+
+        return max((visit(agent) for agent in self.steps), default=0)
+
+    async def run(self, run_step: Callable[[WorkflowStep, Dict[str, Dict]], Awaitable[Dict]],
+                  on_step: Optional[Callable[[WorkflowStep, Dict, float], Awaitable[None]]] = None) -> List[Dict]:
+        """Run every step once its dependencies are done; results in completion order
+
+        `run_step(step, dependency_results)` produces a step's result, and
+        `on_step(step, result, seconds)` is awaited as each step finishes.
+        """
+        waiting = {agent: len(step.depends_on) for agent, step in self.steps.items()}
+        results: Dict[str, Dict] = {}
+        ordered: List[Dict] = []
+        running: Dict[asyncio.Task, tuple] = {}
+
+        def start(agent: str):
+            step = self.steps[agent]
+            inputs = {dep: results[dep] for dep in step.depends_on}
+            task = asyncio.create_task(
+                asyncio.wait_for(run_step(step, inputs), timeout=self.step_timeout_seconds)
+            )
+            running[task] = (step, time.perf_counter())
+
+        for agent in self.roots:
+            start(agent)
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step, started = running.pop(task)
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        raise StepTimeout(step.agent, self.step_timeout_seconds) from None
+                    results[step.agent] = result
+                    ordered.append(result)
+                    if on_step is not None:
+                        await on_step(step, result, time.perf_counter() - started)
+                    for dependent in step.dependents:
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            start(dependent)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return ordered
+
+    def describe(self) -> Dict:
+        return {
+            "steps": len(self.steps),
+            "critical_path_steps": self.depth,
+            "step_timeout_seconds": self.step_timeout_seconds,
+            "depends_on": {agent: step.depends_on for agent, step in self.steps.items() if step.depends_on}
+        }
@@ -0,0 +1,103 @@
+"""Bounded workflow history with incremental counters and indexes.
+
+The newest `max_records` records are kept in a ring buffer. Counters by
+status and by template are updated as records are added, so totals and
+success rates cost the same however much history has accumulated. They
+cover every execution since startup, including records already evicted
+from the ring. Records are also indexed by workflow ID and by user.
+Lookups are constant time, and a page of history costs its page size.
+With a store attached, every record is also persisted, and the counters
+start from the persisted totals.
+"""
+
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+
+class WorkflowHistory:
+    """Recent workflow records, indexed, with running totals"""
+
+    def __init__(self, max_records: int = 10000, store=None):
+        self.max_records = max_records
+        self.store = store   # durable copy of every record (see history_store.py), if any
+        self.records: deque = deque()
+        self.by_id: Dict[str, Dict] = {}
+        self.by_user: Dict[str, deque] = {}
+        self.running: set = set()
+        self.total = 0
+        self.by_status: Dict[str, int] = {}
+        self.by_template: Dict[str, Dict[str, int]] = {}
+        self.evicted = 0
+        if store is not None:
+            self.seed(store.counts())
+
+    def seed(self, counts: List[Tuple[str, str, int]]):
+        """Start the counters from persisted (template, status, count) totals"""
+        for name, status, count in counts:
+            self.total += count
+            self.by_status[status] = self.by_status.get(status, 0) + count
+            template = self.by_template.setdefault(name, {})
+            template[status] = template.get(status, 0) + count
+
+    def started(self, workflow_id: str):
+        self.running.add(workflow_id)
+
+    def append(self, record: Dict):
+        self.running.discard(record["id"])
+        status = record.get("status", "unknown")
+        self.total += 1
+        self.by_status[status] = self.by_status.get(status, 0) + 1
+        template = self.by_template.setdefault(record.get("name"), {})
+        template[status] = template.get(status, 0) + 1
+
+        self.records.append(record)
+        self.by_id[record["id"]] = record
+        user_id = record.get("user_id")
+        if user_id is not None:
+            self.by_user.setdefault(user_id, deque()).append(record)
+        if len(self.records) > self.max_records:
+            self._evict()
+        if self.store is not None:
+            self.store.append(record)
+
+    def _evict(self):
+        # Records leave in insertion order, so the oldest of a user's records goes first
+        oldest = self.records.popleft()
+        self.by_id.pop(oldest["id"], None)
+        user_id = oldest.get("user_id")
+        if user_id is not None:
+            user_records = self.by_user[user_id]
+            user_records.popleft()
+            if not user_records:
+                del self.by_user[user_id]
+        self.evicted += 1
+
+    def get(self, workflow_id: str) -> Optional[Dict]:
+        return self.by_id.get(workflow_id)
+
+    def recent(self, limit: int = 10, user_id: Optional[str] = None) -> List[Dict]:
+        """Newest `limit` records (optionally one user's), oldest first"""
+        source = self.records if user_id is None else self.by_user.get(user_id, ())
+        page = list(islice(reversed(source), max(limit, 0)))
+        page.reverse()
+        return page
+
+    def count(self, status: str) -> int:
+        return self.by_status.get(status, 0)
+
+    def success_rate(self) -> float:
+        return self.count("completed") / max(self.total, 1)
+
+    def stats(self) -> Dict:
+        return {
+            "total_executions": self.total,
+            "successful_executions": self.count("completed"),
+            "failed_executions": self.count("failed"),
+            "success_rate": self.success_rate(),
+            "running": len(self.running),
+            "retained_records": len(self.records),
+            "max_records": self.max_records,
+            "evicted_records": self.evicted,
+            "by_template": self.by_template
+        }
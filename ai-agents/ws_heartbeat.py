@@ -0,0 +1,173 @@
+"""Central heartbeat scheduling for many mostly idle WebSockets.
+
+Connections are spread over the slots of a timer wheel that turns once per
+heartbeat interval. One task advances the wheel a slot per tick, so each
+connection is visited once per interval, with no timer of its own:
+
+- if nothing was sent to it during the interval, it gets a heartbeat
+  frame. The frame is encoded once per tick and shared by every
+  connection in the slot;
+- if the client has sent nothing for `idle_timeout` seconds (0 disables
+  this), the connection is closed.
+
+Dead TCP peers are caught by protocol-level ping/pong, which the ASGI
+server does (uvicorn's `ws_ping_interval` / `ws_ping_timeout`), not by
+this wheel.
+
+Each full turn of the wheel is a measurement window. It reports the wheel's
+own CPU, whole-process CPU per connection, and wakeups per connection per
+minute (writer sends, received frames and wheel visits). Run this module
+for an idle-connection benchmark.
+"""
+
+import asyncio
+import math
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from ws_hub import Connection, ConnectionHub, conflation_key, encode
+
+IDLE_CLOSE_CODE = 1001
+
+
+class HeartbeatWheel:
+    """Timer wheel that heartbeats and reaps a hub's connections"""
+
+    def __init__(self, hub: ConnectionHub, message: Callable[[], Dict], interval: float = 30.0,
+                 idle_timeout: float = 0.0, tick: float = 1.0):
+        self.hub = hub
+        self.message = message
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.tick = tick
+        self.slots: List[Set[Connection]] = [set() for _ in range(max(int(math.ceil(interval / tick)), 1))]
+        self.position = 0
+        self.task: Optional[asyncio.Task] = None
+        self.ticks = 0
+        self.visits = 0
+        self.heartbeats = 0
+        self.skipped_active = 0
+        self.idle_closed = 0
+        self.window: Optional[Dict] = None
+        self._window_start = (time.monotonic(), time.process_time(), 0)
+        self._window_wheel_cpu = 0.0
+        hub.wheel = self
+
+    def add(self, conn: Connection):
+        # The slot just visited comes round again last, a full interval from now
+        conn.slot = (self.position - 1) % len(self.slots)
+        self.slots[conn.slot].add(conn)
+
+    def remove(self, conn: Connection):
+        if conn.slot is not None:
+            self.slots[conn.slot].discard(conn)
+            conn.slot = None
+
+    def advance(self, now: Optional[float] = None):
+        """Process the current slot and move on to the next"""
+        now = time.monotonic() if now is None else now
+        cpu_start = time.process_time()
+        slot = self.slots[self.position]
+        if slot:
+            text, key = None, None
+            for conn in list(slot):
+                conn.wakeup()
+                self.visits += 1
+                if self.idle_timeout and now - conn.last_received >= self.idle_timeout:
+                    self.idle_closed += 1
+                    self.hub.close(conn, IDLE_CLOSE_CODE)
+                    continue
+                # Visits are an interval apart, give or take a tick
+                if now - conn.last_sent < self.interval - self.tick:
+                    self.skipped_active += 1
+                    continue
+                if text is None:
+                    heartbeat = self.message()
+                    text, key = encode(heartbeat), conflation_key(heartbeat)
+                if conn.enqueue(text, key):
+                    self.heartbeats += 1
+        self.ticks += 1
+        self._window_wheel_cpu += time.process_time() - cpu_start
+        self.position = (self.position + 1) % len(self.slots)
+        if self.position == 0:
+            self._close_window()
+
+    def _close_window(self):
+        started, cpu_started, wakeups_started = self._window_start
+        now, cpu = time.monotonic(), time.process_time()
+        seconds = max(now - started, 1e-9)
+        connections = max(len(self.hub), 1)
+        wakeups = self.hub.wakeups - wakeups_started
+        self.window = {
+            "seconds": round(seconds, 2),
+            "connections": len(self.hub),
+            "wheel_cpu_ms": round(self._window_wheel_cpu * 1000, 3),
+            "process_cpu_ms": round((cpu - cpu_started) * 1000, 3),
+            "wheel_cpu_us_per_connection": round(self._window_wheel_cpu * 1e6 / connections, 3),
+            "process_cpu_us_per_connection": round((cpu - cpu_started) * 1e6 / connections, 3),
+            "wakeups_per_connection_per_minute": round(wakeups / connections / (seconds / 60), 3)
+        }
+        self._window_start = (now, cpu, self.hub.wakeups)
+        self._window_wheel_cpu = 0.0
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(next_tick - time.monotonic(), 0))
+            next_tick += self.tick
+            try:
+                self.advance()
+            except Exception as e:
+                print(f"Heartbeat wheel error: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def stats(self) -> Dict:
+        return {
+            "interval_seconds": self.interval,
+            "idle_timeout_seconds": self.idle_timeout,
+            "tick_seconds": self.tick,
+            "slots": len(self.slots),
+            "ticks": self.ticks,
+            "visits": self.visits,
+            "heartbeats_sent": self.heartbeats,
+            "skipped_active": self.skipped_active,
+            "idle_closed": self.idle_closed,
+            "last_rotation": self.window
+        }
+
+
+if __name__ == "__main__":
+    # Idle benchmark: many silent connections, one wheel, several rotations
+    class _Socket:
+        async def send_text(self, text: str):
+            pass
+
+        async def close(self, code: int = 1000):
+            pass
+
+    async def benchmark(clients: int = 50000, interval: float = 2.0, tick: float = 0.1, rotations: int = 3):
+        hub = ConnectionHub()
+        wheel = HeartbeatWheel(hub, lambda: {"type": "heartbeat", "timestamp": time.time()},
+                               interval=interval, tick=tick)
+        for i in range(clients):
+            hub.connect(f"user_{i}", _Socket())
+        wheel.start()
+        await asyncio.sleep(interval * rotations + tick)
+        await wheel.stop()
+        window = wheel.stats()["last_rotation"]
+        print(f"{clients} idle clients, {interval}s heartbeat: "
+              f"{window['process_cpu_us_per_connection']}us process CPU per connection per interval "
+              f"({window['wheel_cpu_us_per_connection']}us in the wheel), "
+              f"{window['wakeups_per_connection_per_minute']} wakeups per connection per minute")
+        for conn in list(hub.connections.values()):
+            hub.disconnect(conn)
+
+    asyncio.run(benchmark())
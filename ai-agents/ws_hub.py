@@ -0,0 +1,339 @@
+"""WebSocket fan-out: encode once, queue per connection, one writer per socket.
+
+`publish` serializes a message to JSON once and appends the same text to
+the bounded send queue of every subscribed connection. It never awaits a socket, so a slow
+client cannot hold up the workflow that published the event, or the
+other clients. Each connection has one writer task that drains its queue.
+That writer is the only code that sends on the socket. Replies to the
+client's own commands go through the same queue, to keep frames in order.
+
+When a connection's queue is full:
+- a message with a conflation key (heartbeats, job status, simulated
+  events about the same product) replaces the queued message with that
+  key, because only the latest matters;
+- any other message marks the client as a slow consumer, and it is
+  disconnected (close code 1013) rather than silently losing events.
+
+Delivery is by topic. Each message is published to the topics it is
+about: `all`, `type:<event type>`, `workflow:<workflow or job id>` and
+`user:<user id>`. Only connections subscribed to one of those topics
+receive it, and each receives it once. A topic index maps each topic to
+its subscribers, so a publish costs the number of interested clients, not
+the number connected. Clients change their subscriptions with JSON
+commands (see `ConnectionHub.command`).
+
+Delivery latency (publish to send completion) and the cost of each
+publish are kept as rolling percentiles. Run this module for a fan-out
+benchmark against in-memory sockets.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+import orjson
+
+from latency_stats import percentiles
+
+# Message type -> field that identifies what it is about; None means the type alone
+CONFLATE_BY = {
+    "heartbeat": None,
+    "job_update": "job_id",
+    "price_drop": "product_name",
+    "low_stock": "product_name",
+    "customer_segment_update": "user_id"
+}
+
+SLOW_CONSUMER_CLOSE_CODE = 1013
+ALL_TOPIC = "all"
+MAX_SUBSCRIPTIONS = 100
+
+
+def conflation_key(message: Dict) -> Optional[Hashable]:
+    kind = message.get("type")
+    if kind not in CONFLATE_BY:
+        return None
+    field = CONFLATE_BY[kind]
+    return kind if field is None else (kind, message.get(field))
+
+
+def message_topics(message: Dict) -> List[str]:
+    """Topics a message is published to"""
+    topics = [ALL_TOPIC, f"type:{message.get('type')}"]
+    workflow_id = message.get("workflow_id") or message.get("job_id")
+    if workflow_id:
+        topics.append(f"workflow:{workflow_id}")
+    if message.get("user_id"):
+        topics.append(f"user:{message['user_id']}")
+    return topics
+
+
+def encode(message: Dict) -> str:
+    return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+class Connection:
+    """One client socket with its bounded send queue and writer task"""
+
+    def __init__(self, hub: "ConnectionHub", conn_id: int, user_id: str, websocket, queue_size: int):
+        self.hub = hub
+        self.id = conn_id
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.queue: deque = deque()               # [text, key, published_at]
+        self.keyed: Dict[Hashable, list] = {}     # conflation key -> its queued entry
+        self.topics: Set[str] = set()
+        self.slot: Optional[int] = None           # heartbeat wheel slot, if scheduled
+        self.last_sent = self.last_received = time.monotonic()
+        self.wakeups = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.conflated = 0
+        self.writer = asyncio.create_task(self._write())
+
+    def enqueue(self, text: str, key: Optional[Hashable] = None, published_at: Optional[float] = None) -> bool:
+        """Queue an encoded frame; False if the client was dropped as a slow consumer"""
+        if self.closed:
+            return False
+        published_at = time.perf_counter() if published_at is None else published_at
+        if key is not None:
+            queued = self.keyed.get(key)
+            if queued is not None:
+                queued[0], queued[2] = text, published_at
+                self.conflated += 1
+                self.hub.conflated += 1
+                return True
+        if len(self.queue) >= self.queue_size:
+            self.hub.drop_slow(self)
+            return False
+        entry = [text, key, published_at]
+        self.queue.append(entry)
+        if key is not None:
+            self.keyed[key] = entry
+        self.ready.set()
+        return True
+
+    def send(self, message: Dict) -> bool:
+        """Encode and queue a message for this client only"""
+        return self.enqueue(encode(message), conflation_key(message))
+
+    def wakeup(self):
+        self.wakeups += 1
+        self.hub.wakeups += 1
+
+    def received(self):
+        """Note a frame from the client (for idle detection)"""
+        self.last_received = time.monotonic()
+        self.wakeup()
+
+    async def _write(self):
+        try:
+            while True:
+                if not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                entry = self.queue.popleft()
+                text, key, published_at = entry
+                if key is not None and self.keyed.get(key) is entry:
+                    del self.keyed[key]
+                await self.websocket.send_text(text)
+                self.sent += 1
+                self.last_sent = time.monotonic()
+                self.wakeup()
+                self.hub.delivered(time.perf_counter() - published_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The socket is gone; the receive loop sees the disconnect and cleans up too
+            self.hub.disconnect(self)
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self.keyed.clear()
+        self.writer.cancel()
+
+
+class ConnectionHub:
+    """Registry of live connections and the serialize-once publisher"""
+
+    def __init__(self, queue_size: int = 256, latency_samples: int = 10000):
+        self.queue_size = queue_size
+        self.connections: Dict[int, Connection] = {}
+        self.subscribers: Dict[str, Set[Connection]] = {}   # topic -> subscribed connections
+        self.ids = itertools.count(1)
+        self.published = 0
+        self.enqueued = 0
+        self.conflated = 0
+        self.slow_consumers_dropped = 0
+        self.wakeups = 0
+        self.wheel = None   # set by ws_heartbeat.HeartbeatWheel
+        self.delivery_seconds: deque = deque(maxlen=latency_samples)
+        self.publish_seconds: deque = deque(maxlen=latency_samples)
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def connect(self, user_id: str, websocket, topics: Iterable[str] = ()) -> Connection:
+        conn = Connection(self, next(self.ids), user_id, websocket, self.queue_size)
+        self.connections[conn.id] = conn
+        for topic in topics:
+            self.subscribe(conn, topic)
+        if self.wheel is not None:
+            self.wheel.add(conn)
+        return conn
+
+    def disconnect(self, conn: Connection):
+        if self.connections.pop(conn.id, None) is not None:
+            for topic in list(conn.topics):
+                self.unsubscribe(conn, topic)
+            if self.wheel is not None:
+                self.wheel.remove(conn)
+            conn.close()
+
+    def close(self, conn: Connection, code: int):
+        """Disconnect and close the client's socket with `code`"""
+        self.disconnect(conn)
+        asyncio.create_task(self._close_socket(conn, code))
+
+    def subscribe(self, conn: Connection, topic: str) -> bool:
+        if topic in conn.topics:
+            return True
+        if len(conn.topics) >= MAX_SUBSCRIPTIONS:
+            return False
+        conn.topics.add(topic)
+        self.subscribers.setdefault(topic, set()).add(conn)
+        return True
+
+    def unsubscribe(self, conn: Connection, topic: str):
+        conn.topics.discard(topic)
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(conn)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    def command(self, conn: Connection, command: Dict) -> Dict:
+        """Apply a subscription command and return the reply for the client
+
+        `{"action": "subscribe" | "unsubscribe", "workflow_id": ..., "user_id": ...,
+        "event_types": [...], "all": true}`. Each field takes a string or number, or a
+        list of them; anything else is answered with an error.
+        """
+        action = command.get("action")
+        if action not in ("subscribe", "unsubscribe"):
+            return {"type": "error", "message": f"Unknown action: {action}"}
+        topics = []
+        for field, prefix in (("workflow_id", "workflow"), ("user_id", "user"), ("event_types", "type")):
+            values = command.get(field)
+            if values is None:
+                continue
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                    return {"type": "error", "message": f"{field} must be a string or number, or a list of them"}
+                topics.append(f"{prefix}:{value}")
+        if command.get("all"):
+            topics.append(ALL_TOPIC)
+        rejected = []
+        for topic in topics:
+            if action == "unsubscribe":
+                self.unsubscribe(conn, topic)
+            elif not self.subscribe(conn, topic):
+                rejected.append(topic)
+        reply = {"type": "subscriptions", "topics": sorted(conn.topics)}
+        if rejected:
+            reply["rejected"] = rejected
+            reply["message"] = f"At most {MAX_SUBSCRIPTIONS} subscriptions per connection"
+        return reply
+
+    def drop_slow(self, conn: Connection):
+        self.slow_consumers_dropped += 1
+        print(f"WebSocket slow consumer dropped: {conn.user_id} ({len(conn.queue)} frames queued)")
+        self.close(conn, SLOW_CONSUMER_CLOSE_CODE)
+
+    async def _close_socket(self, conn: Connection, code: int):
+        try:
+            await asyncio.wait_for(conn.websocket.close(code=code), timeout=5)
+        except Exception:
+            pass
+
+    def delivered(self, seconds: float):
+        self.delivery_seconds.append(seconds)
+
+    def publish(self, message: Dict) -> int:
+        """Encode once and queue to each subscribed connection; returns the number reached"""
+        start = time.perf_counter()
+        matched: Set[Connection] = set()
+        for topic in message_topics(message):
+            subscribers = self.subscribers.get(topic)
+            if subscribers:
+                matched.update(subscribers)
+        self.published += 1
+        if not matched:
+            self.publish_seconds.append(time.perf_counter() - start)
+            return 0
+        text = encode(message)
+        key = conflation_key(message)
+        reached = 0
+        for conn in matched:
+            if conn.enqueue(text, key, start):
+                reached += 1
+        self.enqueued += reached
+        self.publish_seconds.append(time.perf_counter() - start)
+        return reached
+
+    def stats(self) -> Dict:
+        return {
+            "connections": len(self.connections),
+            "topics": len(self.subscribers),
+            "queued_frames": sum(len(conn.queue) for conn in self.connections.values()),
+            "queue_size": self.queue_size,
+            "published": self.published,
+            "enqueued": self.enqueued,
+            "avg_recipients": round(self.enqueued / self.published, 2) if self.published else 0.0,
+            "conflated": self.conflated,
+            "slow_consumers_dropped": self.slow_consumers_dropped,
+            "wakeups": self.wakeups,
+            "publish_ms": percentiles(self.publish_seconds),
+            "delivery_ms": percentiles(self.delivery_seconds)
+        }
+
+
+if __name__ == "__main__":
+    # Fan-out benchmark: thousands of in-memory sockets, a few of them stalled
+    class _Socket:
+        def __init__(self, delay: float):
+            self.delay = delay
+
+        async def send_text(self, text: str):
+            await asyncio.sleep(self.delay)
+
+        async def close(self, code: int = 1000):
+            pass
+
+    async def benchmark(clients: int = 5000, slow: int = 10, messages: int = 50):
+        hub = ConnectionHub(queue_size=32)
+        for i in range(clients):
+            hub.connect(f"user_{i}", _Socket(1.0 if i < slow else 0), [f"user:user_{i}", "type:workflow_progress"])
+        for i in range(messages):
+            hub.publish({"type": "workflow_progress", "workflow_id": "bench", "step": i, "result": {"ok": True}})
+            # Per-user events only reach their owner
+            hub.publish({"type": "workflow_progress", "workflow_id": f"w{i}", "user_id": f"user_{i}"})
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)
+        stats = hub.stats()
+        print(f"{clients} clients ({slow} stalled), {messages} messages: "
+              f"publish p50={stats['publish_ms']['p50']}ms p99={stats['publish_ms']['p99']}ms, "
+              f"delivery p50={stats['delivery_ms']['p50']}ms p99={stats['delivery_ms']['p99']}ms, "
+              f"slow consumers dropped={stats['slow_consumers_dropped']}")
+        for conn in list(hub.connections.values()):
+            hub.disconnect(conn)
+
+    asyncio.run(benchmark())
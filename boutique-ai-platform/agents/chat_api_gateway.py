@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import httpx
 import asyncio
@@ -12,7 +13,7 @@ class ChatResponse(BaseModel):
     response: str
     conversation_id: str
 
-app = FastAPI(title="AI Chat API Gateway")
+app = FastAPI(title="AI Chat API Gateway", default_response_class=ORJSONResponse)
 
 class ChatGateway:
     def __init__(self):
@@ -4,6 +4,7 @@ import os
 import logging
 from typing import Dict, List, Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from datetime import datetime
 import httpx
@@ -26,10 +27,21 @@ except ImportError as e:
 
 # Import Gemini AI
 try:
-    import google.generativeai as genai
+    from llm_backend import create_backend
+    from model_router import ModelRouter
+    from prompt_templates import PromptRegistry
     GOOGLE_AI_KEY = os.getenv('GOOGLE_AI_KEY')
-    if GOOGLE_AI_KEY:
-        genai.configure(api_key=GOOGLE_AI_KEY)
+    # LLM_BACKEND=fake runs without a key against a local stand-in
+    llm_backend = create_backend(GOOGLE_AI_KEY)
+    if llm_backend:
+        model_router = ModelRouter(backend=llm_backend)
+        prompts = PromptRegistry()
+        SUPPORT_PROMPT = prompts.register(
+            "customer_service",
+            prefix="You are a helpful customer service agent for an online boutique. "
+                   "Be helpful and mention you can help with products and cart management.",
+            body="Respond to: '{query}'."
+        )
         GEMINI_AVAILABLE = True
     else:
         GEMINI_AVAILABLE = False
@@ -347,9 +359,9 @@ class CustomerServiceAgent:
         """Handle general queries"""
         if GEMINI_AVAILABLE:
             try:
-                model = genai.GenerativeModel('gemini-pro')
-                ai_prompt = f"You are a helpful customer service agent for an online boutique. Respond to: '{query}'. Be helpful and mention you can help with products and cart management."
-                ai_response = model.generate_content(ai_prompt)
+                ai_prompt = SUPPORT_PROMPT.render(query=query)
+                with model_router.route("customer_service", SUPPORT_PROMPT) as call:
+                    ai_response = await asyncio.to_thread(call.generate_content, ai_prompt)
                 return ai_response.text
             except Exception as e:
                 logger.error(f"Gemini AI error: {e}")
@@ -360,7 +372,7 @@ class CustomerServiceAgent:
 agent = CustomerServiceAgent()
 
 # FastAPI app
-app = FastAPI(title="Customer Service Agent")
+app = FastAPI(title="Customer Service Agent", default_response_class=ORJSONResponse)
 
 @app.on_event("startup")
 async def startup_event():
@@ -374,6 +386,13 @@ async def health_check():
         "gemini_available": GEMINI_AVAILABLE
     }
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "model_routing": model_router.stats() if GEMINI_AVAILABLE else None,
+        "prompt_templates": prompts.stats() if GEMINI_AVAILABLE else None
+    }
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(chat_request: ChatRequest):
     try:
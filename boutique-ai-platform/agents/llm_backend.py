@@ -0,0 +1,280 @@
+"""Pluggable LLM backends: live Gemini, recording, and an offline stand-in.
+
+Every backend exposes `model(model_name, system_instruction=None)`, which
+returns an object with a Gemini-compatible `generate_content(prompt,
+generation_config=None, stream=False)`. Responses carry `.text`,
+`usage_metadata`, and can be iterated as chunks when streamed.
+
+- `gemini`: the real API (needs an API key).
+- `record`: the real API, with every prompt/response appended to a JSONL
+  recording.
+- `fake`: no network. Replays recorded responses by prompt hash and
+  synthesizes the rest; JSON is generated from the request's response
+  schema when one is given. Time to first token follows a lognormal
+  distribution fitted to the configured p50/p99, then tokens stream at a
+  fixed rate. Seeded, so latency distributions repeat run to run.
+
+Select with `LLM_BACKEND`; see `create_backend` for the other variables.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import google.generativeai as genai
+
+CHUNK_TOKENS = 8
+SYNTHETIC_WORDS = (
+    "bundle", "savings", "shipping", "deal", "cart", "discount", "loyalty",
+    "recommend", "price", "order", "today", "great", "choice", "offer"
+)
+
+
+def prompt_key(prompt, system_instruction: Optional[str] = None) -> str:
+    """Stable key for a prompt, used to match recordings on replay"""
+    text = prompt if isinstance(prompt, str) else json.dumps(prompt, sort_keys=True, default=str)
+    return hashlib.sha256(f"{system_instruction or ''}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1) if text else 0
+
+
+class _Usage:
+    __slots__ = ("prompt_token_count", "cached_content_token_count", "candidates_token_count", "total_token_count")
+
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.cached_content_token_count = 0
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _Chunk:
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LocalResponse:
+    """Gemini-shaped response; iterating yields chunks with pacing delays"""
+
+    def __init__(self, text: str, prompt_tokens: int, chunks: List[str], delays: List[float]):
+        self.text = text
+        self.usage_metadata = _Usage(prompt_tokens, estimate_tokens(text))
+        self._chunks = chunks
+        self._delays = delays
+
+    def __iter__(self) -> Iterator[_Chunk]:
+        for chunk, delay in zip(self._chunks, self._delays):
+            if delay > 0:
+                time.sleep(delay)
+            yield _Chunk(chunk)
+
+
+def _split_chunks(text: str, chunk_chars: int = CHUNK_TOKENS * 4) -> List[str]:
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+
+
+class GeminiBackend:
+    """The real Gemini API"""
+
+    name = "gemini"
+    supports_caching = True
+
+    def model(self, model_name: str, system_instruction: Optional[str] = None):
+        if system_instruction:
+            return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        return genai.GenerativeModel(model_name)
+
+
+class RecordingModel:
+    def __init__(self, backend: "RecordingBackend", model_name: str, inner, system_instruction: Optional[str]):
+        self.backend = backend
+        self.model_name = model_name
+        self.inner = inner
+        self.system_instruction = system_instruction
+
+    def generate_content(self, prompt, generation_config=None, stream: bool = False, **kwargs):
+        # Always resolve fully so the recording is complete even if the caller stops reading early
+        start = time.perf_counter()
+        if generation_config is not None:
+            response = self.inner.generate_content(prompt, generation_config=generation_config, **kwargs)
+        else:
+            response = self.inner.generate_content(prompt, **kwargs)
+        latency_ms = (time.perf_counter() - start) * 1000
+        text = response.text
+        usage = getattr(response, "usage_metadata", None)
+        self.backend.append({
+            "key": prompt_key(prompt, self.system_instruction),
+            "model": self.model_name,
+            "system_instruction": self.system_instruction,
+            "prompt": prompt if isinstance(prompt, str) else str(prompt),
+            "text": text,
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) if usage else 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) if usage else 0,
+            "latency_ms": round(latency_ms, 1)
+        })
+        if not stream:
+            return response
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) if usage else estimate_tokens(str(prompt))
+        chunks = _split_chunks(text)
+        return LocalResponse(text, prompt_tokens, chunks, [0.0] * len(chunks))
+
+
+class RecordingBackend:
+    """Wraps a live backend and appends every exchange to a JSONL recording"""
+
+    name = "record"
+    supports_caching = False
+
+    def __init__(self, inner: GeminiBackend, path: str):
+        self.inner = inner
+        self.path = path
+        self.lock = threading.Lock()
+        self.recorded = 0
+
+    def model(self, model_name: str, system_instruction: Optional[str] = None):
+        return RecordingModel(self, model_name, self.inner.model(model_name, system_instruction), system_instruction)
+
+    def append(self, entry: Dict):
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.recorded += 1
+
+
+class FakeModel:
+    def __init__(self, backend: "FakeBackend", model_name: str, system_instruction: Optional[str]):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def generate_content(self, prompt, generation_config=None, stream: bool = False, **kwargs):
+        backend = self.backend
+        key = prompt_key(prompt, self.system_instruction)
+        recorded = backend.recordings.get(key)
+        if recorded is not None:
+            text = recorded["text"]
+            backend.replayed += 1
+        else:
+            schema = getattr(generation_config, "response_schema", None)
+            text = json.dumps(backend.synthesize_json(schema)) if schema else backend.synthesize_text()
+            backend.synthesized += 1
+
+        prompt_tokens = estimate_tokens((self.system_instruction or "") + str(prompt))
+        first_token, per_chunk = backend.sample_timing()
+        chunks = _split_chunks(text)
+        if stream:
+            return LocalResponse(text, prompt_tokens, chunks, [first_token] + [per_chunk] * (len(chunks) - 1))
+        time.sleep(first_token + per_chunk * (len(chunks) - 1))
+        return LocalResponse(text, prompt_tokens, [text], [0.0])
+
+
+class FakeBackend:
+    """Offline stand-in: replays recordings, synthesizes everything else"""
+
+    name = "fake"
+    supports_caching = False
+
+    def __init__(self, recording_path: Optional[str] = None, latency_p50_ms: float = 400,
+                 latency_p99_ms: float = 1500, tokens_per_second: float = 200,
+                 output_tokens: int = 40, seed: int = 42):
+        self.recordings: Dict[str, Dict] = {}
+        if recording_path and os.path.exists(recording_path):
+            with open(recording_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recordings[entry["key"]] = entry
+        # Lognormal time-to-first-token through the configured p50 and p99
+        self.mu = math.log(latency_p50_ms / 1000)
+        self.sigma = max(math.log(latency_p99_ms / latency_p50_ms) / 2.326, 0.0)
+        self.latency_p50_ms = latency_p50_ms
+        self.latency_p99_ms = latency_p99_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.replayed = 0
+        self.synthesized = 0
+
+    def model(self, model_name: str, system_instruction: Optional[str] = None):
+        return FakeModel(self, model_name, system_instruction)
+
+    def sample_timing(self) -> tuple:
+        """(seconds to first token, seconds per subsequent chunk)"""
+        with self.lock:
+            first_token = self.rng.lognormvariate(self.mu, self.sigma)
+        return first_token, CHUNK_TOKENS / self.tokens_per_second
+
+    def synthesize_text(self) -> str:
+        with self.lock:
+            words = [self.rng.choice(SYNTHETIC_WORDS) for _ in range(self.output_tokens)]
+        return " ".join(words).capitalize() + "."
+
+    def synthesize_json(self, schema: Dict):
+        kind = schema.get("type")
+        if kind == "object":
+            return {name: self.synthesize_json(sub) for name, sub in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self.synthesize_json(schema.get("items", {"type": "string"})) for _ in range(3)]
+        if kind == "integer":
+            with self.lock:
+                return self.rng.randint(0, 50)
+        if kind == "number":
+            with self.lock:
+                return round(self.rng.uniform(0, 50), 2)
+        if kind == "boolean":
+            return True
+        with self.lock:
+            return " ".join(self.rng.choice(SYNTHETIC_WORDS) for _ in range(6)).capitalize()
+
+    def stats(self) -> Dict:
+        return {
+            "recordings": len(self.recordings),
+            "replayed": self.replayed,
+            "synthesized": self.synthesized,
+            "latency_p50_ms": self.latency_p50_ms,
+            "latency_p99_ms": self.latency_p99_ms,
+            "tokens_per_second": self.tokens_per_second
+        }
+
+
+def create_backend(api_key: Optional[str] = None):
+    """Backend selected by `LLM_BACKEND` (gemini | record | fake), or None if unavailable
+
+    `record` appends to `LLM_RECORDING_PATH`; `fake` replays from it and takes
+    `LLM_FAKE_P50_MS`, `LLM_FAKE_P99_MS`, `LLM_FAKE_TOKENS_PER_SECOND` and
+    `LLM_FAKE_SEED`.
+    """
+    kind = os.environ.get("LLM_BACKEND", "gemini").lower()
+    recording_path = os.environ.get("LLM_RECORDING_PATH", "llm_recording.jsonl")
+    if kind == "fake":
+        return FakeBackend(
+            recording_path=recording_path,
+            latency_p50_ms=float(os.environ.get("LLM_FAKE_P50_MS", 400)),
+            latency_p99_ms=float(os.environ.get("LLM_FAKE_P99_MS", 1500)),
+            tokens_per_second=float(os.environ.get("LLM_FAKE_TOKENS_PER_SECOND", 200)),
+            seed=int(os.environ.get("LLM_FAKE_SEED", 42))
+        )
+    if not api_key:
+        return None
+    genai.configure(api_key=api_key)
+    if kind == "record":
+        return RecordingBackend(GeminiBackend(), recording_path)
+    return GeminiBackend()
+
+
+if __name__ == "__main__":
+    # Calibration check: sampled latency percentiles against the configured ones
+    backend = FakeBackend(latency_p50_ms=400, latency_p99_ms=1500)
+    samples = sorted(backend.sample_timing()[0] * 1000 for _ in range(20000))
+    print(f"p50={samples[len(samples) // 2]:.0f}ms p99={samples[int(len(samples) * 0.99)]:.0f}ms "
+          f"(configured 400ms / 1500ms)")
@@ -0,0 +1,219 @@
+"""Latency- and cost-aware routing of LLM calls across Gemini tiers.
+
+Each request class (short chat, insight JSON, workflow summaries, ...)
+names a preferred model tier and a latency SLO. The router keeps a rolling
+window of observed latencies and errors per model and sends a request to
+its preferred tier while that tier's p95 stays within the SLO and its
+error rate stays acceptable. Otherwise it degrades to the next faster (and
+cheaper) tier. While a tier is degraded, one request in `probe_every`
+still goes to it, so it can recover once it is healthy again.
+
+Routing decisions, per-model latency percentiles, error rates, token
+counts and estimated spend are exported through `stats()`.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from llm_backend import GeminiBackend
+
+# Fastest/cheapest first. Costs are USD per million tokens.
+MODEL_TIERS = [
+    {"name": "gemini-1.5-flash-8b", "input_cost": 0.0375, "output_cost": 0.15},
+    {"name": "gemini-1.5-flash", "input_cost": 0.075, "output_cost": 0.30},
+    {"name": "gemini-1.5-pro", "input_cost": 1.25, "output_cost": 5.00}
+]
+
+DEFAULT_ROUTES = {
+    "chat": {"model": "gemini-1.5-flash", "latency_slo_ms": 1500},
+    "insights": {"model": "gemini-1.5-flash", "latency_slo_ms": 3000},
+    "summary": {"model": "gemini-1.5-flash-8b", "latency_slo_ms": 2000},
+    "customer_service": {"model": "gemini-1.5-pro", "latency_slo_ms": 4000}
+}
+
+
+def load_routes(path: Optional[str] = None) -> Dict:
+    """Default routes overlaid with a JSON file (`MODEL_ROUTES_FILE`)"""
+    routes = {name: dict(route) for name, route in DEFAULT_ROUTES.items()}
+    path = path or os.environ.get("MODEL_ROUTES_FILE")
+    if path:
+        with open(path) as f:
+            for name, route in json.load(f).items():
+                routes.setdefault(name, {}).update(route)
+    return routes
+
+
+class ModelHealth:
+    """Rolling latency/error window for one model"""
+
+    def __init__(self, window_seconds: float, max_samples: int = 500):
+        self.window_seconds = window_seconds
+        self.samples = deque(maxlen=max_samples)   # (timestamp, latency_ms, ok)
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, latency_ms: float, ok: bool, prompt_tokens: int = 0, output_tokens: int = 0,
+               now: Optional[float] = None):
+        self.samples.append((time.time() if now is None else now, latency_ms, ok))
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+
+    def _recent(self, now: Optional[float] = None) -> List[tuple]:
+        cutoff = (time.time() if now is None else now) - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def snapshot(self, now: Optional[float] = None) -> Dict:
+        recent = self._recent(now)
+        latencies = sorted(latency for _, latency, _ in recent)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)], 1)
+
+        return {
+            "samples": len(recent),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "error_rate": round(sum(1 for _, _, ok in recent if not ok) / len(recent), 4) if recent else 0.0
+        }
+
+
+class RoutedCall:
+    """Context manager that times one routed call and records the outcome"""
+
+    def __init__(self, router: "ModelRouter", request_class: str, model_name: str, template=None):
+        self.router = router
+        self.request_class = request_class
+        self.model_name = model_name
+        self.template = template
+        # Templated calls use a client that already carries the static prefix
+        self.model = (template.client(model_name, router.backend) if template is not None
+                      else router.client(model_name))
+        self.response = None
+        self.start = 0.0
+
+    def generate_content(self, *args, **kwargs):
+        """Call the routed model, keeping the response for token accounting"""
+        self.response = self.model.generate_content(*args, **kwargs)
+        return self.response
+
+    def __enter__(self) -> "RoutedCall":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        latency_ms = (time.perf_counter() - self.start) * 1000
+        usage = getattr(self.response, "usage_metadata", None)
+        self.router.record(
+            self.model_name, latency_ms, ok=exc_type is None,
+            prompt_tokens=getattr(usage, "prompt_token_count", 0) if usage else 0,
+            output_tokens=getattr(usage, "candidates_token_count", 0) if usage else 0
+        )
+        if self.template is not None:
+            self.template.record(self.response, latency_ms, ok=exc_type is None)
+        return False
+
+
+class ModelRouter:
+    """Chooses a Gemini tier per request class from SLOs and observed health"""
+
+    def __init__(self, routes: Optional[Dict] = None, tiers: Optional[List[Dict]] = None,
+                 window_seconds: float = 300, min_samples: int = 20, max_error_rate: float = 0.2,
+                 probe_every: int = 20, backend=None):
+        self.backend = backend or GeminiBackend()
+        self.routes = routes or load_routes()
+        self.tiers = tiers or MODEL_TIERS
+        self.tier_index = {tier["name"]: i for i, tier in enumerate(self.tiers)}
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.probe_every = probe_every
+        self.health = {tier["name"]: ModelHealth(window_seconds) for tier in self.tiers}
+        self.clients: Dict[str, object] = {}
+        self.decisions: Dict[str, Dict[str, int]] = {}
+        self.degraded: Dict[str, int] = {}
+
+    def client(self, model_name: str):
+        model = self.clients.get(model_name)
+        if model is None:
+            model = self.clients[model_name] = self.backend.model(model_name)
+        return model
+
+    def healthy(self, model_name: str, latency_slo_ms: float) -> bool:
+        snapshot = self.health[model_name].snapshot()
+        if snapshot["samples"] < self.min_samples:
+            return True   # not enough evidence to move traffic away
+        return snapshot["p95_ms"] <= latency_slo_ms and snapshot["error_rate"] <= self.max_error_rate
+
+    def choose(self, request_class: str) -> str:
+        route = self.routes.get(request_class) or self.routes["chat"]
+        preferred = self.tier_index.get(route["model"], 0)
+        slo = route["latency_slo_ms"]
+
+        chosen = None
+        for index in range(preferred, -1, -1):
+            name = self.tiers[index]["name"]
+            if self.healthy(name, slo):
+                chosen = name
+                break
+        if chosen is None:
+            # Every tier is over budget: use whichever is currently fastest
+            chosen = min(
+                (self.tiers[i]["name"] for i in range(preferred + 1)),
+                key=lambda name: self.health[name].snapshot()["p95_ms"] or 0.0
+            )
+
+        preferred_name = self.tiers[preferred]["name"]
+        if chosen != preferred_name:
+            degraded = self.degraded.get(request_class, 0) + 1
+            self.degraded[request_class] = degraded
+            if degraded % self.probe_every == 0:
+                # Probe the preferred tier so its stats can recover
+                chosen = preferred_name
+        counts = self.decisions.setdefault(request_class, {})
+        counts[chosen] = counts.get(chosen, 0) + 1
+        return chosen
+
+    def route(self, request_class: str, template=None) -> RoutedCall:
+        """Routed call for a request class, optionally using a prompt template's client"""
+        return RoutedCall(self, request_class, self.choose(request_class), template)
+
+    def record(self, model_name: str, latency_ms: float, ok: bool,
+               prompt_tokens: int = 0, output_tokens: int = 0):
+        health = self.health.get(model_name)
+        if health is not None:
+            health.record(latency_ms, ok, prompt_tokens, output_tokens)
+
+    def stats(self) -> Dict:
+        models = {}
+        for tier in self.tiers:
+            health = self.health[tier["name"]]
+            models[tier["name"]] = {
+                **health.snapshot(),
+                "calls": health.calls,
+                "errors": health.errors,
+                "prompt_tokens": health.prompt_tokens,
+                "output_tokens": health.output_tokens,
+                "estimated_cost_usd": round(
+                    (health.prompt_tokens * tier["input_cost"] + health.output_tokens * tier["output_cost"]) / 1e6, 6
+                )
+            }
+        backend_stats = getattr(self.backend, "stats", None)
+        return {
+            "backend": self.backend.name,
+            "backend_stats": backend_stats() if backend_stats else None,
+            "routes": self.routes,
+            "decisions": self.decisions,
+            "degraded_decisions": self.degraded,
+            "models": models
+        }
@@ -11,6 +11,7 @@ echo "📋 Using Project: $PROJECT_ID"
 
 # Build Docker images
 echo "🔨 Building Docker images..."
+"$(dirname "$0")/../ai-agents/scripts/check-shared-modules.sh"
 docker build -f docker/Dockerfile.customer-service-agent -t $REGION-docker.pkg.dev/$PROJECT_ID/boutique-ai-repo/customer-service-agent:latest .
 docker build -f docker/Dockerfile.chat-gateway -t $REGION-docker.pkg.dev/$PROJECT_ID/boutique-ai-repo/chat-gateway:latest .
 
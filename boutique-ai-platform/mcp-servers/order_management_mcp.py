@@ -1,9 +1,10 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from typing import Dict, List, Optional
 import grpc
 import asyncio
 
-app = FastAPI(title="Order Management MCP Server")
+app = FastAPI(title="Order Management MCP Server", default_response_class=ORJSONResponse)
 
 class OrderManagementMCP:
     def __init__(self):
@@ -37,7 +38,7 @@ class OrderManagementMCP:
             return comprehensive_status
             
         except Exception as e:
-            raise HTTPException(status_code=500, f"Error fetching order status: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error fetching order status: {str(e)}")
     
     async def get_checkout_details(self, order_id: str) -> Dict:
         """Read from existing CheckoutService"""
@@ -152,9 +152,10 @@ class ProductCatalogService:
 
 # HTTP API Server (similar to reference repo structure)
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
-app = FastAPI(title="Product Catalog MCP Server")
+app = FastAPI(title="Product Catalog MCP Server", default_response_class=ORJSONResponse)
 catalog_service = ProductCatalogService()
 
 class ProductListRequest(BaseModel):